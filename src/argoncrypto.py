@@ -1,5 +1,12 @@
 import argon2
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
 from Cryptodome.Cipher import AES
+from Cryptodome.Random import get_random_bytes
 
 
 MODES = {
@@ -11,6 +18,23 @@ MODES = {
 	"AES-CBC": 2
 }
 
+# Argon2 parameters used when nothing else is configured: time cost, memory cost (x MEMORY_UNIT), parallelism
+ARGON_DEFAULTS = (2, 100, 8)
+# KiB of Argon2 memory per unit of memory cost
+MEMORY_UNIT = 100
+
+# Derived keys are cached per process, keyed by a digest of secret, salt and parameters
+KEY_CACHE_SIZE = 8
+_key_cache: OrderedDict = OrderedDict()
+_key_cache_lock = threading.Lock()
+# one lock per key being derived, so threads asking for the same key at once run Argon2 only once
+_key_locks: dict = {}
+
+# Binary frames are laid out as nonce | tag | ciphertext
+NONCE_SIZE = 16
+TAG_SIZE = 16
+FRAME_OVERHEAD = NONCE_SIZE + TAG_SIZE
+
 
 def encrypt_data(key: bytes, data: any, mode: int = 0) -> dict:
 	"""Encrypts data using AES-GCM
@@ -126,7 +150,218 @@ def decrypt_data(key: bytes, data: dict, mode: int = 0) -> str | bytes:
 		raise ValueError("Invalid mode: 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC")
 
 
-def generate_argon_key(secret: str, salt: str, key_length: int = 32, time_cost: int = 2, memory_cost: int = 100, parallelism: int = 8) -> bytes:
+def frame_size(length: int, mode: int = 0) -> int:
+	"""Returns the size of the binary frame encrypt_into writes for 'length' bytes of data.
+
+	:param length: the length of the plaintext in bytes
+	:param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+	:return int: size of the frame in bytes
+	"""
+	if mode == 2:
+		# PKCS#7 always adds between 1 and 16 bytes of padding
+		return FRAME_OVERHEAD + (length // AES.block_size + 1) * AES.block_size
+	return FRAME_OVERHEAD + length
+
+
+def frame_tag(frame) -> bytes:
+	"""Returns the authentication tag of a binary frame."""
+	return bytes(memoryview(frame)[NONCE_SIZE:FRAME_OVERHEAD])
+
+
+def _subkeys(key: bytes) -> tuple:
+	"""Separate cipher and MAC keys for AES-CTR and AES-CBC frames, derived from the key, so no secret keys both."""
+	cipher_key = blake2b(key = key, digest_size = len(key), person = b'VPK frame cipher').digest()
+	mac_key = blake2b(key = key, digest_size = 32, person = b'VPK frame mac').digest()
+	return cipher_key, mac_key
+
+
+def _frame_mac(mac_key: bytes, nonce, ciphertext) -> bytes:
+	mac = blake2b(key = mac_key, digest_size = TAG_SIZE, person = b'VPK frame')
+	mac.update(nonce)
+	mac.update(ciphertext)
+	return mac.digest()
+
+
+def encrypt_into(key: bytes, data, out, mode: int = 0) -> int:
+	"""Encrypts data into a caller provided buffer
+
+    ---------------
+
+    The encrypt_into function is the binary counterpart of encrypt_data. Instead of a dictionary of hex strings,
+    it writes a compact frame of nonce, authentication tag and ciphertext straight into 'out', which can be a
+    bytearray, a writable memoryview or any other writable buffer of at least frame_size(len(data), mode) bytes.
+
+    The data argument may be bytes, a bytearray or a memoryview, it is read in place and never copied, apart from
+    the final padded block in AES-CBC mode.
+
+    AES-GCM stores its own authentication tag. AES-CTR and AES-CBC do not provide authentication on their own,
+    for those modes the tag is a keyed BLAKE2b over nonce and ciphertext, so every frame can be verified the same way.
+    The cipher and the MAC are then keyed with separate subkeys derived from 'key'.
+
+    :param key: a byte string of length 16, 24, or 32 bytes
+    :param data: a bytes-like object to encrypt
+    :param out: a writable buffer receiving the frame
+    :param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+    :return int: the number of bytes written to 'out'
+    """
+	data = memoryview(data).cast('B')
+	out = memoryview(out).cast('B')
+	size = frame_size(len(data), mode)
+	if len(out) < size:
+		raise ValueError(f"Output buffer too small: {len(out)} < {size} bytes")
+	
+	nonce = get_random_bytes(NONCE_SIZE)
+	out[:NONCE_SIZE] = nonce
+	ciphertext = out[FRAME_OVERHEAD:size]
+	if mode == 0:
+		cipher = AES.new(key, AES.MODE_GCM, nonce = nonce)
+		cipher.encrypt(data, output = ciphertext)
+		out[NONCE_SIZE:FRAME_OVERHEAD] = cipher.digest()
+		return size
+	elif mode not in (1, 2):
+		raise ValueError("Invalid mode: 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC")
+	
+	cipher_key, mac_key = _subkeys(key)
+	if mode == 1:
+		cipher = AES.new(cipher_key, AES.MODE_CTR, nonce = b'', initial_value = nonce)
+		cipher.encrypt(data, output = ciphertext)
+	else:
+		cipher = AES.new(cipher_key, AES.MODE_CBC, iv = nonce)
+		full = len(data) - len(data) % AES.block_size
+		if full:
+			cipher.encrypt(data[:full], output = ciphertext[:full])
+		padding = AES.block_size - len(data) % AES.block_size
+		cipher.encrypt(bytes(data[full:]) + bytes([padding]) * padding, output = ciphertext[full:])
+	
+	out[NONCE_SIZE:FRAME_OVERHEAD] = _frame_mac(mac_key, nonce, ciphertext)
+	return size
+
+
+def encrypt_bytes(key: bytes, data, mode: int = 0) -> bytearray:
+	"""Encrypts data into a new binary frame of nonce, tag and ciphertext, see encrypt_into.
+
+	:param key: a byte string of length 16, 24, or 32 bytes
+	:param data: a bytes-like object to encrypt
+	:param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+	:return bytearray: the encrypted frame
+	"""
+	out = bytearray(frame_size(len(memoryview(data).cast('B')), mode))
+	encrypt_into(key, data, out, mode)
+	return out
+
+
+def decrypt_into(key: bytes, frame, out, mode: int = 0) -> int:
+	"""Decrypts a binary frame into a caller provided buffer
+
+    ---------------
+
+    The decrypt_into function reverses encrypt_into. The frame is read in place, split into nonce, tag and
+    ciphertext, authenticated and decrypted into 'out', which needs room for len(frame) - FRAME_OVERHEAD bytes.
+
+    Unlike decrypt_data, the plaintext is never decoded as text, the caller always gets raw bytes.
+
+    If the authentication tag is invalid, indicating a wrong key or a tampered frame, a ValueError is raised
+    and no plaintext is left behind in 'out'.
+
+    :param key: a byte string of length 16, 24, or 32 bytes used to decrypt the frame
+    :param frame: a bytes-like object holding nonce, tag and ciphertext
+    :param out: a writable buffer receiving the plaintext
+    :param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+    :return int: the length of the plaintext written to 'out'
+    """
+	# the views are released even if the frame is rejected, a traceback holding on to them would keep
+	# the memory map the frame was read from from being closed
+	with memoryview(frame).cast('B') as frame, memoryview(out).cast('B') as out:
+		if len(frame) < FRAME_OVERHEAD:
+			raise ValueError("Frame too short")
+		length = len(frame) - FRAME_OVERHEAD
+		if len(out) < length:
+			raise ValueError(f"Output buffer too small: {len(out)} < {length} bytes")
+		with frame[FRAME_OVERHEAD:] as ciphertext, out[:length] as plaintext:
+			return _decrypt_frame(key, bytes(frame[:NONCE_SIZE]), bytes(frame[NONCE_SIZE:FRAME_OVERHEAD]), ciphertext, plaintext, mode)
+
+
+def _decrypt_frame(key: bytes, nonce: bytes, tag: bytes, ciphertext: memoryview, plaintext: memoryview, mode: int) -> int:
+	length = len(ciphertext)
+	if mode == 0:
+		cipher = AES.new(key, AES.MODE_GCM, nonce = nonce)
+		cipher.decrypt(ciphertext, output = plaintext)
+		try:
+			cipher.verify(tag)
+		except ValueError:
+			plaintext[:] = bytes(length)
+			raise
+		return length
+	elif mode not in (1, 2):
+		raise ValueError("Invalid mode: 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC")
+	
+	cipher_key, mac_key = _subkeys(key)
+	if not hmac.compare_digest(_frame_mac(mac_key, nonce, ciphertext), tag):
+		raise ValueError("MAC check failed")
+	if mode == 1:
+		cipher = AES.new(cipher_key, AES.MODE_CTR, nonce = b'', initial_value = nonce)
+		cipher.decrypt(ciphertext, output = plaintext)
+		return length
+	
+	if not length or length % AES.block_size:
+		raise ValueError("Invalid frame length for AES-CBC")
+	cipher = AES.new(cipher_key, AES.MODE_CBC, iv = nonce)
+	cipher.decrypt(ciphertext, output = plaintext)
+	padding = plaintext[-1]
+	if not 1 <= padding <= AES.block_size or plaintext[-padding:] != bytes([padding]) * padding:
+		plaintext[:] = bytes(length)
+		raise ValueError("Padding is incorrect.")
+	return length - padding
+
+
+def verify_frame(key: bytes, frame, mode: int = 0, scratch = None) -> bool:
+	"""Checks the authentication tag of a binary frame without handing out any plaintext
+
+	AES-CTR and AES-CBC frames are checked against their keyed BLAKE2b tag alone, nothing is decrypted. The
+	AES-GCM tag can only be checked along with the decryption, the plaintext goes to 'scratch', a writable
+	buffer of at least len(frame) - FRAME_OVERHEAD bytes (allocated if not given), and is wiped afterwards.
+
+	:param key: a byte string of length 16, 24, or 32 bytes used to encrypt the frame
+	:param frame: a bytes-like object holding nonce, tag and ciphertext
+	:param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+	:param scratch: an optional writable buffer for AES-GCM
+	:return bool: True if the frame is authentic
+	"""
+	frame = memoryview(frame).cast('B')
+	if len(frame) < FRAME_OVERHEAD:
+		return False
+	if mode in (1, 2):
+		return hmac.compare_digest(_frame_mac(_subkeys(key)[1], frame[:NONCE_SIZE], frame[FRAME_OVERHEAD:]), frame[NONCE_SIZE:FRAME_OVERHEAD])
+	if mode != 0:
+		raise ValueError("Invalid mode: 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC")
+	
+	length = len(frame) - FRAME_OVERHEAD
+	scratch = memoryview(scratch if scratch is not None else bytearray(length)).cast('B')[:length]
+	cipher = AES.new(key, AES.MODE_GCM, nonce = bytes(frame[:NONCE_SIZE]))
+	cipher.decrypt(frame[FRAME_OVERHEAD:], output = scratch)
+	scratch[:] = bytes(length)
+	try:
+		cipher.verify(bytes(frame[NONCE_SIZE:FRAME_OVERHEAD]))
+	except ValueError:
+		return False
+	return True
+
+
+def decrypt_bytes(key: bytes, frame, mode: int = 0) -> bytearray:
+	"""Decrypts a binary frame of nonce, tag and ciphertext into a new buffer, see decrypt_into.
+
+	:param key: a byte string of length 16, 24, or 32 bytes used to decrypt the frame
+	:param frame: a bytes-like object holding nonce, tag and ciphertext
+	:param mode: Default 0 for AES-GCM, 1 for AES-CTR, 2 for AES-CBC
+	:return bytearray: the plaintext
+	"""
+	out = bytearray(max(len(memoryview(frame).cast('B')) - FRAME_OVERHEAD, 0))
+	length = decrypt_into(key, frame, out, mode)
+	del out[length:]
+	return out
+
+
+def generate_argon_key(secret: str, salt: str, key_length: int = 32, time_cost: int = 2, memory_cost: int = 100, parallelism: int = 8, cache: bool = True) -> bytes:
 	"""
 	Generates a key using Argon2
 	
@@ -157,18 +392,97 @@ def generate_argon_key(secret: str, salt: str, key_length: int = 32, time_cost:
 	:param time_cost: The amount of time to spend on each iteration of the key derivation function.
 	:param memory_cost: The amount of memory to use during the key derivation function.
 	:param parallelism: The number of parallel threads to use during the key derivation function.
+	:param cache: Reuse a key derived earlier in this process for the same secret, salt and parameters. Threads
+		asking for a key that is being derived wait for that derivation instead of starting their own.
 	:return bytes:
 	"""
 	
+	if cache:
+		# the cache never sees the secret itself, only a digest of all inputs
+		digest = blake2b(repr((secret, salt, key_length, time_cost, memory_cost, parallelism)).encode('utf-8'), person = b'VPK key cache').digest()
+		with _key_cache_lock:
+			cached = _key_cache.get(digest)
+			if cached is not None:
+				_key_cache.move_to_end(digest)
+				return cached
+			lock = _key_locks.setdefault(digest, threading.Lock())
+		
+		with lock:
+			with _key_cache_lock:
+				cached = _key_cache.get(digest)
+			if cached is not None:
+				return cached
+			try:
+				key = generate_argon_key(secret, salt, key_length, time_cost, memory_cost, parallelism, cache = False)
+				with _key_cache_lock:
+					_key_cache[digest] = key
+					while len(_key_cache) > KEY_CACHE_SIZE:
+						_key_cache.popitem(last = False)
+			finally:
+				with _key_cache_lock:
+					_key_locks.pop(digest, None)
+		return key
+	
 	# Use Argon2 to derive the key
 	key = argon2.low_level.hash_secret_raw(
 		secret=secret.encode('utf-8'),
 		salt=salt.encode('utf-8'),
 		time_cost=time_cost,
-		memory_cost=memory_cost * 100,
+		memory_cost=memory_cost * MEMORY_UNIT,
 		parallelism=parallelism,
 		hash_len=key_length,
 		type=argon2.low_level.Type.ID
 	)
 	
 	return key
+
+
+
+def clear_key_cache():
+	"""Drops every cached key, the next request for a key derives it again."""
+	with _key_cache_lock:
+		_key_cache.clear()
+
+
+def calibrate_argon(target: float = 0.5, key_length: int = 32, parallelism: int = None, max_memory_cost: int = 10240, check = None) -> dict:
+	"""
+	Suggests Argon2 parameters for this host
+	
+	-----------------
+	
+	The calibrate_argon function measures how long a single Argon2 pass takes on this machine and suggests
+	parameters which derive a key in about 'target' seconds.
+	
+	The memory cost is doubled first, as memory-hardness is what makes Argon2 expensive to attack, until a
+	single pass takes at least half the target or 'max_memory_cost' is reached. The time cost is then chosen
+	as the number of passes which fits into the target.
+	
+	:param target: The wanted derivation latency, in seconds.
+	:param key_length: The length of the derived key, in bytes.
+	:param parallelism: The number of parallel threads, defaults to the number of CPUs, at most 8.
+	:param max_memory_cost: The upper bound of the memory cost, in units of 100 KiB like generate_argon_key.
+	:param check: Optional callable run before every measurement, e.g. to stop a cancelled calibration by raising.
+	:return dict: the suggested time_cost, memory_cost and parallelism, and the measured seconds
+	"""
+	parallelism = parallelism or min(os.cpu_count() or 1, 8)
+	memory_cost = ARGON_DEFAULTS[1]
+	
+	def measure(time_cost: int, memory_cost: int) -> float:
+		if check is not None:
+			check()
+		start = time.perf_counter()
+		generate_argon_key("calibration", "calibration-salt", key_length, time_cost, memory_cost, parallelism, cache = False)
+		return time.perf_counter() - start
+	
+	elapsed = measure(1, memory_cost)
+	while elapsed < target / 2 and memory_cost * 2 <= max_memory_cost:
+		memory_cost *= 2
+		elapsed = measure(1, memory_cost)
+	
+	time_cost = max(1, round(target / elapsed))
+	return {
+		"time_cost": time_cost,
+		"memory_cost": memory_cost,
+		"parallelism": parallelism,
+		"seconds": measure(time_cost, memory_cost),
+	}
@@ -0,0 +1,352 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import argoncrypto as ac
+from compressor import Compressor, CODECS
+from container import ContainerWriter, CHUNK_SIZE
+
+WORDS = [bytes(random.Random(i).choices(b'abcdefghijklmnopqrstuvwxyz', k = 3 + i % 9)) for i in range(4096)]
+
+# levels measured per codec, None is the default level of the codec
+LEVELS = {
+    'gzip': [1, 6, 9],
+    'bzip2': [1, 9],
+    'lzma': [0, 6],
+    'lz4': [None],
+    'lz4hc': [None, 9],
+    'zstd': [1, 3, 9, 19],
+    'br': [5, 11],
+    'none': [None],
+}
+CORPORA = ['text', 'compressed', 'random']
+# fields telling which measurement a result is, to match it against earlier runs
+IDENTITY = ("bench", "module", "corpus", "codec", "level", "mode", "layout", "compression", "encryption", "workers", "time_cost", "memory_cost", "parallelism")
+MB = 1024 * 1024
+# modules of the headless paths, timed on a cold interpreter
+IMPORTS = ["compressor", "container", "packager", "catalog", "bulk"]
+# modules the headless paths should only load when they are used
+HEAVY = ["tkinter", "PIL", "magic", "icon", "zstandard", "lz4", "lzma", "bz2", "brotli"]
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def make_corpus(files: int, size: int, seed: int = 0) -> list:
+    """Build a reproducible corpus of text-like, compressible files."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(files):
+        data = bytearray()
+        while len(data) < size:
+            data += b' '.join(rng.choices(WORDS, k = 4096)) + b'\n'
+        corpus.append(bytes(data[:size]))
+    return corpus
+
+
+def make_data(kind: str, files: int, size: int, seed: int = 0) -> list:
+    """Build a reproducible corpus of 'text', already 'compressed' (like media files) or 'random' data."""
+    if kind == 'text':
+        return make_corpus(files, size, seed)
+    if kind == 'compressed':
+        # deflated text has the statistics of compressed media without needing sample files
+        corpus = make_corpus(files, size * 4, seed)
+        return [zlib.compress(data, 9)[:size] for data in corpus]
+    if kind == 'random':
+        rng = random.Random(seed)
+        return [rng.randbytes(size) for _ in range(files)]
+    raise ValueError(f"Unknown corpus '{kind}'")
+
+
+def measure(func, repeat: int) -> tuple:
+    """Best wall time of 'repeat' runs and the peak of traced Python allocations of one more run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    # traced separately, tracing slows down every allocation
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def latency(func, items: list) -> dict:
+    """Median and 99th percentile of the latency of 'func' per item, in milliseconds."""
+    times = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {"latency_p50_ms": statistics.median(times), "latency_p99_ms": times[min(len(times) - 1, int(len(times) * 0.99))]}
+
+
+def bench_codecs(args) -> list:
+    results = []
+    for kind in CORPORA:
+        data = b''.join(make_data(kind, 4, args.size // 4, args.seed))
+        tiny = make_data(kind, 200, 512, args.seed)
+        for codec in CODECS:
+            for level in LEVELS.get(codec, [None]):
+                compressed = Compressor.deflate(data, codec, level = level)
+                compress, compress_peak = measure(lambda: Compressor.deflate(data, codec, level = level), args.repeat)
+                inflate, inflate_peak = measure(lambda: Compressor.inflate(compressed, codec), args.repeat)
+                result = {
+                    "bench": "codec", "corpus": kind, "codec": codec, "level": level,
+                    "bytes": len(data), "ratio": len(data) / max(len(compressed), 1),
+                    "compress_mbps": len(data) / compress / MB, "decompress_mbps": len(data) / inflate / MB,
+                    "compress_peak_bytes": compress_peak, "decompress_peak_bytes": inflate_peak,
+                }
+                result.update(latency(lambda item: Compressor.inflate(Compressor.deflate(item, codec, level = level), codec), tiny))
+                results.append(result)
+                report(result, f"{kind:>10} {codec:>6} {str(level):>5} {result['ratio']:>7.2f}x {result['compress_mbps']:>9.1f} MB/s {result['decompress_mbps']:>9.1f} MB/s")
+    return results
+
+
+def bench_crypto(args) -> list:
+    results = []
+    key = bytes(range(32))
+    data = make_data('random', 1, args.size, args.seed)[0]
+    chunks = [data[start:start + args.chunk_size] for start in range(0, len(data), args.chunk_size)]
+    tiny = make_data('random', 200, 512, args.seed)
+    for name, mode in ac.MODES.items():
+        if not isinstance(name, str):
+            continue
+        frames = [ac.encrypt_bytes(key, chunk, mode) for chunk in chunks]
+        encrypt, encrypt_peak = measure(lambda: [ac.encrypt_bytes(key, chunk, mode) for chunk in chunks], args.repeat)
+        decrypt, decrypt_peak = measure(lambda: [ac.decrypt_bytes(key, frame, mode) for frame in frames], args.repeat)
+        result = {
+            "bench": "crypto", "mode": name, "bytes": len(data), "chunk_size": args.chunk_size,
+            "encrypt_mbps": len(data) / encrypt / MB, "decrypt_mbps": len(data) / decrypt / MB,
+            "encrypt_peak_bytes": encrypt_peak, "decrypt_peak_bytes": decrypt_peak,
+        }
+        result.update(latency(lambda item: ac.decrypt_bytes(key, ac.encrypt_bytes(key, item, mode), mode), tiny))
+        results.append(result)
+        report(result, f"{name:>10} {result['encrypt_mbps']:>9.1f} MB/s {result['decrypt_mbps']:>9.1f} MB/s")
+    return results
+
+
+def bench_kdf(args) -> list:
+    results = []
+    for time_cost, memory_cost, parallelism in [ac.ARGON_DEFAULTS, (args.time_cost, args.memory_cost, args.parallelism)]:
+        seconds, peak = measure(lambda: ac.generate_argon_key("benchmark", "benchmark-salt", 32, time_cost, memory_cost, parallelism, cache = False), args.repeat)
+        result = {
+            "bench": "kdf", "time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism,
+            "seconds": seconds, "memory_bytes": memory_cost * ac.MEMORY_UNIT * 1024, "peak_bytes": peak,
+        }
+        results.append(result)
+        report(result, f"{time_cost:>4} {memory_cost * ac.MEMORY_UNIT:>8} KiB {parallelism:>3} {seconds:>10.4f} sec")
+    return results
+
+
+def write_tree(directory: str, corpus: list):
+    os.makedirs(os.path.join(directory, "data"), exist_ok = True)
+    for i, data in enumerate(corpus):
+        with open(os.path.join(directory, "data", f"{i:05}.bin"), 'wb') as file:
+            file.write(data)
+
+
+def bench_roundtrip(args) -> list:
+    try:
+        from packager import Packager
+    except ImportError as exc:
+        # the packager needs the Windows and GUI modules of the application
+        print(f"roundtrip skipped: {exc}", file = sys.stderr)
+        return [{"bench": "roundtrip", "skipped": str(exc)}]
+
+    results = []
+    layouts = {"tiny": (max(args.size // 1024, 1), 1024), "huge": (2, args.size // 2)}
+    root = tempfile.mkdtemp()
+    try:
+        for layout, (files, size) in layouts.items():
+            for kind in CORPORA:
+                directory = os.path.join(root, f"{layout}-{kind}")
+                corpus = make_data(kind, files, size, args.seed)
+                write_tree(directory, corpus)
+                config = {
+                    "Settings": {"author": "benchmark"},
+                    "ArgonCrypto": {"key": "benchmark", "iv": "benchmark", "mode": args.encryption},
+                    "Compressor": {"mode": args.compression},
+                    "Packager": {"chunk_size": args.chunk_size, "workers": args.workers},
+                }
+                packager = Packager(("benchmark", "benchmark"), config, key = bytes(32))
+                packager.directory = directory
+                create, create_peak = measure(packager.create_vpk, args.repeat)
+                load, load_peak = measure(packager.load, args.repeat)
+                total = sum(len(data) for data in corpus)
+                result = {
+                    "bench": "roundtrip", "layout": layout, "corpus": kind, "files": files, "bytes": total,
+                    "compression": args.compression, "encryption": args.encryption, "workers": args.workers,
+                    "ratio": total / os.path.getsize(packager.package),
+                    "create_mbps": total / create / MB, "load_mbps": total / load / MB,
+                    "create_files_per_sec": files / create, "load_files_per_sec": files / load,
+                    "create_peak_bytes": create_peak, "load_peak_bytes": load_peak,
+                }
+                results.append(result)
+                report(result, f"{layout:>6} {kind:>10} {files:>6} {result['ratio']:>7.2f}x {result['create_mbps']:>9.1f} MB/s {result['load_mbps']:>9.1f} MB/s")
+    finally:
+        shutil.rmtree(root, ignore_errors = True)
+    return results
+
+
+def bench_imports(args) -> list:
+    """Cold import time of the headless modules, each in a fresh interpreter, and the heavy modules they pull in."""
+    results = []
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in IMPORTS:
+        runs = []
+        for _ in range(args.repeat):
+            probe = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module = module, heavy = HEAVY)], cwd = directory, capture_output = True, text = True)
+            if probe.returncode != 0:
+                break
+            runs.append(json.loads(probe.stdout))
+        if not runs:
+            # e.g. the packager needs the Windows modules of the application
+            print(f"   import | skipped {module}: {probe.stderr.strip().splitlines()[-1]}", file = sys.stderr)
+            continue
+        result = {"bench": "import", "module": module, "seconds": min(run["seconds"] for run in runs), "loaded": runs[0]["loaded"]}
+        results.append(result)
+        report(result, f"{module:>10} {result['seconds'] * 1000:>8.1f} ms  {', '.join(result['loaded']) or '-'}")
+    return results
+
+
+def report(result: dict, line: str):
+    print(f"{result['bench']:>9} | {line}", file = sys.stderr)
+
+
+def identity(result: dict) -> tuple:
+    return tuple((name, result[name]) for name in IDENTITY if name in result)
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Measurements more than 'tolerance' worse than the matching measurement of the baseline."""
+    previous = {identity(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(identity(result), {})
+        for name, value in result.items():
+            if name not in old or not isinstance(value, float):
+                continue
+            # throughput should not drop, times should not grow
+            higher_is_better = name.endswith("_mbps") or name.endswith("_per_sec")
+            lower_is_better = name == "seconds" or name.endswith("_ms")
+            if (higher_is_better and value < old[name] * (1 - tolerance)) or (lower_is_better and value > old[name] * (1 + tolerance)):
+                regressions.append({**dict(identity(result)), "metric": name, "baseline": old[name], "value": value})
+    return regressions
+
+
+def bench_pack(corpus: list, compression: str, mode: int, workers: int, pool: str, chunk_size: int) -> float:
+    """Pack the corpus into a temporary package and return the elapsed seconds."""
+    key = bytes(32)
+    with tempfile.TemporaryFile() as file:
+        start = time.perf_counter()
+        with ContainerWriter(file, key, mode, compression, chunk_size, workers, pool) as writer:
+            for i, data in enumerate(corpus):
+                writer.add_bytes("bench", f"{i:05}.txt", data)
+            writer.close()
+        return time.perf_counter() - start
+
+
+def scaling(args):
+    corpus = make_corpus(args.files, args.size)
+    total = args.files * args.size / 1024 / 1024
+    mode = ac.MODES[args.encryption.upper()]
+
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>10} {'MB/s':>10} {'speedup':>8}")
+    for workers in range(1, args.max_workers + 1):
+        elapsed = bench_pack(corpus, args.compression, mode, workers, args.pool, args.chunk_size)
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {total / elapsed:>10.1f} {baseline / elapsed:>8.2f}")
+
+
+SUITES = {"imports": bench_imports, "codecs": bench_codecs, "crypto": bench_crypto, "kdf": bench_kdf, "roundtrip": bench_roundtrip}
+
+
+def suite(args) -> int:
+    results = []
+    for name in args.only or SUITES:
+        results += SUITES[name](args)
+
+    output = {
+        "meta": {
+            "timestamp": int(time.time()), "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "seed": args.seed, "size": args.size, "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+        output["regressions"] = regressions
+        status = 1 if regressions else 0
+
+    text = json.dumps(output, indent = 2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmarks of the codecs, ciphers, key derivation and packer.")
+    commands = parser.add_subparsers(dest = "command")
+
+    run = commands.add_parser("suite", help = "run the benchmark suite and write the results as JSON")
+    run.add_argument("--only", nargs = "+", choices = list(SUITES))
+    run.add_argument("--size", type = int, default = 8 * MB, help = "bytes per corpus")
+    run.add_argument("--chunk-size", type = int, default = CHUNK_SIZE)
+    run.add_argument("--repeat", type = int, default = 3, help = "runs per measurement, the fastest counts")
+    run.add_argument("--seed", type = int, default = 0)
+    run.add_argument("--compression", default = "zstd", help = "codec of the round trips")
+    run.add_argument("--encryption", default = "aes-gcm", help = "cipher of the round trips")
+    run.add_argument("--workers", type = int, default = 1, help = "pack workers of the round trips")
+    run.add_argument("--time-cost", type = int, default = ac.ARGON_DEFAULTS[0])
+    run.add_argument("--memory-cost", type = int, default = 1000, help = f"Argon2 memory cost of the second KDF run, in units of {ac.MEMORY_UNIT} KiB")
+    run.add_argument("--parallelism", type = int, default = ac.ARGON_DEFAULTS[2])
+    run.add_argument("--output", help = "write the JSON results to a file instead of stdout")
+    run.add_argument("--compare", help = "JSON results of an earlier run, exit with 1 on regressions")
+    run.add_argument("--tolerance", type = float, default = 0.1, help = "allowed slowdown against --compare")
+
+    scale = commands.add_parser("scaling", help = "measure how packing scales with the worker count")
+    scale.add_argument("--files", type = int, default = 32)
+    scale.add_argument("--size", type = int, default = 2 * 1024 * 1024, help = "bytes per file")
+    scale.add_argument("--chunk-size", type = int, default = 1024 * 1024)
+    scale.add_argument("--compression", default = "lzma")
+    scale.add_argument("--encryption", default = "AES-GCM")
+    scale.add_argument("--pool", default = "thread", choices = ["thread", "process"])
+    scale.add_argument("--max-workers", type = int, default = os.cpu_count())
+
+    args = parser.parse_args()
+    if args.command == "scaling":
+        scaling(args)
+    elif args.command == "suite":
+        sys.exit(suite(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
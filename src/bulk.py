@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import argoncrypto as ac
+from compressor import Compressor, DICTIONARY_SIZE
+from container import BlobStore, CHUNK_SIZE
+from jobs import Cancelled, Progress
+from packager import Packager, get_kdf
+
+MEMORY_BUDGET = 1024 * 1024 * 1024
+STORE_BUDGET = 256 * 1024 * 1024
+
+
+class BulkBuilder:
+    """Builds many packages concurrently with a single key derivation.
+
+    The number of packages built at the same time is bounded by the worker budget and by the
+    memory budget, where every build is accounted with the chunks its writer keeps in memory.
+    With 'shared_store' enabled, content already encoded for one package of the batch is copied
+    into the others instead of being compressed and encrypted again; the store is part of the
+    memory budget. With zstd dictionaries enabled, a single dictionary is trained on samples of
+    all directories and shared by the whole batch.
+    """
+
+    def __init__(self, argonize: tuple, config: dict, workers: int = None, memory_budget: int = None):
+        self.config: dict = config
+        self.argonize = argonize
+        self.key = ac.generate_argon_key(argonize[0], argonize[1], 32, *get_kdf(config))
+        self.results: list = []
+        self.dictionary: bytes = None
+        
+        settings = self.config.get('Packager', {})
+        self.workers: int = workers or settings.get('bulk_workers', os.cpu_count() or 1)
+        self.memory_budget: int = memory_budget or settings.get('memory_budget', MEMORY_BUDGET)
+        self.chunk_size: int = settings.get('chunk_size', CHUNK_SIZE)
+        self.pack_workers: int = settings.get('workers', 1)
+        self.store: BlobStore = None
+        if settings.get('shared_store', False):
+            store_budget = min(settings.get('store_budget', STORE_BUDGET), self.memory_budget // 2)
+            self.store = BlobStore(store_budget, self.chunk_size)
+            self.memory_budget -= store_budget
+    
+    def get_concurrency(self, packages: int) -> int:
+        # read buffer, scratch frame and inflight chunks of a single writer
+        build_memory = self.chunk_size * (2 + 2 * self.pack_workers) * 2
+        by_workers = self.workers // self.pack_workers
+        by_memory = self.memory_budget // build_memory
+        return max(1, min(by_workers, by_memory, packages))
+    
+    def train_dictionary(self, directories: list) -> bytes:
+        """Train one zstd dictionary for the whole batch, from an equal share of samples per directory."""
+        setting = self.config['Compressor'].get('dictionary', False)
+        if not setting or (isinstance(setting, str) and os.path.isfile(setting)):
+            return None
+        limit = 100 * DICTIONARY_SIZE // max(len(directories), 1)
+        samples = []
+        for directory in directories:
+            packager = Packager(self.argonize, self.config, key = self.key)
+            packager.directory = directory
+            samples.extend(packager.sample_files(limit))
+        dictionary = Compressor.train(samples)
+        if isinstance(setting, str) and dictionary is not None:
+            with open(setting, 'wb') as file:
+                file.write(dictionary)
+        return dictionary
+    
+    def build_one(self, directory: str, progress: Progress = None) -> dict:
+        if progress is not None:
+            progress.check()
+        packager = Packager(self.argonize, self.config, key = self.key)
+        packager.directory = directory
+        packager.store = self.store
+        packager.dictionary = self.dictionary
+        try:
+            result = packager.create_vpk()
+        except Exception as exc:
+            logging.error(f"Failed   | {directory} | {exc}")
+            result = {"package": f"{directory}.vpk", "files": 0, "bytes": 0, "elapsed": 0.0, "error": str(exc)}
+        if progress is not None:
+            progress.advance(size = result["bytes"], check = False)
+        return result
+    
+    def build(self, directories: list, progress: Progress = None) -> list:
+        """Build a package for every directory and log the throughput once all are done.
+        
+        With a progress, every built package is reported and a cancellation stops the packages not
+        started yet, the packages already built are kept.
+        """
+        timestamp = time.time()
+        if progress is not None:
+            progress.start("Building", len(directories))
+        concurrency = self.get_concurrency(len(directories))
+        self.dictionary = self.train_dictionary(directories)
+        logging.info(f"Bulk     | {len(directories)} Packages | {concurrency} concurrent builds")
+        
+        with ThreadPoolExecutor(max_workers = concurrency) as executor:
+            futures = [executor.submit(self.build_one, directory, progress) for directory in directories]
+            self.results = []
+            for future in futures:
+                try:
+                    self.results.append(future.result())
+                except Cancelled:
+                    pass
+        
+        self.report(time.time() - timestamp)
+        if progress is not None:
+            progress.check()
+        return self.results
+    
+    def report(self, elapsed: float):
+        for result in self.results:
+            if "error" in result:
+                continue
+            seconds = max(result["elapsed"], 1e-9)
+            logging.info(f"Built    | {os.path.basename(result['package']): >24} | {result['files'] / seconds: >10.1f} Files/s | {result['bytes'] / seconds / 1024 / 1024: >8.2f} MB/s")
+        
+        files = sum(result["files"] for result in self.results)
+        size = sum(result["bytes"] for result in self.results)
+        failed = sum(1 for result in self.results if "error" in result)
+        elapsed = max(elapsed, 1e-9)
+        if self.store is not None:
+            logging.info(f"Bulk     | {self.store.hits} Shared | {len(self.store.blobs)} Stored | {self.store.size / 1024 / 1024:.2f} MB")
+        logging.info(f"Bulk     | {len(self.results) - failed} Built | {failed} Failed | {files / elapsed:.1f} Files/s | {size / elapsed / 1024 / 1024:.2f} MB/s | {elapsed:.2f} sec")
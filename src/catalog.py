@@ -0,0 +1,186 @@
+import argparse
+import logging
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import argoncrypto as ac
+from container import ContainerReader
+from packager import HEADER_FORMAT, HEADER_SIZE
+
+CATALOG_PATH = r".\catalog.db"
+HEADER_FIELDS = ("name", "info", "filesize", "author", "copyright", "timestamp", "encryption", "key_length", "version", "compression")
+QUERY_FIELDS = HEADER_FIELDS + ("path", "files", "content_size", "error")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    name TEXT, info TEXT, filesize INTEGER, author TEXT, copyright TEXT, timestamp INTEGER,
+    encryption TEXT, key_length INTEGER, version INTEGER, compression TEXT,
+    files INTEGER, content_size INTEGER, error TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL REFERENCES packages(path) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER,
+    codec TEXT
+);
+CREATE INDEX IF NOT EXISTS packages_author ON packages(author);
+CREATE INDEX IF NOT EXISTS packages_compression ON packages(compression);
+CREATE INDEX IF NOT EXISTS entries_path ON entries(path);
+CREATE INDEX IF NOT EXISTS entries_filename ON entries(filename);
+"""
+
+
+def read_package(path: str, key = None) -> tuple:
+    """Read the header of a package, and with a key the index of a version 2 package or of a volume of a set.
+
+    Returns the header fields and the entries as (folder, filename, size, codec). Nothing but the
+    header and the index is read, the files themselves are never decoded.
+    """
+    with open(path, 'rb') as file:
+        values = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+        header = [value.decode('utf-8', 'replace').rstrip('\0') if isinstance(value, bytes) else value for value in values]
+        entries = None
+        if key is not None and header[8] == 2:
+            reader = ContainerReader(file, key, ac.MODES[header[6].upper()], header[9])
+            entries = [(folder, filename, entry["size"], entry["codec"]) for folder, filename, entry in reader.entries()]
+    return header, entries
+
+
+class Catalog:
+    """Persistent catalog of the packages in a directory tree, kept in a SQLite database.
+
+    A scan reads the headers, and given a key function also the indexes, of new and changed
+    packages concurrently. A package is only read again when its size or modification time
+    changes, so repeated scans cost a stat per file. Queries never touch the package files.
+    The key function is called with the Argon2 parameters of a package, like Packager.get_key.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH, key = None, workers: int = 16):
+        self.key = key
+        self.workers = workers
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def find(directory: str):
+        """Yield (path, size, mtime_ns) of every package below the directory."""
+        pending = [directory]
+        while pending:
+            with os.scandir(pending.pop()) as scan:
+                for item in scan:
+                    if item.is_dir(follow_symlinks = False):
+                        pending.append(item.path)
+                    elif item.name.lower().endswith('.vpk') and item.is_file():
+                        stat = item.stat()
+                        yield os.path.abspath(item.path), stat.st_size, stat.st_mtime_ns
+
+    def read(self, path: str) -> tuple:
+        try:
+            header, entries = read_package(path, self.key)
+            return header, entries, None
+        except Exception as exc:
+            logging.error(f"Catalog  | {path} | {exc}")
+            return None, None, str(exc)
+
+    def scan(self, directory: str, advance = None) -> dict:
+        """Bring the catalog up to date with the directory, returns the number of packages per outcome.
+
+        advance() is called per package read. If it raises, e.g. on a cancellation, the packages not
+        read yet are dropped and the catalog is left as it was.
+        """
+        directory = os.path.abspath(directory)
+        known = {row["path"]: (row["size"], row["mtime_ns"]) for row in self.db.execute("SELECT path, size, mtime_ns FROM packages WHERE path LIKE ? ESCAPE '!'", (like_prefix(directory),))}
+        found = {path: (size, mtime_ns) for path, size, mtime_ns in self.find(directory)}
+        changed = [path for path, stat in found.items() if known.get(path) != stat]
+        removed = [path for path in known if path not in found]
+
+        # headers and indexes are read concurrently, the database is only written from this thread
+        executor = ThreadPoolExecutor(max_workers = self.workers)
+        try:
+            results = executor.map(self.read, changed)
+            with self.db:
+                for path, (header, entries, error) in zip(changed, results):
+                    self.store(path, found[path], header, entries, error)
+                    if advance is not None:
+                        advance()
+                self.db.executemany("DELETE FROM packages WHERE path = ?", [(path,) for path in removed])
+        finally:
+            executor.shutdown(cancel_futures = True)
+
+        return {"packages": len(found), "read": len(changed), "removed": len(removed), "unchanged": len(found) - len(changed)}
+
+    def store(self, path: str, stat: tuple, header: list, entries: list, error: str):
+        header = header or [None] * len(HEADER_FIELDS)
+        files = len(entries) if entries is not None else None
+        content_size = sum(entry[2] for entry in entries) if entries is not None else None
+        self.db.execute("DELETE FROM packages WHERE path = ?", (path,))
+        self.db.execute(
+            f"INSERT INTO packages (path, size, mtime_ns, {', '.join(HEADER_FIELDS)}, files, content_size, error) VALUES ({', '.join('?' * (len(HEADER_FIELDS) + 6))})",
+            (path, *stat, *header, files, content_size, error),
+        )
+        if entries:
+            self.db.executemany("INSERT INTO entries (path, folder, filename, size, codec) VALUES (?, ?, ?, ?, ?)", [(path, *entry) for entry in entries])
+
+    def query(self, **filters) -> list:
+        """Packages matching all filters, e.g. query(author = "Valky", compression = "zstd")."""
+        unknown = set(filters) - set(QUERY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown catalog fields: {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{field} = ?" for field in filters) or "1"
+        rows = self.db.execute(f"SELECT * FROM packages WHERE {where} ORDER BY path", tuple(filters.values()))
+        return [dict(row) for row in rows]
+
+    def find_file(self, filename: str) -> list:
+        """Entries named 'filename' in any indexed package, as dicts of path, folder, filename, size and codec."""
+        rows = self.db.execute("SELECT * FROM entries WHERE filename = ? ORDER BY path, folder", (filename,))
+        return [dict(row) for row in rows]
+
+
+def like_prefix(directory: str) -> str:
+    """LIKE pattern matching every path below the directory."""
+    escaped = directory.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return os.path.join(escaped, '%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Scan directories of packages into a catalog and query it.")
+    parser.add_argument("--db", default = CATALOG_PATH)
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    scan = commands.add_parser("scan", help = "read the headers of new and changed packages")
+    scan.add_argument("directory")
+    scan.add_argument("--workers", type = int, default = 16)
+
+    query = commands.add_parser("query", help = "list packages matching all given fields")
+    for field in QUERY_FIELDS:
+        query.add_argument(f"--{field.replace('_', '-')}", dest = field)
+
+    args = parser.parse_args()
+    with Catalog(args.db, workers = getattr(args, "workers", 16)) as catalog:
+        if args.command == "scan":
+            print(catalog.scan(args.directory))
+        else:
+            filters = {field: getattr(args, field) for field in QUERY_FIELDS if getattr(args, field) is not None}
+            for row in catalog.query(**filters):
+                print(f"{row['path']} | {row['author']} | {row['compression']} | v{row['version']} | {row['filesize']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,447 @@
-import gzip
-import bz2
-import lzma
-import lz4.frame
-import zstandard as zstd
+import importlib
+import importlib.util
+import zlib
+from collections import Counter
+from functools import lru_cache
+from math import log2
+
+
+class LazyModule:
+	"""A module imported on first use, so codecs that are never used never load their libraries."""
+	
+	def __init__(self, name: str):
+		self.__name = name
+	
+	def __getattr__(self, attribute):
+		value = getattr(importlib.import_module(self.__name), attribute)
+		# later lookups are plain instance attributes
+		setattr(self, attribute, value)
+		return value
+
+
+gzip = LazyModule('gzip')
+bz2 = LazyModule('bz2')
+lzma = LazyModule('lzma')
+lz4frame = LazyModule('lz4.frame')
+zstd = LazyModule('zstandard')
+# optional, the codec is only registered if the module is installed
+brotli = LazyModule('brotli') if importlib.util.find_spec('brotli') is not None else None
+
+# mime types of formats that are compressed already, compressing them again only costs time
+INCOMPRESSIBLE = {
+	'image/png', 'image/jpeg', 'image/gif', 'image/webp',
+	'audio/mpeg', 'audio/ogg', 'audio/flac', 'video/mp4', 'video/webm', 'video/ogg',
+	'application/zip', 'application/gzip', 'application/x-bzip2', 'application/x-xz', 'application/x-7z-compressed', 'application/zstd',
+}
+SAMPLE_SIZE = 16384
+LARGE_ENTRY = 1024 * 1024
+MAX_ENTROPY = 7.5
+DICTIONARY_SIZE = 112640
+# the package header stores the compression mode in a 5 byte field
+MAX_CODEC_NAME = 5
+
+
+@lru_cache(maxsize = 8)
+def get_dictionary(data: bytes) -> "zstd.ZstdCompressionDict":
+	"""Parse a zstd dictionary once, compressors and decompressors created with it share the parsed tables."""
+	return zstd.ZstdCompressionDict(data)
+
+
+class Codec:
+	"""
+	A compression codec, configured with a level, a thread count and an optional dictionary.
+	
+	compress and decompress work on whole buffers, compressobj and decompressobj return streaming
+	objects with the interface of zlib: compress(data) and flush() to compress, decompress(data)
+	to decompress. Codecs without threads or dictionaries ignore these settings.
+	"""
+	default_level = None
+	errors = ()
+	
+	def __init__(self, level = None, threads = 0, dictionary = None):
+		self.level = self.default_level if level is None else level
+		self.threads = threads
+		self.dictionary = dictionary
+	
+	def compress(self, data):
+		compressor = self.compressobj()
+		return compressor.compress(data) + compressor.flush()
+	
+	def decompress(self, data):
+		return self.decompressobj().decompress(data)
+	
+	def compressobj(self):
+		raise NotImplementedError
+	
+	def decompressobj(self):
+		raise NotImplementedError
+
+
+class GzipCodec(Codec):
+	default_level = 9
+	
+	@property
+	def errors(self):
+		return (gzip.BadGzipFile, EOFError, zlib.error)
+	
+	def compress(self, data):
+		return gzip.compress(data, compresslevel = self.level)
+	
+	def decompress(self, data):
+		return gzip.decompress(data)
+	
+	def compressobj(self):
+		return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+	
+	def decompressobj(self):
+		return zlib.decompressobj(31)
+
+
+class Bzip2Codec(Codec):
+	default_level = 9
+	errors = (OSError, EOFError)
+	
+	def compress(self, data):
+		return bz2.compress(data, compresslevel = self.level)
+	
+	def decompress(self, data):
+		return bz2.decompress(data)
+	
+	def compressobj(self):
+		return bz2.BZ2Compressor(self.level)
+	
+	def decompressobj(self):
+		return bz2.BZ2Decompressor()
+
+
+class LzmaCodec(Codec):
+	# lzma.PRESET_DEFAULT, spelled out so defining the codec does not load lzma
+	default_level = 6
+	
+	@property
+	def errors(self):
+		return (lzma.LZMAError, EOFError)
+	
+	def compress(self, data):
+		return lzma.compress(data, preset = self.level)
+	
+	def decompress(self, data):
+		return lzma.decompress(data)
+	
+	def compressobj(self):
+		return lzma.LZMACompressor(preset = self.level)
+	
+	def decompressobj(self):
+		return lzma.LZMADecompressor()
+
+
+class LZ4FrameStream:
+	"""zlib style wrapper of the lz4 frame compressor, which needs an explicit begin."""
+	
+	def __init__(self, level):
+		self.compressor = lz4frame.LZ4FrameCompressor(compression_level = level)
+		self.pending = self.compressor.begin()
+	
+	def compress(self, data):
+		data, self.pending = self.pending + self.compressor.compress(data), b''
+		return data
+	
+	def flush(self):
+		return self.pending + self.compressor.flush()
+
+
+class LZ4Codec(Codec):
+	# lz4.frame.COMPRESSIONLEVEL_MIN
+	default_level = 0
+	errors = (RuntimeError,)
+	
+	def compress(self, data):
+		return lz4frame.compress(data, compression_level = self.level)
+	
+	def decompress(self, data):
+		return lz4frame.decompress(data)
+	
+	def compressobj(self):
+		return LZ4FrameStream(self.level)
+	
+	def decompressobj(self):
+		return lz4frame.LZ4FrameDecompressor()
+
+
+class LZ4HCCodec(LZ4Codec):
+	# lz4.frame.COMPRESSIONLEVEL_MINHC
+	default_level = 3
+
+
+class ZstdCodec(Codec):
+	default_level = 3
+	
+	@property
+	def errors(self):
+		return (zstd.ZstdError,)
+	
+	def compressor(self):
+		dictionary = get_dictionary(self.dictionary) if self.dictionary else None
+		return zstd.ZstdCompressor(level = self.level, dict_data = dictionary, threads = self.threads)
+	
+	def decompressor(self):
+		return zstd.ZstdDecompressor(dict_data = get_dictionary(self.dictionary) if self.dictionary else None)
+	
+	def compress(self, data):
+		return self.compressor().compress(data)
+	
+	def decompress(self, data):
+		return self.decompressor().decompress(data)
+	
+	def compressobj(self):
+		return self.compressor().compressobj()
+	
+	def decompressobj(self):
+		return self.decompressor().decompressobj()
+
+
+class PassStream:
+	"""Streaming object of the 'none' codec."""
+	
+	def compress(self, data):
+		return bytes(data)
+	
+	def decompress(self, data):
+		return bytes(data)
+	
+	def flush(self):
+		return b''
+
+
+class NoneCodec(Codec):
+	
+	def compress(self, data):
+		return data
+	
+	def decompress(self, data):
+		return data
+	
+	def compressobj(self):
+		return PassStream()
+	
+	def decompressobj(self):
+		return PassStream()
+
+
+class BrotliStream:
+	"""zlib style wrapper of the brotli compressor and decompressor."""
+	
+	def __init__(self, level = None):
+		self.brotli = brotli.Compressor(quality = level) if level is not None else brotli.Decompressor()
+	
+	def compress(self, data):
+		return self.brotli.process(bytes(data))
+	
+	def decompress(self, data):
+		return self.brotli.process(bytes(data))
+	
+	def flush(self):
+		return self.brotli.finish()
+
+
+class BrotliCodec(Codec):
+	default_level = 11
+	
+	@property
+	def errors(self):
+		return (brotli.error,)
+	
+	def compress(self, data):
+		return brotli.compress(bytes(data), quality = self.level)
+	
+	def decompress(self, data):
+		return brotli.decompress(bytes(data))
+	
+	def compressobj(self):
+		return BrotliStream(self.level)
+	
+	def decompressobj(self):
+		return BrotliStream()
+
+
+CODECS: dict = {}
+
+
+def register_codec(name: str, codec: type):
+	"""Make a Codec subclass available as compression mode 'name', e.g. in the settings or per entry.
+	
+	Raises ValueError if the name does not fit the package header, it would be cut off there and not found again.
+	"""
+	if not name or len(name.encode('utf-8')) > MAX_CODEC_NAME:
+		raise ValueError(f"The compression mode {name!r} must be 1 to {MAX_CODEC_NAME} bytes long.")
+	CODECS[name] = codec
+
+
+def get_codec(name: str, level = None, threads = 0, dictionary = None) -> Codec:
+	"""Create the codec registered as 'name' with the given settings."""
+	if name not in CODECS:
+		raise ValueError(f"Invalid compression mode. Supported modes are {', '.join(repr(name) for name in CODECS)}.")
+	return CODECS[name](level, threads, dictionary)
+
+
+register_codec('gzip', GzipCodec)
+register_codec('bzip2', Bzip2Codec)
+register_codec('lzma', LzmaCodec)
+register_codec('lz4', LZ4Codec)
+register_codec('lz4hc', LZ4HCCodec)
+register_codec('zstd', ZstdCodec)
+register_codec('none', NoneCodec)
+if brotli is not None:
+	register_codec('br', BrotliCodec)
 
 
 class Compressor:
 	
 	@staticmethod
-	def deflate(data, compression_mode):
+	def deflate(data, compression_mode, dictionary = None, level = None, threads = 0):
 		"""
 		Compresses the given data using the specified compression mode.
 	
 		Args:
 			data: The data to be compressed.
-			compression_mode: The compression mode to be used. Possible values are 'gzip', 'bzip2', 'lzma', 'lz4', 'zstd', and 'none'.
+			compression_mode: The compression mode to be used, any registered codec, e.g. 'gzip', 'bzip2', 'lzma', 'lz4', 'lz4hc', 'zstd', and 'none'.
+			dictionary: A trained zstd dictionary, only used by 'zstd'.
+			level: The compression level, the default level of the codec if None.
+			threads: The number of compression threads, only used by 'zstd'.
 	
 		Returns:
 			The compressed data.
 		"""
-		if compression_mode == 'gzip':
-			return gzip.compress(data)
-		elif compression_mode == 'bzip2':
-			return bz2.compress(data)
-		elif compression_mode == 'lzma':
-			return lzma.compress(data)
-		elif compression_mode == 'lz4':
-			return lz4.frame.compress(data)
-		elif compression_mode == 'zstd':
-			return zstd.compress(data)
-		elif compression_mode == 'none':
-			return data
-		else:
-			raise ValueError("Invalid compression mode. Supported modes are 'gzip', 'bzip2', 'lzma', 'lz4', 'zstd', and 'none'.")
+		return get_codec(compression_mode, level, threads, dictionary).compress(data)
 	
 	@staticmethod
-	def inflate(compressed_data, compression_mode):
+	def inflate(compressed_data, compression_mode, dictionary = None):
 		"""
 		Decompresses the given compressed data using the specified compression mode.
 	
 		Args:
 			compressed_data: The compressed data to be decompressed.
-			compression_mode: The compression mode that was used for compression. Possible values are 'gzip', 'bzip2', 'lzma', 'lz4', 'zstd', and 'none'.
+			compression_mode: The compression mode that was used for compression, any registered codec.
+			dictionary: The zstd dictionary the data was compressed with, only used by 'zstd'.
 	
 		Returns:
 			The decompressed data.
+		
+		Raises:
+			ValueError: If the compression mode is unknown or the data was not compressed with it.
+		"""
+		codec = get_codec(compression_mode, dictionary = dictionary)
+		try:
+			return codec.decompress(compressed_data)
+		except codec.errors as exc:
+			raise ValueError(f"Cannot inflate {compression_mode} data: {exc}") from exc
+	
+	@staticmethod
+	def deflate_stream(source, target, compression_mode, level = None, threads = 0, chunk_size = 1024 * 1024):
+		"""
+		Compresses a binary stream into another one, holding a single chunk in memory at a time.
+	
+		Args:
+			source: The readable binary stream.
+			target: The writable binary stream.
+			compression_mode: The compression mode to be used, any registered codec.
+			level: The compression level, the default level of the codec if None.
+			threads: The number of compression threads, only used by 'zstd'.
+			chunk_size: The number of bytes read from the source at a time.
+	
+		Returns:
+			The number of compressed bytes written.
+		"""
+		compressor = get_codec(compression_mode, level, threads).compressobj()
+		written = 0
+		for chunk in iter(lambda: source.read(chunk_size), b''):
+			written += target.write(compressor.compress(chunk))
+		return written + target.write(compressor.flush())
+	
+	@staticmethod
+	def inflate_stream(source, target, compression_mode, size = -1, chunk_size = 1024 * 1024):
+		"""
+		Decompresses a binary stream into another one, holding a single chunk in memory at a time.
+	
+		Args:
+			source: The readable binary stream.
+			target: The writable binary stream.
+			compression_mode: The compression mode that was used for compression, any registered codec.
+			size: The number of compressed bytes to read from the source, everything if negative.
+			chunk_size: The number of bytes read from the source at a time.
+	
+		Returns:
+			The number of decompressed bytes written.
+		
+		Raises:
+			ValueError: If the data was not compressed with the compression mode or is truncated.
+		"""
+		codec = get_codec(compression_mode)
+		decompressor = codec.decompressobj()
+		written = 0
+		try:
+			while size:
+				chunk = source.read(chunk_size if size < 0 else min(chunk_size, size))
+				if not chunk:
+					break
+				size -= len(chunk) if size > 0 else 0
+				written += target.write(decompressor.decompress(chunk))
+		except codec.errors as exc:
+			raise ValueError(f"Cannot inflate {compression_mode} data: {exc}") from exc
+		if not getattr(decompressor, 'eof', True):
+			raise ValueError(f"Cannot inflate {compression_mode} data: unexpected end of data")
+		return written
+	
+	@staticmethod
+	def entropy(sample) -> float:
+		"""
+		Estimates the information density of a data sample.
+	
+		Args:
+			sample: The data to be measured.
+	
+		Returns:
+			The Shannon entropy in bits per byte, from 0.0 for constant data to 8.0 for random data.
+		"""
+		if not sample:
+			return 0.0
+		total = len(sample)
+		return -sum(count / total * log2(count / total) for count in Counter(sample).values())
+	
+	@staticmethod
+	def select(sample, size, strong, fast = 'lz4', mime = None):
+		"""
+		Selects the compression mode for a single entry before it is compressed.
+	
+		Args:
+			sample: The first bytes of the entry.
+			size: The full size of the entry in bytes.
+			strong: The compression mode for small, compressible entries.
+			fast: The compression mode for large, compressible entries.
+			mime: The mime type of the entry, if known.
+	
+		Returns:
+			'none' for compressed media and data that looks random, 'fast' for entries of at least 1 MB and 'strong' otherwise.
+		"""
+		if mime in INCOMPRESSIBLE or Compressor.entropy(sample[:SAMPLE_SIZE]) > MAX_ENTROPY:
+			return 'none'
+		if size >= LARGE_ENTRY:
+			return fast
+		return strong
+	
+	@staticmethod
+	def train(samples, size = DICTIONARY_SIZE):
+		"""
+		Trains a zstd dictionary on samples of many small, similar entries.
+	
+		Args:
+			samples: A list of bytes, e.g. the first bytes of every entry of a package.
+			size: The maximum size of the dictionary in bytes.
+	
+		Returns:
+			The dictionary, or None if the samples are too few or too small to train on.
 		"""
-		if compression_mode == 'gzip':
-			return gzip.decompress(compressed_data)
-		elif compression_mode == 'bzip2':
-			return bz2.decompress(compressed_data)
-		elif compression_mode == 'lzma':
-			return lzma.decompress(compressed_data)
-		elif compression_mode == 'lz4':
-			return lz4.frame.decompress(compressed_data)
-		elif compression_mode == 'zstd':
-			return zstd.decompress(compressed_data)
-		elif compression_mode == 'none':
-			return compressed_data
-		else:
-			raise ValueError("Invalid compression mode. Supported modes are 'gzip', 'bzip2', 'lzma', 'lz4', 'zstd', and 'none'.")
+		try:
+			return zstd.train_dictionary(size, samples).as_bytes()
+		except zstd.ZstdError:
+			return None
@@ -0,0 +1,1001 @@
+import bisect
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+
+import argoncrypto as ac
+from compressor import Compressor, SAMPLE_SIZE
+from manifest import pack_manifest, load_index, editable
+from metrics import Metrics, NULL_METRICS
+
+# Layout of a version 2 package, directly following the classic VPK header:
+#
+#   preamble    V2_FORMAT, the locator of the index (patched once the data is written),
+#               followed by KDF_FORMAT, the Argon2 parameters the package key was derived with,
+#               and DICT_FORMAT, the locator of the zstd dictionary (zero without one)
+#   dictionary  optional, a single frame holding the encrypted zstd dictionary of the package
+#   frames      one frame per chunk: '<I' frame length + nonce | tag | ciphertext
+#   index       a single frame holding the compressed entry index, a manifest (see manifest.py)
+#
+# Every chunk is compressed first and encrypted afterwards, so neither side ever holds
+# more than a single chunk of a file in memory.
+V2_MAGIC = b'VPK2'
+V2_FORMAT = '<4sHIQQ'  # magic, preamble size, chunk size, index offset, index length
+V2_SIZE = struct.calcsize(V2_FORMAT)
+KDF_FORMAT = '<IIH'  # time cost, memory cost, parallelism
+KDF_SIZE = struct.calcsize(KDF_FORMAT)
+DICT_FORMAT = '<QI'  # dictionary offset, dictionary length
+DICT_SIZE = struct.calcsize(DICT_FORMAT)
+PREAMBLE_SIZE = V2_SIZE + KDF_SIZE + DICT_SIZE
+FRAME_FORMAT = '<I'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+CHUNK_SIZE = 4 * 1024 * 1024
+CACHE_BUDGET = 128 * 1024 * 1024
+
+# Exceptions raised by the different Compressor.inflate backends on bad input
+INFLATE_ERRORS = (ValueError, OSError, RuntimeError)
+
+
+class EntryError(Exception):
+    """An entry cannot be decoded although the index of its package could, so the key is right and its frames are damaged."""
+
+    def __init__(self, folder: str, filename: str, reason: str):
+        # the arguments are kept as they are, so the error survives the way back from a worker process
+        super().__init__(folder, filename, reason)
+        self.folder = folder
+        self.filename = filename
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"{self.folder}/{self.filename}: {self.reason}"
+
+
+def _grow(buffer: bytearray, size: int) -> memoryview:
+    """Return a view of at least 'size' bytes on a reusable scratch buffer."""
+    if len(buffer) < size:
+        buffer.extend(bytes(size - len(buffer)))
+    return memoryview(buffer)[:size]
+
+
+def encode_frame(key: bytes, mode: int, compression: str, data, dictionary: bytes = None, level: int = None, threads: int = 0) -> tuple:
+    """Compress and encrypt one chunk into a frame, runs on the pool workers of a parallel writer.
+    
+    Returns the frame and the seconds spent compressing and encrypting, so the writer can account
+    the work of its workers.
+    """
+    start = time.perf_counter()
+    compressed = Compressor.deflate(data, compression, dictionary, level, threads)
+    middle = time.perf_counter()
+    frame = ac.encrypt_bytes(key, compressed, mode)
+    return frame, middle - start, time.perf_counter() - middle
+
+
+def content_hash(data) -> bytes:
+    return blake2b(data, digest_size = 32).digest()
+
+
+def location(entry: dict) -> tuple:
+    """Where the frames of an entry are stored, the same for duplicates.
+
+    An empty entry has no frames and starts where the next entry starts, the length tells them apart.
+    """
+    return entry["offset"], entry["length"]
+
+
+class BlobStore:
+    """Encoded entries shared between the writers of a bulk build, keyed by content hash.
+
+    A writer finding a hash in the store copies the stored frames instead of compressing and
+    encrypting the content again. Frames are only shared between writers using the same key,
+    cipher and codec, and only entries up to 'max_blob' bytes are kept, within 'budget' bytes.
+    """
+
+    def __init__(self, budget: int = 256 * 1024 * 1024, max_blob: int = CHUNK_SIZE):
+        self.budget = budget
+        self.max_blob = max_blob
+        self.size = 0
+        self.hits = 0
+        self.blobs: dict = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(key: bytes, mode: int, compression: str, dictionary: bytes = None) -> bytes:
+        return blake2b(bytes([mode]) + compression.encode('utf-8') + (dictionary or b''), key = key, digest_size = 16, person = b'VPK blob store').digest()
+
+    def wants(self, size: int) -> bool:
+        return size <= self.max_blob and self.size + size <= self.budget
+
+    def get(self, fingerprint: bytes, digest: bytes):
+        with self.lock:
+            blob = self.blobs.get((fingerprint, digest))
+            if blob is not None:
+                self.hits += 1
+            return blob
+
+    def put(self, fingerprint: bytes, digest: bytes, raw: bytes, entry: dict):
+        with self.lock:
+            if (fingerprint, digest) in self.blobs or self.size + len(raw) > self.budget:
+                return
+            self.blobs[(fingerprint, digest)] = (raw, dict(entry, offset = None, tags = bytes(entry["tags"])))
+            self.size += len(raw)
+
+
+class EntryCache:
+    """Decoded entries of a package kept for repeated access, within 'budget' bytes.
+
+    The least recently used entries are evicted first. Entries larger than a quarter of the
+    budget are never kept, so a single large file cannot flush the cache. prefetch() decodes
+    entries on a background thread ahead of their use, e.g. the siblings of an opened folder;
+    a new prefetch drops whatever the previous one has not started yet. Every prefetch still
+    running is tracked until it finishes, so clear() can wait for all of them.
+    """
+
+    def __init__(self, budget: int = CACHE_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+        # prefetches not finished yet, running ones included
+        self.futures: set = set()
+
+    def wants(self, size: int) -> bool:
+        return size <= self.budget // 4
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes, prefetched: bool = False):
+        if not self.wants(len(data)):
+            return
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = data
+            self.size += len(data)
+            self.prefetched += prefetched
+            while self.size > self.budget:
+                _, evicted = self.entries.popitem(last = False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def prefetch(self, items):
+        """Decode the (reader, entry) items in the background in the given order, up to half the budget."""
+        self.cancel()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers = 1)
+        room = self.budget // 2
+        for reader, entry in items:
+            if not self.wants(entry["size"]) or entry["size"] > room:
+                continue
+            with self.lock:
+                if reader.place(entry) in self.entries:
+                    continue
+            room -= entry["size"]
+            future = self.executor.submit(self.load, reader, entry)
+            with self.lock:
+                self.futures.add(future)
+            future.add_done_callback(self.finished)
+
+    def finished(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def load(self, reader: "ContainerReader", entry: dict):
+        if reader.place(entry) in self.entries:
+            return
+        # decoded without the scratch buffers of the reader, so it never waits for a prefetch
+        frames = reader.read_frames(entry)
+        try:
+            data = b''.join(reader.decode_frames(entry, frames))
+        finally:
+            if isinstance(frames, memoryview):
+                frames.release()
+        self.put(reader.place(entry), data, prefetched = True)
+
+    def cancel(self, wait: bool = False):
+        """Drop the prefetches not started yet, with 'wait' also wait for all running ones."""
+        with self.lock:
+            futures = list(self.futures)
+        for future in futures:
+            if not future.cancel() and wait:
+                # a failed prefetch only means the entry is decoded when it is used
+                future.exception()
+
+    def clear(self):
+        """Forget all entries, before the package they were decoded from is closed or changed."""
+        self.cancel(wait = True)
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries), "bytes": self.size, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "prefetched": self.prefetched,
+            }
+
+
+class ContainerWriter:
+    """Streams entries into a version 2 package, one chunk at a time.
+
+    Without 'select' every entry is compressed with the codec of the package, otherwise 'select'
+    picks the codec of each entry, which is recorded in its index record. Given a trained zstd
+    dictionary, it is stored once after the preamble and every zstd entry is compressed with it.
+
+    Entries are content addressed: every entry records the BLAKE2b hash of its content, and an
+    entry whose content was written before shares the index record, and so the frames, of the
+    first one. Given a BlobStore, content encoded by other writers is copied from the store.
+
+    With more than one worker, chunks are compressed and encrypted on a thread or process pool
+    while the frames are still written in the order the entries were added, so the layout does
+    not depend on scheduling. At most two chunks per worker are in flight at any time.
+
+    Given the index of an existing package, with the file positioned at its preamble, the writer
+    appends: new frames and a new index go after everything already written, and the preamble
+    is only patched once the new index is complete. Frames of replaced entries and the previous
+    index stay behind as dead space until the package is compacted. An appending writer keeps
+    the dictionary 'locator' of the package it appends to.
+    """
+
+    def __init__(self, file, key: bytes, mode: int, compression: str, chunk_size: int = CHUNK_SIZE, workers: int = 1, pool: str = 'thread', kdf: tuple = ac.ARGON_DEFAULTS, index: dict = None, store: BlobStore = None, select = None, dictionary: bytes = None, locator: tuple = (0, 0), level: int = None, threads: int = 0, detect = None, metrics: Metrics = None):
+        self.file = file
+        self.key = key
+        self.mode = mode
+        self.compression = compression
+        # optional callable picking the codec of every entry from its first bytes and size
+        self.select = select
+        # optional callable returning the MIME type of an entry from its first bytes, kept in the index
+        self.detect = detect
+        self.chunk_size = chunk_size
+        self.kdf = kdf
+        self.dictionary = dictionary
+        # level and threads of the package codec, entries selected to another codec use its defaults
+        self.level = level
+        self.threads = threads
+        self.locator = locator
+        # optional timing of the stages, recording nothing by default
+        self.metrics: Metrics = metrics or NULL_METRICS
+        self.index: dict = {} if index is None else editable(index)
+        self.start = file.tell()
+        self.buffer = bytearray(chunk_size)
+        self.scratch = bytearray()
+
+        # content hash -> index record, duplicates share the record of the first entry
+        self.blobs: dict = {entry["hash"]: entry for file_dict in self.index.values() for entry in file_dict.values() if "hash" in entry}
+        # source location -> index record of entries copied from another package
+        self.copied: dict = {}
+        self.store = store
+        self.fingerprint = BlobStore.fingerprint(key, mode, compression, dictionary) if store is not None else None
+        self.capture: dict = {}
+
+        self.pool = pool
+        self.executor = None
+        self.pending = deque()
+        self.window = workers * 2
+        if workers > 1 and pool == 'process':
+            # multiprocessing is slow to import, it is only loaded for process pools
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers = workers)
+        elif workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers = workers)
+
+        if index is None:
+            # reserve the preamble, the index locator is only known once all frames are written
+            file.write(b'\0' * PREAMBLE_SIZE)
+            if dictionary:
+                frame = ac.encrypt_bytes(key, dictionary, mode)
+                self.locator = (file.tell(), len(frame))
+                file.write(frame)
+        else:
+            file.seek(0, os.SEEK_END)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures = True)
+            self.executor = None
+
+    def add_duplicate(self, folder: str, filename: str, digest: bytes) -> bool:
+        """Reference content written before, returns False if the content is new."""
+        entry = self.blobs.get(digest)
+        if entry is None and self.store is not None:
+            blob = self.store.get(self.fingerprint, digest)
+            if blob is not None:
+                entry = self.write_raw(blob[0], dict(blob[1]))
+                self.blobs[digest] = entry
+        if entry is None:
+            return False
+        self.index.setdefault(folder, {})[filename] = entry
+        return True
+
+    def begin_entry(self, folder: str, filename: str, digest: bytes, size: int, sample) -> dict:
+        entry = {
+            "offset": None,
+            "length": 0,
+            "size": 0,
+            "codec": self.compression if self.select is None else self.select(sample, size),
+            "hash": digest,
+            "frames": [],
+            "tags": bytearray(),
+            # plain size of every chunk but the last, so a chunk can be located without decoding the ones before
+            "chunk": self.chunk_size,
+        }
+        if self.dictionary and entry["codec"] == 'zstd':
+            entry["dictionary"] = True
+        if self.detect is not None:
+            with self.metrics.time("detect"):
+                entry["mime"] = self.detect(sample)
+        self.index.setdefault(folder, {})[filename] = entry
+        if digest is not None:
+            self.blobs[digest] = entry
+        if self.store is not None and self.store.wants(size):
+            self.capture[id(entry)] = bytearray()
+        if self.executor is None:
+            entry["offset"] = self.file.tell()
+        else:
+            # the offset is only known once every frame queued before this entry is written
+            self.pending.append(("begin", entry, None))
+        return entry
+
+    def end_entry(self, entry: dict):
+        if self.executor is not None:
+            self.pending.append(("end", entry, None))
+            return
+        raw = self.capture.pop(id(entry), None)
+        if raw is not None:
+            self.store.put(self.fingerprint, entry["hash"], bytes(raw), entry)
+
+    def append_frame(self, entry: dict, frame):
+        if entry["offset"] is None:
+            entry["offset"] = self.file.tell()
+        header = struct.pack(FRAME_FORMAT, len(frame))
+        with self.metrics.time("write", FRAME_SIZE + len(frame)):
+            self.file.write(header)
+            self.file.write(frame)
+        entry["frames"].append(FRAME_SIZE + len(frame))
+        entry["length"] += FRAME_SIZE + len(frame)
+        entry["tags"] += frame[ac.NONCE_SIZE:ac.FRAME_OVERHEAD]
+        raw = self.capture.get(id(entry))
+        if raw is not None:
+            raw += header
+            raw += frame
+
+    def write_frame(self, entry: dict, data):
+        entry["size"] += len(data)
+        if self.executor is not None:
+            if self.pool == 'process' and not isinstance(data, bytes):
+                # memoryviews cannot be pickled over to another process
+                data = bytes(data)
+            self.pending.append(("frame", entry, self.executor.submit(encode_frame, self.key, self.mode, entry["codec"], data, self.get_dictionary(entry), *self.get_options(entry))))
+            while len(self.pending) > self.window:
+                self.drain()
+            return
+
+        with self.metrics.time("compress", len(data)):
+            compressed = Compressor.deflate(data, entry["codec"], self.get_dictionary(entry), *self.get_options(entry))
+        with self.metrics.time("encrypt", len(compressed)):
+            frame = _grow(self.scratch, ac.frame_size(len(compressed), self.mode))
+            length = ac.encrypt_into(self.key, compressed, frame, self.mode)
+        self.append_frame(entry, frame[:length])
+
+    def get_dictionary(self, entry: dict) -> bytes:
+        return self.dictionary if entry.get("dictionary") else None
+
+    def get_options(self, entry: dict) -> tuple:
+        return (self.level, self.threads) if entry["codec"] == self.compression else (None, 0)
+
+    def write_raw(self, raw, entry: dict) -> dict:
+        """Write frames encoded elsewhere verbatim and return their record at the new offset."""
+        while self.pending:
+            self.drain()
+        entry["offset"] = self.file.tell()
+        with self.metrics.time("write", len(raw)):
+            self.file.write(raw)
+        return entry
+
+    def drain(self):
+        """Write the oldest queued frame, waiting for its worker if needed."""
+        action, entry, future = self.pending.popleft()
+        if action == "begin":
+            entry["offset"] = self.file.tell()
+        elif action == "frame":
+            with self.metrics.time("wait"):
+                frame, compress, encrypt = future.result()
+            self.metrics.add("compress", compress)
+            self.metrics.add("encrypt", encrypt, len(frame))
+            self.append_frame(entry, frame)
+        else:
+            raw = self.capture.pop(id(entry), None)
+            if raw is not None:
+                self.store.put(self.fingerprint, entry["hash"], bytes(raw), entry)
+
+    def add_stream(self, folder: str, filename: str, stream) -> int:
+        """Add an entry read chunk by chunk from a binary stream, returns its size.
+
+        Large entries are hashed while they are encoded, so they are read only once. A duplicate
+        is only recognized once its frames are written, they are cut off the file again.
+        """
+        start = time.perf_counter()
+        first = stream.read(self.chunk_size)
+        self.metrics.add("read", time.perf_counter() - start, len(first))
+        if len(first) < self.chunk_size:
+            return self.add_bytes(folder, filename, first)
+
+        # the codec is picked by the size, the content hash is only known at the end
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(len(first))
+        digest = blake2b(digest_size = 32)
+        entry = self.begin_entry(folder, filename, None, size, first)
+        view = memoryview(self.buffer)
+        chunk = first
+        while chunk:
+            with self.metrics.time("hash", len(chunk)):
+                digest.update(chunk)
+            self.write_frame(entry, chunk)
+            start = time.perf_counter()
+            if self.executor is not None:
+                # queued chunks must not share the read buffer
+                chunk = stream.read(self.chunk_size)
+            else:
+                chunk = view[:stream.readinto(self.buffer)]
+            self.metrics.add("read", time.perf_counter() - start, len(chunk))
+
+        entry["hash"] = digest = digest.digest()
+        original = self.blobs.get(digest)
+        if original is None:
+            self.blobs[digest] = entry
+            self.end_entry(entry)
+            return entry["size"]
+
+        # the entry starts where the file ended before it, its frames are the last ones written
+        while self.pending:
+            self.drain()
+        self.capture.pop(id(entry), None)
+        self.file.seek(entry["offset"])
+        self.file.truncate()
+        self.index[folder][filename] = original
+        return entry["size"]
+
+    def add_bytes(self, folder: str, filename: str, data) -> int:
+        """Add an entry from data already held in memory, returns its size."""
+        view = memoryview(data)
+        with self.metrics.time("hash", len(view)):
+            digest = content_hash(view)
+        if self.add_duplicate(folder, filename, digest):
+            return len(view)
+
+        entry = self.begin_entry(folder, filename, digest, len(view), view[:SAMPLE_SIZE])
+        for start in range(0, len(view), self.chunk_size):
+            self.write_frame(entry, view[start:start + self.chunk_size])
+        self.end_entry(entry)
+        return entry["size"]
+
+    def add_folder(self, folder: str):
+        self.index.setdefault(folder, {})
+
+    def remove(self, folder: str, filename: str):
+        """Drop an entry from the index, its frames become dead space."""
+        self.index.get(folder, {}).pop(filename, None)
+
+    def copy_entry(self, folder: str, filename: str, entry: dict, source):
+        """Copy the frames of an entry from another package verbatim, without decoding them."""
+        copied = self.copied.get(location(entry))
+        if copied is None:
+            while self.pending:
+                self.drain()
+            copied = self.copied[location(entry)] = dict(entry, offset = self.file.tell())
+            if "hash" in entry:
+                self.blobs[entry["hash"]] = copied
+            source.seek(entry["offset"])
+            remaining = entry["length"]
+            while remaining:
+                data = source.read(min(remaining, self.chunk_size))
+                if not data:
+                    raise RuntimeError("Unexpected end of package")
+                with self.metrics.time("write", len(data)):
+                    self.file.write(data)
+                remaining -= len(data)
+        self.index.setdefault(folder, {})[filename] = copied
+
+    def close(self) -> int:
+        """Write the index, patch the preamble and return the payload size."""
+        while self.pending:
+            self.drain()
+        for file_dict in self.index.values():
+            for entry in file_dict.values():
+                entry["tags"] = bytes(entry["tags"])
+
+        index_offset = self.file.tell()
+        start = time.perf_counter()
+        index_data = pack_manifest(self.index)
+        self.metrics.add("serialize", time.perf_counter() - start, len(index_data))
+        with self.metrics.time("compress", len(index_data)):
+            index_data = Compressor.deflate(index_data, self.compression, level = self.level, threads = self.threads)
+        with self.metrics.time("encrypt", len(index_data)):
+            index_frame = ac.encrypt_bytes(self.key, index_data, self.mode)
+        with self.metrics.time("write", len(index_frame)):
+            self.file.write(index_frame)
+        end = self.file.tell()
+
+        self.file.seek(self.start)
+        self.file.write(struct.pack(V2_FORMAT, V2_MAGIC, PREAMBLE_SIZE, self.chunk_size, index_offset, len(index_frame)))
+        self.file.write(struct.pack(KDF_FORMAT, *self.kdf) + struct.pack(DICT_FORMAT, *self.locator))
+        self.file.seek(end)
+        return end - self.start
+
+
+def dedup_ratio(*indexes: dict) -> float:
+    """Ratio of the content size of all entries to the size of their unique content, of a package or the volumes of a set."""
+    size = unique = 0
+    for index in indexes:
+        entries = [entry for file_dict in index.values() for entry in file_dict.values()]
+        unique += sum({location(entry): entry["size"] for entry in entries}.values())
+        size += sum(entry["size"] for entry in entries)
+    return size / unique if unique else 1.0
+
+
+class ContainerReader:
+    """Reads the index and entries of a version 2 package.
+
+    Each index entry maps a folder and file name to the offset and length of its frames,
+    its plain size, the codec it was compressed with and the authentication tags of its frames.
+    An index read earlier can be handed in to decode single entries without reading it again.
+    The key may also be a callable, it is then called with the Argon2 parameters recorded in
+    the preamble and returns the key derived with them. The zstd dictionary of the package, if
+    it has one, is read along with the preamble. Given an EntryCache, decoded entries are kept
+    in it and read from it again.
+    """
+
+    def __init__(self, file, key, mode: int, compression: str, index: dict = None, metrics: Metrics = None, cache: EntryCache = None):
+        self.file = file
+        self.metrics: Metrics = metrics or NULL_METRICS
+        self.cache: EntryCache = cache
+        self.mode = mode
+        self.compression = compression
+        self.frame = bytearray()
+        self.plain = bytearray()
+        # the scratch buffers are shared, entries may be decoded from a UI and a worker thread
+        self.lock = threading.RLock()
+
+        self.start = file.tell()
+        magic, size, self.chunk_size, self.index_offset, self.index_length = struct.unpack(V2_FORMAT, file.read(V2_SIZE))
+        self.data_start = self.start + size
+        if magic != V2_MAGIC:
+            raise Exception("Not a version 2 package!")
+        if size < PREAMBLE_SIZE:
+            raise RuntimeError("The package preamble is truncated")
+        self.kdf = struct.unpack(KDF_FORMAT, file.read(KDF_SIZE))
+        self.locator = struct.unpack(DICT_FORMAT, file.read(DICT_SIZE))
+        with self.metrics.time("kdf"):
+            self.key = key(self.kdf) if callable(key) else key
+
+        self.dictionary = None
+        if self.locator[1]:
+            file.seek(self.locator[0])
+            with self.metrics.time("decrypt", self.locator[1]):
+                self.dictionary = bytes(ac.decrypt_bytes(self.key, file.read(self.locator[1]), self.mode))
+
+        if index is None:
+            file.seek(self.index_offset)
+            with self.metrics.time("read", self.index_length):
+                index_frame = file.read(self.index_length)
+            index_data = self.open_frame(index_frame, self.compression)
+            with self.metrics.time("deserialize", len(index_data)):
+                index = load_index(index_data)
+        self.index = index
+
+    def open_frame(self, frame, codec: str, dictionary: bytes = None) -> bytes:
+        # decrypt into the reusable scratch buffer, only the inflated chunk is a new object
+        plain = _grow(self.plain, len(frame))
+        with self.metrics.time("decrypt", len(frame)):
+            length = ac.decrypt_into(self.key, frame, plain, self.mode)
+        start = time.perf_counter()
+        try:
+            data = Compressor.inflate(plain[:length], codec, dictionary)
+        except INFLATE_ERRORS as exc:
+            raise RuntimeError(f"Cannot inflate frame: {exc}") from exc
+        self.metrics.add("inflate", time.perf_counter() - start, len(data))
+        return data if isinstance(data, bytes) else bytes(data)
+
+    def read_frame(self) -> memoryview:
+        start = time.perf_counter()
+        length, = struct.unpack(FRAME_FORMAT, self.file.read(FRAME_SIZE))
+        frame = _grow(self.frame, length)
+        if self.file.readinto(frame) != length:
+            raise RuntimeError("Unexpected end of package")
+        self.metrics.add("read", time.perf_counter() - start, FRAME_SIZE + length)
+        return frame
+
+    def read_head(self, entry: dict) -> bytes:
+        """Decode only the first chunk of an entry, e.g. to detect its file type."""
+        if not entry["frames"]:
+            return b''
+        return self.read_chunk(entry, entry["offset"])
+
+    def read_chunk(self, entry: dict, offset: int) -> bytes:
+        """Decode the single frame of an entry starting at the given file offset."""
+        with self.lock:
+            self.file.seek(offset)
+            return self.next_frame(entry["codec"], self.dictionary if entry.get("dictionary") else None)
+
+    def next_frame(self, codec: str, dictionary: bytes = None) -> bytes:
+        """Read and decode the frame at the position of the file."""
+        # the frame is released even if it fails, a view on a memory map keeps the map from being closed
+        with self.read_frame() as frame:
+            return self.open_frame(frame, codec, dictionary)
+
+    def read_entry(self, entry: dict) -> bytes:
+        """Decode a single entry frame by frame, or take it from the cache."""
+        if self.cache is not None:
+            data = self.cache.get(self.place(entry))
+            if data is not None:
+                return data
+        dictionary = self.dictionary if entry.get("dictionary") else None
+        with self.lock:
+            self.file.seek(entry["offset"])
+            chunks = [self.next_frame(entry["codec"], dictionary) for _ in entry["frames"]]
+        data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        if self.cache is not None:
+            self.cache.put(self.place(entry), data)
+        return data
+
+    def prefetch(self, entries):
+        """Decode the entries into the cache in the background, nothing happens without a cache."""
+        if self.cache is not None:
+            self.cache.prefetch([(self, entry) for entry in entries])
+
+    def place(self, entry: dict) -> tuple:
+        """Key of the decoded entry in a cache, which may hold the entries of several packages, e.g. the volumes of a set."""
+        return (id(self),) + location(entry)
+
+    def read_frames(self, entry: dict):
+        """The frames of an entry as they are stored, to be decoded with decode_frames."""
+        with self.lock:
+            self.file.seek(entry["offset"])
+            with self.metrics.time("read", entry["length"]):
+                frames = self.file.read(entry["length"])
+        if len(frames) != entry["length"]:
+            raise RuntimeError("Unexpected end of package")
+        return frames
+
+    def decode_frames(self, entry: dict, frames):
+        """Decode the frames of an entry chunk by chunk.
+
+        Unlike read_entry, no scratch buffer is shared, so many entries can be decoded on
+        several threads at once.
+        """
+        dictionary = self.dictionary if entry.get("dictionary") else None
+        position = 0
+        with memoryview(frames) as view:
+            for length in entry["frames"]:
+                size, = struct.unpack_from(FRAME_FORMAT, view, position)
+                if size != length - FRAME_SIZE:
+                    raise RuntimeError("Frame length differs from the index")
+                with self.metrics.time("decrypt", size), view[position + FRAME_SIZE:position + length] as frame:
+                    plain = ac.decrypt_bytes(self.key, frame, self.mode)
+                position += length
+                start = time.perf_counter()
+                try:
+                    data = Compressor.inflate(plain, entry["codec"], dictionary)
+                except INFLATE_ERRORS as exc:
+                    raise RuntimeError(f"Cannot inflate frame: {exc}") from exc
+                self.metrics.add("inflate", time.perf_counter() - start, len(data))
+                yield data
+
+    def entries(self):
+        """Iterate over (folder, filename, entry) from the index alone."""
+        for folder, file_dict in self.index.items():
+            for filename, entry in file_dict.items():
+                yield folder, filename, entry
+
+    def read(self, folder: str, filename: str) -> bytes:
+        """Decode exactly one entry."""
+        return self.read_entry(self.index[folder][filename])
+
+    def open(self, folder: str, filename: str) -> "EntryReader":
+        """Open one entry as a seekable file object, see EntryReader."""
+        return EntryReader(self, self.index[folder][filename])
+
+    def dead_space(self) -> int:
+        """Bytes left behind by replaced entries and earlier indexes, reclaimed by compaction."""
+        self.file.seek(0, os.SEEK_END)
+        live = sum({location(entry): entry["length"] for _, _, entry in self.entries()}.values()) + self.index_length + self.locator[1]
+        return self.file.tell() - self.data_start - live
+
+    def unique_entries(self) -> dict:
+        """(folder, filename, entry) of every distinct content by its location, duplicates are listed once."""
+        unique = {}
+        for folder, filename, entry in self.entries():
+            unique.setdefault(location(entry), (folder, filename, entry))
+        return unique
+
+    def verify(self, workers: int = None, advance = None) -> dict:
+        """Check the tag of every frame against the frame and the index, without decoding any entry.
+
+        Frames are read in file order and checked on a thread pool, the hashing and the ciphers
+        release the GIL. advance(size) is called per distinct entry once its frames are read.
+        Returns the number of entries, frames and bytes checked and the list of failed frames as
+        (folder, filename, frame number, reason).
+        """
+        unique = self.unique_entries()
+        workers = workers or os.cpu_count() or 1
+        result = {"entries": len(unique), "frames": 0, "bytes": 0, "failed": []}
+        pending = deque()
+
+        def collect():
+            folder, filename, number, future = pending.popleft()
+            reason = future.result()
+            if reason:
+                result["failed"].append((folder, filename, number, reason))
+
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            for place in sorted(unique):
+                folder, filename, entry = unique[place]
+                self.file.seek(entry["offset"])
+                for number in range(len(entry["frames"])):
+                    try:
+                        frame = bytes(self.read_frame())
+                    except (RuntimeError, struct.error):
+                        result["failed"].append((folder, filename, number, "truncated"))
+                        break
+                    tag = entry["tags"][number * ac.TAG_SIZE:(number + 1) * ac.TAG_SIZE]
+                    pending.append((folder, filename, number, executor.submit(self.check_frame, frame, tag)))
+                    result["frames"] += 1
+                    result["bytes"] += len(frame)
+                    while len(pending) > workers * 2:
+                        collect()
+                if advance is not None:
+                    advance(entry["length"])
+            while pending:
+                collect()
+        return result
+
+    def check_frame(self, frame, tag: bytes) -> str:
+        if ac.frame_tag(frame) != tag:
+            return "tag differs from index"
+        if not ac.verify_frame(self.key, frame, self.mode):
+            return "authentication failed"
+        return None
+
+    def read_all(self, advance = None) -> dict:
+        """Decode every entry into the nested {folder: {file: bytes}} layout, calling advance(size) per entry.
+
+        Raises EntryError naming the first entry that cannot be decoded.
+        """
+        byte_dict = {folder: {} for folder in self.index}
+        decoded = {}
+        entries = [(location(entry), folder, filename, entry) for folder, filename, entry in self.entries()]
+        # decode in file order so the package is read front to back, duplicates share one decoded copy
+        for place, folder, filename, entry in sorted(entries, key = lambda item: item[0]):
+            if place not in decoded:
+                try:
+                    decoded[place] = self.read_entry(entry)
+                except (ValueError, RuntimeError) as exc:
+                    raise EntryError(folder, filename, str(exc)) from exc
+            byte_dict[folder][filename] = decoded[place]
+            if advance is not None:
+                advance(entry["size"])
+        return byte_dict
+
+
+class EntryReader(io.RawIOBase):
+    """Seekable, read-only file object of a single entry.
+
+    Every chunk of an entry is compressed and encrypted on its own, so a read only decodes the
+    chunks covering the requested range. The last decoded chunk is kept for the next read, which
+    makes sequential reads, and seeking around in a large media file, hold a single chunk in memory.
+    Entries written before the chunk size was recorded in the index are assumed to use the chunk
+    size of the package; if the chunks of such an entry turn out to differ, they are located by
+    decoding the entry once.
+
+    Reads raise ValueError if a chunk fails authentication and RuntimeError if it cannot be
+    inflated. With 'owned', closing the file also closes the reader.
+    """
+
+    def __init__(self, reader: ContainerReader, entry: dict, owned: bool = False):
+        super().__init__()
+        self.reader = reader
+        self.entry = entry
+        self.owned = owned
+        self.size: int = entry["size"]
+        self.position: int = 0
+        # file offset and plain offset of every chunk
+        self.offsets: list = []
+        offset = entry["offset"]
+        for length in entry["frames"]:
+            self.offsets.append(offset)
+            offset += length
+        chunk = entry.get("chunk")
+        self.starts: list = [number * (chunk or reader.chunk_size) for number in range(len(self.offsets))]
+        self.located: bool = chunk is not None
+        self.current: tuple = (None, b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self.position + offset
+        elif whence == os.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self.position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        view = memoryview(buffer).cast('B')
+        done = 0
+        while done < len(view) and self.position < self.size:
+            start, data = self.chunk_at(self.position)
+            skip = self.position - start
+            count = min(len(data) - skip, len(view) - done)
+            view[done:done + count] = data[skip:skip + count]
+            done += count
+            self.position += count
+        return done
+
+    def readall(self) -> bytes:
+        data = bytearray(max(self.size - self.position, 0))
+        return bytes(data[:self.readinto(data)])
+
+    def chunk_at(self, position: int) -> tuple:
+        """Plain offset and content of the chunk holding the position, decoded unless it is the current one."""
+        number = bisect.bisect_right(self.starts, position) - 1
+        if self.current[0] != number:
+            data = self.reader.read_chunk(self.entry, self.offsets[number])
+            end = self.starts[number + 1] if number + 1 < len(self.starts) else self.size
+            if len(data) != end - self.starts[number] or not data:
+                if self.located:
+                    raise RuntimeError("Chunk sizes do not match the index")
+                self.locate()
+                return self.chunk_at(position)
+            self.current = (number, data)
+        return self.starts[number], self.current[1]
+
+    def locate(self):
+        """Find the plain offset of every chunk by decoding them all once."""
+        start = 0
+        for number, offset in enumerate(self.offsets):
+            self.starts[number] = start
+            start += len(self.reader.read_chunk(self.entry, offset))
+        self.located = True
+        self.current = (None, b'')
+
+    def close(self):
+        if not self.closed:
+            self.current = (None, b'')
+            if self.owned:
+                self.reader.close()
+        super().close()
+
+
+class LazyEntry:
+    """Handle of an entry of a mapped package, decoded on access and only kept by the cache of its reader.
+
+    bytes(entry) and read() decode the whole entry, head() only its first chunk, open() returns
+    a seekable file object decoding only the chunks that are read, while len() is answered
+    from the index.
+    """
+
+    __slots__ = ("reader", "entry")
+
+    def __init__(self, reader: ContainerReader, entry: dict):
+        self.reader = reader
+        self.entry = entry
+
+    def __len__(self) -> int:
+        return self.entry["size"]
+
+    def __bytes__(self) -> bytes:
+        return self.read()
+
+    def read(self) -> bytes:
+        return self.reader.read_entry(self.entry)
+
+    def head(self) -> bytes:
+        return self.reader.read_head(self.entry)
+
+    def open(self) -> EntryReader:
+        return EntryReader(self.reader, self.entry)
+
+
+class MappedReader(ContainerReader):
+    """Reads a version 2 package through a read-only memory map of the package file.
+
+    Only the preamble and the index are read on open, frames are sliced out of the map when an
+    entry is decoded, so opening costs about the size of the index whatever the package size.
+    The map stays open until close(); the package must not be written to while it is open.
+    """
+
+    def __init__(self, path: str, offset: int, key, mode: int, compression: str, metrics: Metrics = None, cache: EntryCache = None):
+        self.handle = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.handle.fileno(), 0, access = mmap.ACCESS_READ)
+            self.map.seek(offset)
+            super().__init__(self.map, key, mode, compression, metrics = metrics, cache = cache)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_frame(self) -> memoryview:
+        position = self.map.tell()
+        length, = struct.unpack_from(FRAME_FORMAT, self.map, position)
+        start = position + FRAME_SIZE
+        if start + length > len(self.map):
+            raise RuntimeError("Unexpected end of package")
+        self.map.seek(start + length)
+        # a view on the map, the frame is decrypted straight out of the page cache
+        return memoryview(self.map)[start:start + length]
+
+    def read_frames(self, entry: dict):
+        # a view on the map, nothing is read before the frames are decoded
+        end = entry["offset"] + entry["length"]
+        if end > len(self.map):
+            raise RuntimeError("Unexpected end of package")
+        return memoryview(self.map)[entry["offset"]:end]
+
+    def lazy_dict(self) -> dict:
+        """The nested {folder: {file: LazyEntry}} layout, duplicates share one handle."""
+        handles = {}
+        byte_dict = {folder: {} for folder in self.index}
+        for folder, filename, entry in self.entries():
+            if location(entry) not in handles:
+                handles[location(entry)] = LazyEntry(self, entry)
+            byte_dict[folder][filename] = handles[location(entry)]
+        return byte_dict
+
+    def close(self):
+        if getattr(self, 'cache', None) is not None:
+            # a running prefetch holds a view on the map, and its entries belong to this package
+            self.cache.clear()
+        if getattr(self, 'map', None) is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # a view on the map is still alive somewhere, the map is unmapped once the last one is gone
+                pass
+            self.map = None
+        self.handle.close()
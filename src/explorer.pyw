@@ -1,6 +1,6 @@
-import base64
 import io
 import logging
+import multiprocessing
 import os
 import subprocess
 import time
@@ -11,9 +11,15 @@ from os.path import exists
 from tkinter import filedialog, simpledialog, messagebox, ttk
 from PIL import Image, ImageTk
 
-from packager import Packager, get_vpk_info
-from icon import EMBEDDED_ICON
-from utils import get_file_type, format_file_size, read_config, save_config, get_uniqueid, CREATE_NO_WINDOW, \
+from packager import Packager, PackageError, get_vpk_info
+from container import LazyEntry
+from bulk import BulkBuilder
+from jobs import Job, Cancelled
+from catalog import Catalog, CATALOG_PATH
+from argoncrypto import calibrate_argon, MEMORY_UNIT
+from compressor import CODECS
+from setup import get_icon
+from utils import get_file_type, detect_file_types, format_file_size, read_config, save_config, get_uniqueid, CREATE_NO_WINDOW, \
     create_config
 
 SIGNS = ("⇢ ", "🖼 ", "♬ ", "⍲ ", "📄 ", "？ ", "☆ ", "📂 ", "  ", "≯ ", "📦 ")
@@ -122,10 +128,7 @@ class PackageExplorer:
         """Build the main window."""
         self.stdout(f"build window")
         self.window = tk.Tk()
-        icon_data = base64.b64decode(EMBEDDED_ICON)
-        icon_image = Image.open(io.BytesIO(icon_data))
-        icon_image = icon_image.resize((32, 32))
-        self.ico = ImageTk.PhotoImage(icon_image)
+        self.ico = get_icon(self.window)
         self.window.iconphoto(True, self.ico)
         self.window.title("V Package Explorer | ..a project by VALKYTEQ")
         self.window.minsize(self.minimum_width, self.minimum_height)
@@ -195,9 +198,13 @@ class PackageExplorer:
         file_menu.add_separator()
         file_menu.add_command(label="Create...", command=self.ask_for_creation)
         file_menu.add_command(label="Create bulk...", command=self.ask_for_bulk_creation)
+        file_menu.add_command(label="Scan Packages...", command=self.scan_packages)
+        file_menu.add_command(label="Verify Packages...", command=self.verify_packages)
         file_menu.add_separator()
         file_menu.add_command(label="Save", command=self.save_package)
         file_menu.add_command(label="Save as...", command=self.save_as_package)
+        file_menu.add_command(label="Compact", command=self.compact_package)
+        file_menu.add_command(label="Verify", command=self.verify_package)
         file_menu.add_separator()
         file_menu.add_command(label="Show in Explorer", command=self.open_file_explorer)
         file_menu.add_separator()
@@ -214,6 +221,7 @@ class PackageExplorer:
         setting_menu.add_command(label="Compressor", command=self.ask_for_compressor)
         setting_menu.add_command(label="Encryption Key", command=self.ask_for_crypto_key)
         setting_menu.add_command(label="Encryption Mode", command=self.ask_for_encryption)
+        setting_menu.add_command(label="Calibrate KDF", command=self.ask_for_calibration)
         setting_menu.add_separator()
         setting_menu.add_command(label="Show Log", command=self.show_log)
 
@@ -313,15 +321,116 @@ class PackageExplorer:
     
     def clear_data(self):
         """Clear the data in the file explorer, preview and its info."""
+        self.clear_view()
+        self.ap.close()
+        self.ap.byte_dict = None
+        self.ap.index = None
+    
+    def clear_view(self):
+        """Clear the file explorer, preview and its info, the loaded package stays open."""
         self.file_listbox.delete(0, tk.END)
         self.file_infobox.delete(0, tk.END)
         self.folder_tree = []
         self.expanded_nodes = set()
-        self.ap.byte_dict = None
         self.image_label.config(text = "Preview Content", image = "")
         self.image_label.xw = 128
         self.image_label.yh = 15
     
+    def close_package(self):
+        """Show no package after it failed to open."""
+        self.clear_data()
+        self.set_preview_title()
+    
+    def show_package(self, *_):
+        """Show the folder tree of the loaded package."""
+        self.clear_view()
+        self.set_preview_title()
+        if self.ap.byte_dict is not None:
+            self.create_folder_tree()
+            self.populate_file_listbox()
+    
+    def run_job(self, title, target, *args, done = None, failed = None, **kwargs):
+        """Run a long operation on a worker thread behind a progress window, the main window stays responsive.
+        
+        The target is called with a 'progress' keyword, see jobs.Job. On success done is called with its
+        result on this thread, errors and cancellations are shown once the job has stopped and failed is
+        called, by default the package is shown as it is left.
+        """
+        self.stdout(f"run job {title}")
+        job = Job(target, *args, **kwargs).start()
+        
+        dialog = tk.Toplevel(self.window)
+        dialog.title(f"{title} | ..a project by VALKYTEQ")
+        dialog.iconphoto(True, self.ico)
+        dialog.resizable(False, False)
+        dialog.transient(self.window)
+        # the package must not be touched while the job works on it
+        dialog.grab_set()
+        
+        label = tk.Label(dialog, text = "Starting...", justify = "left", anchor = "w", width = 56)
+        label.grid(row = 0, column = 0, padx = 10, pady = 10)
+        bar = ttk.Progressbar(dialog, length = 380, maximum = 1.0)
+        bar.grid(row = 1, column = 0, padx = 10, pady = 5)
+        
+        def cancel():
+            job.cancel()
+            cancel_button.config(state = tk.DISABLED)
+            label.config(text = "Cancelling...")
+        
+        cancel_button = tk.Button(dialog, text = "Cancel", command = cancel, width = 10)
+        cancel_button.grid(row = 2, column = 0, padx = 5, pady = 5)
+        dialog.protocol("WM_DELETE_WINDOW", cancel)
+        
+        def poll():
+            if not job.done():
+                if not job.progress.cancelled:
+                    self.show_progress(job.progress, label, bar)
+                dialog.after(100, poll)
+                return
+            
+            dialog.grab_release()
+            dialog.destroy()
+            try:
+                result = job.result()
+            except Cancelled:
+                self.stdout(f"cancel job {title}")
+                messagebox.showinfo(f"{title} | Cancel", "Operation canceled.")
+                (failed or self.show_package)()
+            except PackageError as e:
+                logging.error(f"{title} | {str(e)}")
+                messagebox.showerror(e.title, str(e))
+                (failed or self.show_package)()
+            except Exception as e:
+                logging.error(f"An error occurred during {title.lower()}: {str(e)}")
+                messagebox.showerror(f"{title} Error", f"An error occurred during {title.lower()}: {str(e)}")
+                (failed or self.show_package)()
+            else:
+                if done is not None:
+                    done(result)
+        
+        poll()
+    
+    @staticmethod
+    def show_progress(progress, label, bar):
+        """Show files and bytes done and the remaining time of a job."""
+        state = progress.snapshot()
+        text = f"{state['stage']}...   {state['files_done']}"
+        if state["files_total"]:
+            text += f" of {state['files_total']}"
+        text += f" files"
+        if state["bytes_total"]:
+            text += f"   {format_file_size(state['bytes_done'])} of {format_file_size(state['bytes_total'])}"
+        if state["eta"] is not None:
+            text += f"   {int(state['eta'])} sec left"
+        label.config(text = text)
+        
+        fraction = progress.fraction()
+        if fraction is None:
+            bar.config(mode = "indeterminate")
+            bar.step(0.02)
+        else:
+            bar.config(mode = "determinate", value = fraction)
+    
     def set_preview_title(self):
         if self.preview_title_label is not None:
             text = "No Open Package" if self.ap.package is None else self.ap.package.split("/")[-1]
@@ -332,19 +441,20 @@ class PackageExplorer:
         self.popup_window.destroy()
         file_path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
         with open(file_path, "r") as file:
-            paths = [line.rstrip('\n') for line in file]
+            paths = [line.rstrip('\n') for line in file if line.strip()]
+        if not paths:
+            return
 
         self.stdout(f"open bulkfile {file_path}")
-        for path in paths:
-            self.ap.package = f"{path}.vpk"
-            self.ap.directory = path
-            self.ap.create_vpk()
-        
         self.clear_data()
-        self.ap.load()
-        self.set_preview_title()
-        self.create_folder_tree()
-        self.populate_file_listbox()
+        self.ap.package = f"{paths[-1]}.vpk"
+        
+        def build(progress = None):
+            builder = BulkBuilder((self.argon_key, self.argon_iv), self.config)
+            builder.build(paths, progress)
+            self.ap.load(lazy = True, progress = progress)
+        
+        self.run_job("Bulk Creation", build, done = self.show_package, failed = self.close_package)
     
     def open_file_explorer(self, targeted=False):
         """Open Windows File Explorer with the location of the VPK file."""
@@ -371,10 +481,7 @@ class PackageExplorer:
         if file_path:
             self.clear_data()
             self.ap.package = file_path
-            self.ap.load()
-            self.set_preview_title()
-            self.create_folder_tree()
-            self.populate_file_listbox()
+            self.run_job("Open Package", self.ap.load, lazy = True, done = self.show_package, failed = self.close_package)
     
     def export_package(self):
         """Export all data from the current open VPK package."""
@@ -388,22 +495,12 @@ class PackageExplorer:
             return
 
         self.stdout(f"export package {export_path}")
-        try:
-            for folder, file_dict in self.ap.byte_dict.items():
-                folder_path = os.path.join(export_path, folder)
-                os.makedirs(folder_path, exist_ok = True)
-                
-                for filename, data in file_dict.items():
-                    file_path = os.path.join(folder_path, filename)
-                    with open(file_path, "wb") as file:
-                        file.write(data)
-            
+        
+        def exported(_):
             messagebox.showinfo("Export Successful", "Package data exported successfully.")
             self.open_file_explorer(export_path)
-            
-        except Exception as e:
-            logging.error(f"An error occurred during export: {str(e)}")
-            messagebox.showerror("Export Error", f"An error occurred during export: {str(e)}")
+        
+        self.run_job("Export", self.ap.extract, export_path, done = exported, failed = lambda: None)
     
     def create_package(self):
         """Build a new package file from a directory."""
@@ -414,26 +511,127 @@ class PackageExplorer:
             self.clear_data()
             self.ap.package = f"{folder_path}.vpk"
             self.ap.directory = folder_path
-            self.ap.create_vpk()
-            self.set_preview_title()
-            self.create_folder_tree()
-            self.populate_file_listbox()
+            
+            def create(progress = None):
+                self.ap.create_vpk(progress)
+                self.ap.load(lazy = True, progress = progress)
+            
+            self.run_job("Create Package", create, done = self.show_package, failed = self.close_package)
 
     def save_package(self):
         if self.ap.byte_dict:
             if self.ap.package:
                 self.stdout(f"save package {self.ap.package}")
-                self.ap.save()
-                messagebox.showinfo("Package Saved", "The package has been saved successfully.")
-                self.clear_data()
-                self.ap.load()
-                self.set_preview_title()
-                self.create_folder_tree()
-                self.populate_file_listbox()
+                self.run_job("Save Package", self.save_and_load, done = self.show_saved)
         else:
             logging.error(f"There is no package data to save.")
             messagebox.showerror("Save Package Error", "There is no package data to save.")
 
+    def scan_packages(self):
+        """Update the package catalog with all packages below a directory."""
+        directory = filedialog.askdirectory(title = "Select Package Repository")
+        if not directory:
+            return
+        
+        self.stdout(f"scan packages {directory}")
+        
+        def scan(progress = None):
+            progress.start("Scanning")
+            # the catalog connection belongs to the thread that opens it
+            with Catalog(CATALOG_PATH, key = self.ap.get_key) as catalog:
+                return catalog.scan(directory, advance = progress.advance)
+        
+        def scanned(result):
+            messagebox.showinfo("Packages Scanned", f"{result['packages']} packages found, {result['read']} read, {result['removed']} removed from the catalog.")
+        
+        self.run_job("Scan Packages", scan, done = scanned, failed = lambda: None)
+    
+    def verify_package(self):
+        """Check the authentication tags of every chunk of the open package."""
+        if not self.ap.package or not exists(self.ap.package):
+            logging.error(f"There is no package to verify.")
+            messagebox.showerror("Verify Package Error", "There is no package to verify.")
+            return
+        
+        self.stdout(f"verify package {self.ap.package}")
+        
+        def verified(result):
+            if result["failed"]:
+                for folder, filename, number, reason in result["failed"]:
+                    logging.error(f"Verify   | {folder}/{filename} | chunk {number} | {reason}")
+                messagebox.showerror("Verify Package Error", f"{len(result['failed'])} of {result['frames']} chunks failed the verification, see the log.")
+                return
+            messagebox.showinfo("Package Verified", f"All {result['frames']} chunks of {result['entries']} files are authentic.")
+        
+        self.run_job("Verify Package", self.ap.verify, done = verified, failed = lambda: None)
+    
+    def verify_packages(self):
+        """Check the authentication tags of all packages below a directory."""
+        directory = filedialog.askdirectory(title = "Select Package Repository")
+        if not directory:
+            return
+        
+        self.stdout(f"verify packages {directory}")
+        checker = Packager((self.argon_key, self.argon_iv), self.config, key = self.ap.argonize)
+        
+        def verify(progress = None):
+            paths = [path for path, _, _ in Catalog.find(directory)]
+            progress.start("Verifying", len(paths), sum(os.path.getsize(path) for path in paths))
+            damaged = 0
+            for path in paths:
+                checker.package = path
+                try:
+                    result = checker.verify()
+                except Exception as e:
+                    logging.error(f"Verify   | {path} | {str(e)}")
+                    damaged += 1
+                else:
+                    for folder, filename, number, reason in result["failed"]:
+                        logging.error(f"Verify   | {path} | {folder}/{filename} | chunk {number} | {reason}")
+                    damaged += 1 if result["failed"] else 0
+                # packages are verified one after another, a cancellation stops before the next one
+                progress.advance(size = os.path.getsize(path))
+            return damaged, len(paths)
+        
+        def verified(result):
+            damaged, count = result
+            if damaged:
+                messagebox.showerror("Verify Packages Error", f"{damaged} of {count} packages failed the verification, see the log.")
+                return
+            messagebox.showinfo("Packages Verified", f"All {count} packages are authentic.")
+        
+        self.run_job("Verify Packages", verify, done = verified, failed = lambda: None)
+    
+    def compact_package(self):
+        """Rewrite the open package without the space left behind by earlier saves."""
+        if not self.ap.package or not exists(self.ap.package):
+            logging.error(f"There is no package to compact.")
+            messagebox.showerror("Compact Package Error", "There is no package to compact.")
+            return
+        
+        self.stdout(f"compact package {self.ap.package}")
+        
+        def compact(progress = None):
+            reclaimed = self.ap.compact(progress)
+            # compaction closes the memory map, the files are shown from the new package
+            self.ap.load(lazy = True, progress = progress)
+            return reclaimed
+        
+        def compacted(reclaimed):
+            self.show_package()
+            messagebox.showinfo("Package Compacted", f"The package has been compacted, {format_file_size(reclaimed)} reclaimed.")
+        
+        self.run_job("Compact Package", compact, done = compacted)
+    
+    def save_and_load(self, progress = None):
+        """Save the package and open it again, run as a job."""
+        self.ap.save(progress)
+        self.ap.load(lazy = True, progress = progress)
+    
+    def show_saved(self, _):
+        self.show_package()
+        messagebox.showinfo("Package Saved", "The package has been saved successfully.")
+    
     def save_as_package(self):
         if self.ap.byte_dict:
             filetypes = [("V Package Files", "*.vpk")]
@@ -441,13 +639,7 @@ class PackageExplorer:
             if file_path:
                 self.ap.package = file_path
                 self.stdout(f"save package as {self.ap.package}")
-                self.ap.save()
-                messagebox.showinfo("Package Saved", "The package has been saved successfully.")
-                self.clear_data()
-                self.ap.load()
-                self.set_preview_title()
-                self.create_folder_tree()
-                self.populate_file_listbox()
+                self.run_job("Save Package", self.save_and_load, done = self.show_saved)
         else:
             logging.error(f"There is no package data to save.")
             messagebox.showerror("Save Package Error", "There is no package data to save.")
@@ -477,6 +669,8 @@ class PackageExplorer:
                     self.toggle_folder(item)
                 # elif ".vpk" not in item[0]:
                 else:
+                    # the decoded contents are only kept by the cache of the package, not by the tree
+                    item = [item[0], item[1], self.get_item_data(item)]
                     try:
                         kind = self.display_file_info(item)
                     except TypeError:
@@ -709,41 +903,72 @@ class PackageExplorer:
     def insert_children_to_listbox(self, parent, children):
         """Insert the children items to the file explorer listbox."""
         index = self.file_listbox.get(0, tk.END).index(parent)
+        pending = []
         for child in children:
-            kind = get_file_type(child[2])
-            kind, app_type = kind.split("/")
-            
-            match kind:
-                case "audio":
-                    icon = "♬"
-                    
-                case "image":
-                    icon = "🖼"
-                    
-                case "application":
-                    match app_type:
-                        case "font" | "font-sfnt":
-                            icon = "⍲"
-                        case "octet-stream":
-                            icon = "📦"
-                        case _:
-                            logging.error(kind, app_type)
-                            icon = "？"
-                    
-                case "text":
-                    match app_type:
-                        case "plain":
-                            icon = "📄"
-                        case "html":
-                            icon = "≯"
-                        case _:
-                            logging.error(kind, app_type)
-                            icon = "？"
-                case _:
-                    logging.error(kind, app_type)
-                    icon = "？"
-            self.file_listbox.insert(index + 1, f"          {icon}   {child[0]}")
+            mime = self.get_item_mime(child)
+            if mime is None:
+                # detected in the background, the icon is replaced once the type is known
+                icon = "⋯"
+                pending.append((f"          {icon}   {child[0]}", lambda child = child: self.get_item_head(child)))
+            else:
+                icon = self.get_file_icon(mime)
+            self.file_listbox.insert(index + 1, f"          {icon}   {child[0]}")
             index += 1
+        if pending:
+            names = {line: line.split("   ", 2)[-1] for line, _ in pending}
+            detect_file_types(pending, lambda results: self.window.after(0, self.update_icons, results, names))
+        # the files of an opened folder are likely selected next
+        self.ap.prefetch([child[2] for child in children])
+
+    def update_icons(self, results, names):
+        """Replace the placeholder icons of listed children by the icons of their detected types."""
+        lines = list(self.file_listbox.get(0, tk.END))
+        for line, (mime, _) in results.items():
+            if line in lines:
+                index = lines.index(line)
+                self.file_listbox.delete(index)
+                self.file_listbox.insert(index, f"          {self.get_file_icon(mime)}   {names[line]}")
+
+    def get_item_mime(self, item):
+        """MIME type of a file item if it is known without detection, from the package index."""
+        if isinstance(item[2], LazyEntry):
+            return item[2].entry.get("mime")
+        return None
+
+    def get_file_icon(self, mime):
+        """Icon of a file in the listbox by its MIME type."""
+        kind, app_type = mime.split("/")
+        
+        match kind:
+            case "audio":
+                icon = "♬"
+                
+            case "image":
+                icon = "🖼"
+                
+            case "application":
+                match app_type:
+                    case "font" | "font-sfnt":
+                        icon = "⍲"
+                    case "octet-stream":
+                        icon = "📦"
+                    case _:
+                        logging.error(kind, app_type)
+                        icon = "？"
+                
+            case "text":
+                match app_type:
+                    case "plain":
+                        icon = "📄"
+                    case "html":
+                        icon = "≯"
+                    case _:
+                        logging.error(kind, app_type)
+                        icon = "？"
+            case _:
+                logging.error(kind, app_type)
+                icon = "？"
+        return icon
 
     def remove_children_from_listbox(self, parent, children):
         """Remove the children items from the file explorer listbox."""
@@ -765,7 +990,8 @@ class PackageExplorer:
         """Create the folder tree structure from the loaded data."""
         self.folder_tree = [[os.path.basename(self.ap.package), [], None]]
         for folder, file_dict in self.ap.byte_dict.items():
-            folder_parts = folder.split(os.sep)
+            # folders are keyed by their path with "/" on every system
+            folder_parts = folder.split("/")
             curr_level = self.folder_tree
             for i, part in enumerate(folder_parts):
                 child = next((x for x in curr_level if x[0] == part), None)
@@ -777,6 +1003,18 @@ class PackageExplorer:
                         child[1].append([filename, None, image_data])
                 curr_level = child[1]
 
+    def get_item_data(self, item) -> bytes:
+        """Contents of a file item, files of a lazily loaded package are decoded or taken from the cache."""
+        if isinstance(item[2], LazyEntry):
+            return item[2].read()
+        return item[2]
+
+    def get_item_head(self, item) -> bytes:
+        """First chunk of a file item, enough to tell its type without decoding the whole file."""
+        if isinstance(item[2], LazyEntry):
+            return item[2].head()
+        return item[2]
+
     def get_selected_item(self, selection):
         """Get the selected item from the folder tree."""
         for item in self.folder_tree:
@@ -805,11 +1043,7 @@ class PackageExplorer:
                 # file_extension = os.path.splitext(os.path.basename(file_path))[1].lower()
                 media_name = os.path.basename(file_path)
                 item[1].append([media_name, None, media_info])
-                if self.ap.byte_dict is None:
-                    self.ap.byte_dict = {folder_name: {}}
-                elif folder_name not in self.ap.byte_dict:
-                    self.ap.byte_dict[folder_name] = {}
-                self.ap.byte_dict[folder_name][media_name] = media_info
+                self.ap.stage(folder_name, media_name, media_info)
                 self.file_listbox.insert(tk.END, f"          ⇢   {media_name}")
                 break
 
@@ -833,6 +1067,7 @@ class PackageExplorer:
                 self.file_listbox.insert(tk.END, f"  📦   New...")
             new_folder = [folder_name, [], None]
             self.folder_tree.append(new_folder)
+            self.ap.stage_folder(folder_name)
             self.file_listbox.insert(tk.END, f"      📂   {folder_name}")
 
     def ask_for_folder_name(self):
@@ -938,11 +1173,36 @@ class PackageExplorer:
         self.stdout(f"change encryption {encryption}")
         messagebox.showinfo("VPK Settings | Success", "The encryption method has been changed successfully.")
     
+    def ask_for_calibration(self):
+        self.stdout(f"calibrate kdf")
+        
+        def calibrate(progress = None):
+            progress.start("Calibrating")
+            return calibrate_argon(check = progress.check)
+        
+        self.run_job("Calibrate KDF", calibrate, done = self.apply_calibration, failed = lambda: None)
+    
+    def apply_calibration(self, params):
+        text = f"Time Cost: {params['time_cost']}\nMemory Cost: {params['memory_cost'] * MEMORY_UNIT} KiB\nParallelism: {params['parallelism']}\n"
+        text += f"Derivation Time: {params['seconds']:.2f} sec\n\nUse these Argon2 parameters for new packages?"
+        if not messagebox.askyesno("VPK Settings | Calibrate KDF", text):
+            self.stdout(f"calibrate kdf | cancel")
+            return
+        
+        self.config['ArgonCrypto']['time_cost'] = params['time_cost']
+        self.config['ArgonCrypto']['memory_cost'] = params['memory_cost']
+        self.config['ArgonCrypto']['parallelism'] = params['parallelism']
+        save_config(r".\settings.argon", self.config)
+        argonize = (self.argon_key, self.argon_iv)
+        self.ap = Packager(argonize, self.config)
+        self.stdout(f"calibrate kdf | {params}")
+        messagebox.showinfo("VPK Settings | Success", "The Argon2 parameters have been changed successfully.\nExisting packages keep their own parameters.")
+    
     def ask_for_compressor(self):
         title = "VPK Settings | Compressor"
         text = "Choose a compressor do compress and deflate packages.\n"
         text += "The higher compression ration, the slower the time."
-        dropdown = ['Gzip (Balanced)', 'ZSTD (Balanced)', 'Bzip2 (Slow)', 'LZMA (Slow)', 'LZ4 (Fast)']
+        dropdown = ['Gzip (Balanced)', 'ZSTD (Balanced)', 'Bzip2 (Slow)', 'LZMA (Slow)', 'LZ4 (Fast)', 'LZ4HC (Balanced)']
         self.build_popup_window(title, text, self.set_compressor, udown = dropdown)
     
     def set_compressor(self, compressor):
@@ -952,7 +1212,7 @@ class PackageExplorer:
             self.stdout(f"change encryption {compressor}")
             messagebox.showinfo("VPK Settings | Cancel", "Operation canceled.\nThe compression method has not been changed.")
             return
-        elif compressor == "" or compressor not in ['gzip', 'zstd', 'bzip2', 'lzma', 'lz4']:
+        elif compressor == "" or compressor not in CODECS:
             logging.error(f"change encryption {compressor}")
             messagebox.showerror("VPK Settings | Error", "The author name must not be empty and not greater than 16!")
             return
@@ -978,6 +1238,8 @@ class PackageExplorer:
             
 
 if __name__ == "__main__":
+    # the frozen exe is started again for every worker of a process pool, which must not open the GUI
+    multiprocessing.freeze_support()
     logging.basicConfig(
         level = logging.INFO,
         format = "[%(asctime)s] [%(levelname)s] %(message)s",
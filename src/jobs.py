@@ -0,0 +1,131 @@
+import threading
+import time
+
+
+class Cancelled(Exception):
+    """Raised inside a job once its cancellation was requested."""
+
+
+class Progress:
+    """Progress of a running job, shared between the worker and whoever watches it.
+
+    The worker announces the totals with start() and reports every finished file with advance(),
+    which also raises Cancelled once cancel() was called from any other thread. The optional
+    callback is called on the worker thread with a snapshot after every step.
+    """
+
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.stage: str = ""
+        self.files_done: int = 0
+        self.files_total: int = 0
+        self.bytes_done: int = 0
+        self.bytes_total: int = 0
+        self.started: float = time.perf_counter()
+
+    def start(self, stage: str, files: int = 0, size: int = 0):
+        """Begin a stage of the job, totals of 0 mean the amount of work is unknown."""
+        with self.lock:
+            self.stage = stage
+            self.files_done, self.files_total = 0, files
+            self.bytes_done, self.bytes_total = 0, size
+            self.started = time.perf_counter()
+        self.check()
+        self.notify()
+
+    def advance(self, files: int = 1, size: int = 0, check: bool = True):
+        """Count finished work, check = False reports work that must not be lost to a cancellation."""
+        with self.lock:
+            self.files_done += files
+            self.bytes_done += size
+        if check:
+            self.check()
+        self.notify()
+
+    def notify(self):
+        if self.callback is not None:
+            self.callback(self.snapshot())
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def check(self):
+        """Raise Cancelled if the job should stop, called between two units of work."""
+        if self.event.is_set():
+            raise Cancelled(f"{self.stage or 'Job'} was cancelled")
+
+    def eta(self) -> float:
+        """Seconds until the stage is done at the throughput so far, None while it cannot be told."""
+        with self.lock:
+            done, total = (self.bytes_done, self.bytes_total) if self.bytes_total else (self.files_done, self.files_total)
+            elapsed = time.perf_counter() - self.started
+        if not total or not done:
+            return None
+        return max(elapsed * (total - done) / done, 0.0)
+
+    def fraction(self) -> float:
+        with self.lock:
+            if self.bytes_total:
+                return min(self.bytes_done / self.bytes_total, 1.0)
+            if self.files_total:
+                return min(self.files_done / self.files_total, 1.0)
+        return None
+
+    def snapshot(self) -> dict:
+        eta = self.eta()
+        with self.lock:
+            return {
+                "stage": self.stage,
+                "files_done": self.files_done, "files_total": self.files_total,
+                "bytes_done": self.bytes_done, "bytes_total": self.bytes_total,
+                "elapsed": time.perf_counter() - self.started, "eta": eta,
+            }
+
+
+class Job:
+    """Runs a function on a worker thread.
+
+    The function gets the Progress of the job as its 'progress' keyword. The outcome is kept
+    until it is collected with result(), which re-raises the error of a failed or cancelled job,
+    so nothing about the job needs to be touched from the worker thread by the caller.
+    """
+
+    def __init__(self, target, *args, callback = None, **kwargs):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.progress = Progress(callback)
+        self.value = None
+        self.error: BaseException = None
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def start(self) -> "Job":
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.value = self.target(*self.args, progress = self.progress, **self.kwargs)
+        except BaseException as exc:
+            self.error = exc
+
+    def cancel(self):
+        self.progress.cancel()
+
+    def done(self) -> bool:
+        return self.thread.ident is not None and not self.thread.is_alive()
+
+    def result(self, timeout: float = None):
+        """Wait for the job and return what the function returned, or raise what it raised."""
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise TimeoutError("The job is still running")
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -0,0 +1,251 @@
+import io
+import struct
+from collections.abc import Mapping
+from hashlib import blake2b
+
+# Binary layout of the entry index of a version 2 package, all integers little endian:
+#
+#   header   MANIFEST_FORMAT: magic, layout version, number of folders, entries, records and
+#            slots, size of the string table and size of the blob
+#   folders  FOLDER_FORMAT per folder in index order: name (offset and length in the string
+#            table), number of its first entry and its entry count
+#   entries  ENTRY_FORMAT per file, grouped by folder in index order: folder number, name and
+#            number of its record
+#   records  RECORD_FORMAT per distinct content, shared by duplicates: offset, length and plain
+#            size of its frames, chunk size, frame count, offset of its frame lengths and tags in
+#            the blob, length of the tags, codec and MIME type in the string table, FLAG_* bits
+#            and the BLAKE2b content hash
+#   slots    SLOT_FORMAT per slot of an open addressing table of the paths, entry number + 1
+#            at the slot of path_hash(folder, name), 0 marks a free slot; a power of two
+#   strings  UTF-8 folder and file names, codecs and MIME types
+#   blob     per record the '<I' lengths of its frames followed by their tags
+#
+# The index is read straight from the decoded buffer: folders, entries and records are
+# unpacked when they are looked up, a file is found by its path in constant time.
+MANIFEST_MAGIC = b'VIDX'
+MANIFEST_VERSION = 1
+MANIFEST_FORMAT = '<4sHIIIIQQ'
+MANIFEST_SIZE = struct.calcsize(MANIFEST_FORMAT)
+FOLDER_FORMAT = '<IIII'  # name offset, name length, first entry, entry count
+FOLDER_SIZE = struct.calcsize(FOLDER_FORMAT)
+ENTRY_FORMAT = '<IIII'  # folder, name offset, name length, record
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+RECORD_FORMAT = '<QQQIIQIIHIHB32s'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+SLOT_FORMAT = '<I'
+SLOT_SIZE = struct.calcsize(SLOT_FORMAT)
+
+FLAG_HASH = 1
+FLAG_DICTIONARY = 2
+FLAG_CHUNK = 4
+FLAG_MIME = 8
+
+
+def path_hash(folder: bytes, name: bytes) -> int:
+    return int.from_bytes(blake2b(folder + b'\0' + name, digest_size = 8).digest(), 'little')
+
+
+def pack_manifest(index: dict) -> bytes:
+    """Serialize a {folder: {file: entry}} index into the manifest layout."""
+    strings = bytearray()
+    interned = {}
+
+    def string(text: str) -> tuple:
+        if text not in interned:
+            data = text.encode('utf-8')
+            interned[text] = (len(strings), len(data))
+            strings.extend(data)
+        return interned[text]
+
+    folders, entries, records, paths = [], [], [], []
+    blob = bytearray()
+    # duplicates share one entry record in the index, and one record in the manifest
+    numbers = {}
+    for folder, file_dict in index.items():
+        folder_name = string(folder)
+        folders.append(struct.pack(FOLDER_FORMAT, *folder_name, len(entries), len(file_dict)))
+        for filename, entry in file_dict.items():
+            if id(entry) not in numbers:
+                numbers[id(entry)] = len(records)
+                records.append(pack_record(entry, blob, string))
+            paths.append(path_hash(folder.encode('utf-8'), filename.encode('utf-8')))
+            entries.append(struct.pack(ENTRY_FORMAT, len(folders) - 1, *string(filename), numbers[id(entry)]))
+
+    slot_count = 1
+    while slot_count < 2 * len(entries):
+        slot_count *= 2
+    slots = [0] * slot_count
+    for number, path in enumerate(paths):
+        slot = path & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = number + 1
+
+    out = io.BytesIO()
+    out.write(struct.pack(MANIFEST_FORMAT, MANIFEST_MAGIC, MANIFEST_VERSION, len(folders), len(entries), len(records), slot_count, len(strings), len(blob)))
+    for table in (folders, entries, records):
+        out.write(b''.join(table))
+    out.write(struct.pack(f'<{slot_count}I', *slots))
+    out.write(strings)
+    out.write(blob)
+    return out.getvalue()
+
+
+def pack_record(entry: dict, blob: bytearray, string) -> bytes:
+    flags = 0
+    if "hash" in entry:
+        flags |= FLAG_HASH
+    if entry.get("dictionary"):
+        flags |= FLAG_DICTIONARY
+    if "chunk" in entry:
+        flags |= FLAG_CHUNK
+    if entry.get("mime") is not None:
+        flags |= FLAG_MIME
+    start = len(blob)
+    blob.extend(struct.pack(f'<{len(entry["frames"])}I', *entry["frames"]))
+    blob.extend(entry["tags"])
+    return struct.pack(
+        RECORD_FORMAT, entry["offset"], entry["length"], entry["size"], entry.get("chunk", 0), len(entry["frames"]),
+        start, len(entry["tags"]), *string(entry["codec"]), *string(entry.get("mime") or ""), flags, entry.get("hash", b''),
+    )
+
+
+class Manifest(Mapping):
+    """Read-only {folder: {file: entry}} view of a manifest, decoding only what is looked up.
+
+    Entries are the same dicts the writer put into the index, made once per record and shared
+    by duplicates. Writers appending to a package take a mutable copy with to_dict().
+    Raises RuntimeError if the manifest is malformed.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        try:
+            magic, version, folders, entries, records, slots, strings, blob = struct.unpack_from(MANIFEST_FORMAT, self.data)
+        except struct.error:
+            raise RuntimeError("The package index is truncated")
+        if magic != MANIFEST_MAGIC:
+            raise RuntimeError("The package index is not a manifest")
+        if version != MANIFEST_VERSION:
+            raise RuntimeError(f"Unsupported package index layout {version}")
+        self.entry_count, self.record_count, self.slot_count = entries, records, slots
+        self.folders_start = MANIFEST_SIZE
+        self.entries_start = self.folders_start + folders * FOLDER_SIZE
+        self.records_start = self.entries_start + entries * ENTRY_SIZE
+        self.slots_start = self.records_start + records * RECORD_SIZE
+        self.strings_start = self.slots_start + slots * SLOT_SIZE
+        self.blob_start = self.strings_start + strings
+        if self.blob_start + blob != len(self.data) or slots & (slots - 1):
+            raise RuntimeError("The package index is damaged")
+        # folder name -> (number, first entry, entry count), folders are few compared to files
+        self.folders: dict = {}
+        for number in range(folders):
+            offset, length, first, count = struct.unpack_from(FOLDER_FORMAT, self.data, self.folders_start + number * FOLDER_SIZE)
+            self.folders[self.string(offset, length)] = (number, first, count)
+        self.records: dict = {}
+
+    def string(self, offset: int, length: int) -> str:
+        start = self.strings_start + offset
+        return str(self.data[start:start + length], 'utf-8')
+
+    def __getitem__(self, folder: str) -> "ManifestFolder":
+        return ManifestFolder(self, folder, *self.folders[folder])
+
+    def __iter__(self):
+        return iter(self.folders)
+
+    def __contains__(self, folder) -> bool:
+        return folder in self.folders
+
+    def __len__(self) -> int:
+        return len(self.folders)
+
+    def entry(self, number: int) -> tuple:
+        """Folder number, name and record number of an entry."""
+        folder, offset, length, record = struct.unpack_from(ENTRY_FORMAT, self.data, self.entries_start + number * ENTRY_SIZE)
+        return folder, self.string(offset, length), record
+
+    def lookup(self, folder: int, folder_name: str, filename: str) -> dict:
+        if not self.slot_count:
+            raise KeyError(filename)
+        name = filename.encode('utf-8')
+        mask = self.slot_count - 1
+        slot = path_hash(folder_name.encode('utf-8'), name) & mask
+        while True:
+            number, = struct.unpack_from(SLOT_FORMAT, self.data, self.slots_start + slot * SLOT_SIZE)
+            if not number:
+                raise KeyError(filename)
+            entry_folder, offset, length, record = struct.unpack_from(ENTRY_FORMAT, self.data, self.entries_start + (number - 1) * ENTRY_SIZE)
+            start = self.strings_start + offset
+            if entry_folder == folder and self.data[start:start + length] == name:
+                return self.record(record)
+            slot = (slot + 1) & mask
+
+    def record(self, number: int) -> dict:
+        entry = self.records.get(number)
+        if entry is not None:
+            return entry
+        offset, length, size, chunk, frames, blob, tags, codec, codec_length, mime, mime_length, flags, digest = struct.unpack_from(RECORD_FORMAT, self.data, self.records_start + number * RECORD_SIZE)
+        start = self.blob_start + blob
+        entry = {
+            "offset": offset,
+            "length": length,
+            "size": size,
+            "codec": self.string(codec, codec_length),
+            "frames": list(struct.unpack_from(f'<{frames}I', self.data, start)),
+            "tags": bytes(self.data[start + frames * 4:start + frames * 4 + tags]),
+        }
+        if flags & FLAG_HASH:
+            entry["hash"] = digest
+        if flags & FLAG_DICTIONARY:
+            entry["dictionary"] = True
+        if flags & FLAG_CHUNK:
+            entry["chunk"] = chunk
+        if flags & FLAG_MIME:
+            entry["mime"] = self.string(mime, mime_length)
+        return self.records.setdefault(number, entry)
+
+    def to_dict(self) -> dict:
+        return {folder: dict(file_dict.items()) for folder, file_dict in self.items()}
+
+
+class ManifestFolder(Mapping):
+    """The files of one folder of a Manifest."""
+
+    def __init__(self, manifest: Manifest, name: str, number: int, first: int, count: int):
+        self.manifest = manifest
+        self.name = name
+        self.number = number
+        self.first = first
+        self.count = count
+
+    def __getitem__(self, filename: str) -> dict:
+        return self.manifest.lookup(self.number, self.name, filename)
+
+    def __iter__(self):
+        for number in range(self.first, self.first + self.count):
+            yield self.manifest.entry(number)[1]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def items(self) -> list:
+        # one pass over the entry table instead of a lookup per name
+        items = []
+        for number in range(self.first, self.first + self.count):
+            _, filename, record = self.manifest.entry(number)
+            items.append((filename, self.manifest.record(record)))
+        return items
+
+    def values(self) -> list:
+        return [entry for _, entry in self.items()]
+
+
+def load_index(data) -> Manifest:
+    """The index of a version 2 package, raises RuntimeError for anything but a manifest."""
+    return Manifest(data)
+
+
+def editable(index) -> dict:
+    """A mutable {folder: {file: entry}} index, copied from a Manifest."""
+    return index.to_dict() if isinstance(index, Manifest) else index
@@ -0,0 +1,171 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# stages of the pipelines in the order they are reported
+STAGES = ["kdf", "walk", "read", "hash", "detect", "serialize", "compress", "encrypt", "wait", "write", "decrypt", "inflate", "deserialize"]
+
+
+class Metrics:
+    """Time, bytes and calls per stage of the pack and load pipelines.
+
+    Stages are timed where the work happens, so the seconds of stages run on pool workers
+    (compress and encrypt of a parallel writer) add up over all workers and may exceed the wall
+    time of the run. 'wait' is the time the writer blocked on its workers.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: dict = {}
+        self.started: float = time.perf_counter()
+        self.wall: float = None
+        self.profile: dict = None
+
+    def add(self, stage: str, seconds: float, size: int = 0, calls: int = 1):
+        with self.lock:
+            record = self.stages.setdefault(stage, [0.0, 0, 0])
+            record[0] += seconds
+            record[1] += size
+            record[2] += calls
+
+    @contextmanager
+    def time(self, stage: str, size: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, size)
+
+    def finish(self) -> "Metrics":
+        """Record the wall time of the run so far."""
+        self.wall = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            order = sorted(self.stages, key = lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES))
+            stages = {
+                stage: {
+                    "seconds": self.stages[stage][0], "bytes": self.stages[stage][1], "calls": self.stages[stage][2],
+                    "mbps": self.stages[stage][1] / self.stages[stage][0] / 1024 / 1024 if self.stages[stage][1] and self.stages[stage][0] else None,
+                }
+                for stage in order
+            }
+            result = {"wall_seconds": self.wall, "stages": stages}
+        if self.profile is not None:
+            result["profile"] = self.profile
+        return result
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent = indent)
+
+    def to_prometheus(self, prefix: str = "vpk", labels: dict = None) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        base = ",".join(f'{name}="{escape_label(value)}"' for name, value in (labels or {}).items())
+        data = self.to_dict()
+        lines = []
+        for metric, field, text in [("stage_seconds_total", "seconds", "Seconds spent per stage"), ("stage_bytes_total", "bytes", "Bytes processed per stage"), ("stage_calls_total", "calls", "Calls per stage")]:
+            lines.append(f"# HELP {prefix}_{metric} {text}.")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for stage, record in data["stages"].items():
+                lines.append(f'{prefix}_{metric}{{{base + "," if base else ""}stage="{stage}"}} {record[field]}')
+        if data["wall_seconds"] is not None:
+            lines.append(f"# TYPE {prefix}_wall_seconds gauge")
+            lines.append(f"{prefix}_wall_seconds{{{base}}} {data['wall_seconds']}")
+        if data.get("profile", {}).get("peak_bytes") is not None:
+            lines.append(f"# TYPE {prefix}_traced_peak_bytes gauge")
+            lines.append(f"{prefix}_traced_peak_bytes{{{base}}} {data['profile']['peak_bytes']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, labels: dict = None):
+        """Write the metrics to a file, in the Prometheus text format for '.prom' files and as JSON otherwise."""
+        text = self.to_prometheus(labels = labels) if path.endswith(".prom") else self.to_json()
+        with open(path, "w") as file:
+            file.write(text)
+
+    def summary(self) -> str:
+        """One line of the seconds per stage, for the log."""
+        return " | ".join(f"{stage} {record['seconds']:.2f}s" for stage, record in self.to_dict()["stages"].items())
+
+
+class NullMetrics(Metrics):
+    """Metrics that record nothing, the default of the writers and readers."""
+
+    def add(self, stage: str, seconds: float, size: int = 0, calls: int = 1):
+        pass
+
+    def time(self, stage: str, size: int = 0):
+        return nullcontext()
+
+
+NULL_METRICS = NullMetrics()
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# tracemalloc is global to the process, captures that overlap (e.g. the packages of a bulk build) share one session
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_tracing_started = False
+
+
+def start_tracing():
+    """Start tracing allocations for one more capture, unless they are traced already."""
+    global _tracing_runs, _tracing_started
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_runs += 1
+
+
+def stop_tracing(top: int) -> dict:
+    """The peak and the top allocations so far, tracing stops with the last capture that started it."""
+    global _tracing_runs, _tracing_started
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+    return {"peak_bytes": peak, "allocations": [str(statistic) for statistic in snapshot.statistics("lineno")[:top]]}
+
+
+@contextmanager
+def capture(metrics: Metrics, profile: str = None, memory: bool = False, top: int = 15):
+    """Opt-in cProfile and tracemalloc capture around a run.
+
+    With 'profile' the run is profiled and the statistics are written to that path, for pstats or
+    snakeviz, and the slowest functions by cumulative time are added to the metrics. With 'memory'
+    the peak of traced allocations and the lines allocating the most are added. Both slow the run
+    down considerably, the stage times of a captured run are not comparable to others. Runs captured
+    at the same time share the tracing, their peaks and allocations include those of the others.
+    """
+    profiler = cProfile.Profile() if profile else None
+    if memory:
+        start_tracing()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        result = {}
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream = text).sort_stats("cumulative").print_stats(top)
+            result["profile_path"] = profile
+            result["functions"] = [line for line in text.getvalue().splitlines() if line.strip()][-top:]
+        if memory:
+            result.update(stop_tracing(top))
+        metrics.profile = result
@@ -1,19 +1,86 @@
-import gzip
+import io
 import logging
+import ntpath
 import os
 import pickle
+import re
+import shutil
 import struct
 import time
-import _lzma
-import zstandard as zstd
-from tkinter import messagebox
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing, contextmanager, nullcontext
+from hashlib import blake2b
 
 
 import argoncrypto as ac
-from utils import get_file_data
-from compressor import Compressor
+from utils import get_file_data, get_file_type, detect_file_type
+from compressor import Compressor, CODECS, SAMPLE_SIZE, DICTIONARY_SIZE
+from container import ContainerWriter, ContainerReader, MappedReader, LazyEntry, EntryReader, EntryCache, EntryError, BlobStore, CHUNK_SIZE, CACHE_BUDGET, V2_MAGIC, dedup_ratio
+from jobs import Job, Progress
+from metrics import Metrics, capture
+from volumes import VOLUMES_VERSION, VOLUMES_MAGIC, volume_path, split_volumes, volume_digest, merge_volumes, write_table, read_table, load_volumes
 
 HEADER_FORMAT = '16s22sI16s17sI7sII5s'  # Example format: 16 bytes for name, 32 bytes for description, 4 bytes for size
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+VPK_VERSION = 2
+# frames and decoded chunks held by a running extraction at most
+EXTRACT_BUDGET = 256 * 1024 * 1024
+
+
+class PackageError(Exception):
+    """A package cannot be read or written, with a title for whoever shows the message to a user."""
+
+    def __init__(self, title: str, message: str):
+        super().__init__(message)
+        self.title = title
+
+
+class PayloadUnpickler(pickle.Unpickler):
+    """Unpickler of the payloads of version 1 packages, which never hold anything but builtin data."""
+
+    def find_class(self, module: str, name: str):
+        if (module, name) == ("builtins", "bytearray"):
+            return bytearray
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a package")
+
+
+def load_pickle(data):
+    return PayloadUnpickler(io.BytesIO(data)).load()
+
+
+def damaged(path: str) -> PackageError:
+    """Error of a file that cannot be decoded although the index of its package could, the key is right and the file is damaged."""
+    return PackageError("VPK Package | Error", f"The file {path} of this package is damaged!")
+
+
+def get_kdf(config: dict) -> tuple:
+    """Argon2 time cost, memory cost and parallelism configured for new packages."""
+    settings = config['ArgonCrypto']
+    time_cost, memory_cost, parallelism = ac.ARGON_DEFAULTS
+    return settings.get('time_cost', time_cost), settings.get('memory_cost', memory_cost), settings.get('parallelism', parallelism)
+
+
+def check_package(file, info) -> str:
+    """Reason why a package cannot be decoded, or None. Reads nothing but the preamble magic."""
+    version = info[8]
+    encryption = info[6].decode('utf-8', 'replace').upper()
+    compression = info[9].decode('utf-8', 'replace').replace("\00", "")
+    if version not in (1, VPK_VERSION, VOLUMES_VERSION):
+        return f"The package version {version} is not supported!"
+    if encryption not in ac.MODES:
+        return f"The encryption {encryption} of this package is not supported!"
+    if compression not in CODECS:
+        return f"The compression {compression} of this package is not supported!"
+    if version >= 2:
+        # a volume set starts with the preamble of its master, its volumes are version 2 packages
+        expected = VOLUMES_MAGIC if version == VOLUMES_VERSION else V2_MAGIC
+        position = file.tell()
+        magic = file.read(len(expected))
+        file.seek(position)
+        if magic != expected:
+            return f"The package is damaged, its version {version} preamble is missing!"
+    return None
 
 
 def get_vpk_info(data, bin=False):
@@ -31,105 +98,1047 @@ def get_vpk_info(data, bin=False):
     return filename.decode(), fileinfo.decode(), filesize, author.decode(), copyright.decode(), timestamp, encryption.decode(), key_length, version, compression.decode()
 
 class Packager:
-    def __init__(self, argonize: tuple, config: dict):
+    def __init__(self, argonize: tuple, config: dict, key: bytes = None):
         self.timestamp = None
+        self.stats: dict = None
         self.byte_dict: dict = None
+        self.index: dict = None
+        self.loaded: str = None
+        # memory map of the package while it is loaded lazily, or those of the volumes of a set
+        self.mapped: MappedReader = None
+        self.volumes: list = []
+        # volume table of the volume set on disk, None for a single package
+        self.table: dict = None
+        self.changes: dict = {}
+        self.removed: set = set()
         self.directory: str = None
         self.package: str = None
         self.config: dict = config
-        self.argonize = ac.generate_argon_key(argonize[0], argonize[1])
+        self.secret, self.salt = argonize
+        self.kdf: tuple = get_kdf(config)
+        # timings of the stages of the runs of this packager, the key derivation counts towards the first run
+        self.metrics: Metrics = Metrics()
+        # a key derived once can be shared by many packagers, e.g. for bulk creation
+        self.argonize: bytes = key
+        if self.argonize is None:
+            with self.metrics.time("kdf"):
+                self.argonize = self.get_key(self.kdf)
         
-    def read_files(self) -> int:
+        # optional settings, configs created before version 2 packages do not carry them
+        settings = self.config.get('Packager', {})
+        self.version: int = settings.get('version', VPK_VERSION)
+        self.chunk_size: int = settings.get('chunk_size', CHUNK_SIZE)
+        self.workers: int = settings.get('workers', 1)
+        self.pool: str = settings.get('pool', 'thread')
+        # optional per entry codec selection, the configured mode stays the codec of small compressible entries
+        self.adaptive: bool = self.config['Compressor'].get('adaptive', False)
+        self.fast_codec: str = self.config['Compressor'].get('fast', 'lz4')
+        # optional level and thread count of the configured codec, the codec defaults otherwise
+        self.level: int = self.config['Compressor'].get('level')
+        self.threads: int = self.config['Compressor'].get('threads', 0)
+        # encoded content shared with other packagers of a bulk build
+        self.store: BlobStore = None
+        # zstd dictionary shared by a family of packages, trained per package if not given
+        self.dictionary: bytes = None
+        # optional exports of the metrics of every run: a '.prom' file in the Prometheus text format or JSON,
+        # a cProfile dump and the peak memory of traced allocations
+        self.metrics_path: str = settings.get('metrics')
+        self.profile_path: str = settings.get('profile')
+        self.trace_memory: bool = settings.get('trace_memory', False)
+        # record the MIME type of every entry in the index, detected with libmagic
+        self.detect_types: bool = settings.get('detect_types', True)
+        self.extract_workers: int = settings.get('extract_workers', os.cpu_count() or 1)
+        self.extract_budget: int = settings.get('extract_budget', EXTRACT_BUDGET)
+        # decoded entries of a lazily loaded package kept for browsing, 0 turns the cache off
+        cache_budget = settings.get('cache_budget', CACHE_BUDGET)
+        self.cache: EntryCache = EntryCache(cache_budget) if cache_budget else None
+        # new packages larger than this many bytes of files are split into a volume set, 0 keeps them in one file
+        self.volume_size: int = settings.get('volume_size', 0)
+        self.volume_workers: int = settings.get('volume_workers', os.cpu_count() or 1)
+    
+    def walk_files(self):
         # Iterate through each file and sub-folder in the directory
-        found_files = 0
-        for root, _, files in os.walk(self.directory):
-            for filename in files:
+        parent = os.path.dirname(os.path.normpath(self.directory))
+        for root, dirs, files in os.walk(self.directory):
+            # walk in a fixed order, so the same directory always gives the same package layout
+            dirs.sort()
+            # folders are keyed by their path from the parent of the directory, so sub-folders of the same name never collide
+            folder_name = os.path.relpath(root, parent).replace(os.sep, "/")
+            for filename in sorted(files):
                 # file_extension = os.path.splitext(filename)[1].lower()
-                file_path = os.path.join(root, filename)
-                
-                folder_name = os.path.basename(root)
-                file_dict = self.byte_dict.setdefault(folder_name, {})
-                
-                file_dict[filename] = get_file_data(file_path)
-                found_files += 1
+                yield folder_name, filename, os.path.join(root, filename)
+        
+    def read_files(self, progress: Progress = None) -> int:
+        found_files = 0
+        for folder_name, filename, file_path in self.walk_files():
+            file_dict = self.byte_dict.setdefault(folder_name, {})
+            
+            start = time.perf_counter()
+            file_dict[filename] = get_file_data(file_path)
+            self.metrics.add("read", time.perf_counter() - start, len(file_dict[filename]))
+            found_files += 1
+            if progress is not None:
+                progress.advance(size = len(file_dict[filename]))
                 
         return found_files
     
-    def save(self):
-        pickled_data = pickle.dumps(self.byte_dict)
-        encrypted_data = ac.encrypt_data(self.argonize, pickled_data, mode = ac.MODES[self.config['ArgonCrypto']['mode'].upper()])
-        encrypted_data_bytes = pickle.dumps(encrypted_data)
+    def pack_files(self, progress: Progress = None) -> int:
+        """Stream the directory straight into a version 2 package without holding it in memory."""
+        with self.metrics.time("walk"):
+            files = list(self.walk_files())
+        if progress is not None:
+            progress.start("Packing", len(files), sum(os.path.getsize(file_path) for _, _, file_path in files))
+        # a failed or cancelled build leaves an existing package untouched
+        self.index = self.write_volume(self.package, files, self.get_dictionary(self.sample_files()), progress)
+        os.replace(f"{self.package}.tmp", self.package)
+        self.table = None
+        self.loaded = self.package
         
-        if "/" in self.package:
-            filename = self.package.split("/")[-1].replace(".vpk", "").encode('utf-8')
-        elif "\\" in self.package:
-            filename = self.package.split("\\")[-1].replace(".vpk", "").encode('utf-8')
-        else:
-            filename = self.package.replace(".vpk", "").encode('utf-8')
+        return len(files)
+    
+    def pack_volumes(self, progress: Progress = None) -> int:
+        """Stream the directory into a volume set of at most 'volume_size' bytes of files per volume, see volumes.py.
+        
+        The volumes share one zstd dictionary. They and the master are written next to the files they
+        replace and only moved into place once all of them are complete.
+        """
+        with self.metrics.time("walk"):
+            files = list(self.walk_files())
+            sizes = [os.path.getsize(file_path) for _, _, file_path in files]
+        if progress is not None:
+            progress.start("Packing", len(files), sum(sizes))
+        dictionary = self.get_dictionary(self.sample_files())
+        table = {"volumes": [], "folders": {}}
+        paths = []
+        self.index = {}
+        try:
+            for number, group in enumerate(split_volumes(sizes, self.volume_size)):
+                path = volume_path(self.package, number + 1)
+                paths.append(path)
+                index = self.write_volume(path, [files[position] for position in group], dictionary, progress)
+                table["volumes"].append(self.describe_volume(path, f"{path}.tmp", index))
+                for folder_name, filename, _ in (files[position] for position in group):
+                    table["folders"].setdefault(folder_name, {})[filename] = number
+                    self.index.setdefault(folder_name, {})[filename] = index[folder_name][filename]
+            self.write_master(table, self.kdf)
+        except BaseException:
+            for path in paths:
+                remove_file(f"{path}.tmp")
+            raise
+        for path in paths:
+            os.replace(f"{path}.tmp", path)
+        os.replace(f"{self.package}.tmp", self.package)
+        self.table = table
+        self.loaded = self.package
+        
+        return len(files)
+    
+    def write_volume(self, path: str, files: list, dictionary: bytes = None, progress: Progress = None, info: tuple = None, kdf: tuple = None) -> dict:
+        """Write (folder, filename, file path or data) in order as a version 2 package to '<path>.tmp', returns its index.
+        
+        The package gets the configured cipher and codec, or with the header 'info' and the Argon2 parameters
+        'kdf' of the master of a volume set those of the set. The file is removed again if writing fails.
+        """
+        temp = f"{path}.tmp"
+        try:
+            with open(temp, 'wb') as file:
+                file.write(b'\0' * HEADER_SIZE)
+                if info is None:
+                    writer = self.get_writer(file, dictionary)
+                else:
+                    mode, compression = self.get_codecs(info)
+                    level, threads = (self.level, self.threads) if compression == self.config['Compressor']['mode'] else (None, 0)
+                    select = (lambda sample, size: self.select_codec(sample, size, compression)) if self.adaptive else None
+                    writer = ContainerWriter(file, self.get_key(kdf), mode, compression, self.chunk_size, self.workers, self.pool, kdf, select = select, dictionary = dictionary, level = level, threads = threads, detect = self.detect_type if self.detect_types else None, metrics = self.metrics)
+                with writer:
+                    for folder_name, filename, source in files:
+                        if isinstance(source, str):
+                            with open(source, 'rb') as stream:
+                                size = writer.add_stream(folder_name, filename, stream)
+                        else:
+                            size = writer.add_bytes(folder_name, filename, source)
+                        if progress is not None:
+                            progress.advance(size = size)
+                    
+                    filesize = writer.close()
+                file.seek(0)
+                if info is None:
+                    file.write(self.get_header(filesize, path))
+                else:
+                    file.write(struct.pack(HEADER_FORMAT, package_name(path), info[1], min(filesize, 0xFFFFFFFF), *info[3:5], int(time.time()), *info[6:8], VPK_VERSION, info[9]))
+        except BaseException:
+            remove_file(temp)
+            raise
+        return writer.index
+    
+    def describe_volume(self, path: str, written: str, index: dict) -> dict:
+        """Entry of the volume table for the volume written to 'written', to be moved to 'path'."""
+        return {
+            "name": os.path.basename(path), "size": os.path.getsize(written),
+            "files": sum(len(file_dict) for file_dict in index.values()),
+            "bytes": sum(entry["size"] for file_dict in index.values() for entry in file_dict.values()),
+            "digest": volume_digest(written, HEADER_SIZE),
+        }
+    
+    def write_master(self, table: dict, kdf: tuple, info: tuple = None):
+        """Write the master of a volume set with the given table to '<package>.tmp'.
+        
+        The master gets the configured cipher and codec, or those of the header 'info' of the master it replaces.
+        """
+        temp = f"{self.package}.tmp"
+        try:
+            with open(temp, 'wb') as file:
+                file.write(b'\0' * HEADER_SIZE)
+                mode, compression = self.get_codecs(info) if info is not None else (self.get_mode(), self.config['Compressor']['mode'])
+                write_table(file, self.get_key(kdf), mode, compression, kdf, table)
+                filesize = file.tell() - HEADER_SIZE
+                file.seek(0)
+                if info is None:
+                    file.write(self.get_header(filesize, version = VOLUMES_VERSION))
+                else:
+                    file.write(struct.pack(HEADER_FORMAT, *info[:2], filesize, *info[3:]))
+        except BaseException:
+            remove_file(temp)
+            raise
+    
+    def submit(self, method: str, *args, callback = None, **kwargs) -> Job:
+        """Run create_vpk, save, load, compact or extract on a worker thread, see jobs.Job.
+        
+        Only one job should run on a packager at a time, the packager is not locked against others.
+        """
+        return Job(getattr(self, method), *args, callback = callback, **kwargs).start()
+    
+    def get_writer(self, file, dictionary: bytes = None) -> ContainerWriter:
+        return ContainerWriter(file, self.argonize, self.get_mode(), self.config['Compressor']['mode'], self.chunk_size, self.workers, self.pool, self.kdf, store = self.store, select = self.select_codec if self.adaptive else None, dictionary = dictionary, level = self.level, threads = self.threads, detect = self.detect_type if self.detect_types else None, metrics = self.metrics)
+    
+    def detect_type(self, sample) -> str:
+        """MIME type of an entry from its first bytes, recorded in the index so listings need no detection."""
+        return detect_file_type(sample)[0]
+    
+    def sample_files(self, limit: int = 100 * DICTIONARY_SIZE):
+        """Yield the first bytes of the files to pack, up to 'limit' bytes in total."""
+        for _, _, file_path in self.walk_files():
+            if limit <= 0:
+                return
+            with open(file_path, 'rb') as file:
+                sample = file.read(min(SAMPLE_SIZE, limit))
+            limit -= len(sample)
+            yield sample
+    
+    def get_dictionary(self, samples) -> bytes:
+        """zstd dictionary for a new package, None if dictionaries are disabled or zstd is not used."""
+        setting = self.config['Compressor'].get('dictionary', False)
+        codecs = {self.config['Compressor']['mode'], self.fast_codec if self.adaptive else None}
+        if not setting or 'zstd' not in codecs:
+            return None
+        if self.dictionary is not None:
+            return self.dictionary
+        # a path shares one dictionary across a family of packages, the first package trains it
+        if isinstance(setting, str) and os.path.isfile(setting):
+            return get_file_data(setting)
+        dictionary = Compressor.train(list(samples))
+        if isinstance(setting, str) and dictionary is not None:
+            with open(setting, 'wb') as file:
+                file.write(dictionary)
+        return dictionary
+    
+    def select_codec(self, sample, size: int, strong: str = None) -> str:
+        """Codec of a single entry: none for compressed media, the fast codec for large entries."""
+        sample = bytes(sample[:SAMPLE_SIZE])
+        return Compressor.select(sample, size, strong or self.config['Compressor']['mode'], self.fast_codec, get_file_type(sample))
+    
+    def get_key(self, kdf: tuple) -> bytes:
+        """Key for the given Argon2 parameters, derived once per process."""
+        if kdf == self.kdf and self.argonize is not None:
+            return self.argonize
+        return ac.generate_argon_key(self.secret, self.salt, 32, *kdf)
+    
+    @contextmanager
+    def measure(self):
+        """Collect the metrics of a single run, profiled if configured, and export them once it is done."""
+        if self.metrics.wall is not None:
+            # the previous run is finished, start over
+            self.metrics = Metrics()
+        profiled = self.profile_path is not None or self.trace_memory
+        with capture(self.metrics, self.profile_path, self.trace_memory) if profiled else nullcontext():
+            yield self.metrics
+        self.metrics.finish()
+        if self.metrics_path:
+            self.metrics.write(self.metrics_path, labels = {"package": os.path.basename(self.package)})
+    
+    def get_mode(self) -> int:
+        return ac.MODES[self.config['ArgonCrypto']['mode'].upper()]
+    
+    def get_header(self, filesize: int, package: str = None, version: int = None) -> bytes:
+        filename = package_name(package or self.package)
         fileinfo = "Encrypted data package".encode('utf-8')
-        filesize = len(encrypted_data_bytes)
+        # version 2 payloads may exceed 4 GB, their real size is kept in the preamble
+        filesize = min(filesize, 0xFFFFFFFF)
         author    = self.config['Settings']['author'].encode('utf-8')
         copyright = "VALKYTEQ ⓒ 2023".encode('utf-8')
         timestamp = int(time.time())
         encryption = self.config['ArgonCrypto']['mode'].upper().encode('utf-8')
         key_length = len(self.argonize)
-        version = 1
+        version = version or self.version
         compression = self.config['Compressor']['mode'].encode('utf-8')
         
-        header_data = struct.pack(HEADER_FORMAT, filename, fileinfo, filesize, author, copyright, timestamp, encryption, key_length, version, compression)
-        v_package_c = header_data + Compressor.deflate(encrypted_data_bytes, compression.decode())
+        return struct.pack(HEADER_FORMAT, filename, fileinfo, filesize, author, copyright, timestamp, encryption, key_length, version, compression)
+    
+    def save(self, progress: Progress = None):
+        if self.version < 2:
+            return self.save_v1(progress)
+        if self.can_append():
+            if self.changes or self.removed:
+                self.append(progress)
+            return
+        
+        if progress is not None:
+            progress.start("Saving", sum(len(file_dict) for file_dict in self.byte_dict.values()), sum(len(data) for file_dict in self.byte_dict.values() for data in file_dict.values()))
+        # the package may be the source of the entries, it is only replaced once the new one is complete
+        temp = f"{self.package}.tmp"
+        try:
+            with open(temp, 'wb') as file:
+                file.write(b'\0' * HEADER_SIZE)
+                samples = ((data.head() if isinstance(data, LazyEntry) else data)[:SAMPLE_SIZE] for file_dict in self.byte_dict.values() for data in file_dict.values())
+                with self.get_writer(file, self.get_dictionary(samples)) as writer:
+                    for folder_name, file_dict in self.byte_dict.items():
+                        for filename, data in file_dict.items():
+                            # entries of a lazily loaded package are decoded one at a time
+                            size = writer.add_bytes(folder_name, filename, bytes(data))
+                            if progress is not None:
+                                progress.advance(size = size)
+                    
+                    filesize = writer.close()
+                self.index = writer.index
+                file.seek(0)
+                file.write(self.get_header(filesize))
+        except BaseException:
+            remove_file(temp)
+            raise
+        if self.loaded == self.package:
+            # a mapped package cannot be replaced while it is open
+            self.close()
+        os.replace(temp, self.package)
+        self.table = None
+        self.loaded = self.package
+        self.changes, self.removed = {}, set()
+    
+    def stage(self, folder: str, filename: str, data):
+        """Add or replace an entry, the next save appends only the staged entries."""
+        if self.byte_dict is None:
+            self.byte_dict = {}
+        self.byte_dict.setdefault(folder, {})[filename] = data
+        self.changes.setdefault(folder, {})[filename] = data
+        self.removed.discard((folder, filename))
+    
+    def stage_folder(self, folder: str):
+        if self.byte_dict is None:
+            self.byte_dict = {}
+        self.byte_dict.setdefault(folder, {})
+        self.changes.setdefault(folder, {})
+    
+    def remove(self, folder: str, filename: str):
+        """Remove an entry, the next save drops it from the index."""
+        if self.byte_dict is not None:
+            self.byte_dict.get(folder, {}).pop(filename, None)
+        self.changes.get(folder, {}).pop(filename, None)
+        self.removed.add((folder, filename))
+    
+    def can_append(self) -> bool:
+        """Staged changes can be appended if the index in memory belongs to the package on disk."""
+        if self.index is None or self.loaded != self.package or not os.path.exists(self.package):
+            return False
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+        return info[8] >= 2
+    
+    def append(self, progress: Progress = None):
+        """Write the staged entries as new frames and a new index, leaving the rest of the package untouched.
         
-        with open(self.package, 'wb') as file:
-            file.write(v_package_c)
+        The index is only replaced at the end, a cancelled append leaves the package as it was plus
+        some dead space. A lazily loaded package is mapped again afterwards, its handles are rebuilt
+        from the new index.
+        """
+        mapped = self.mapped is not None or bool(self.volumes)
+        self.close()
+        try:
+            if self.table is not None:
+                self.append_volume(progress)
+            else:
+                self.write_changes(progress)
+        except BaseException:
+            if mapped:
+                self.reopen()
+            raise
+        if mapped:
+            # the handles of the closed map are dead
+            self.reopen()
     
-    def load(self):
-        error = False
+    def write_changes(self, progress: Progress = None):
+        if progress is not None:
+            progress.start("Saving", sum(len(file_dict) for file_dict in self.changes.values()), sum(len(data) for file_dict in self.changes.values() for data in file_dict.values()))
+        with open(self.package, 'r+b') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            reader = self.get_reader(file, info)
+            file.seek(HEADER_SIZE)
+            # the package keeps its own key, cipher and codec, whatever is configured right now
+            select = None
+            level, threads = (self.level, self.threads) if reader.compression == self.config['Compressor']['mode'] else (None, 0)
+            if self.adaptive:
+                select = lambda sample, size: self.select_codec(sample, size, reader.compression)
+            with ContainerWriter(file, reader.key, reader.mode, reader.compression, self.chunk_size, self.workers, self.pool, reader.kdf, reader.index, select = select, dictionary = reader.dictionary, locator = reader.locator, level = level, threads = threads, detect = self.detect_type if self.detect_types else None, metrics = self.metrics) as writer:
+                for folder_name, filename in self.removed:
+                    writer.remove(folder_name, filename)
+                for folder_name, file_dict in self.changes.items():
+                    writer.add_folder(folder_name)
+                    for filename, data in file_dict.items():
+                        size = writer.add_bytes(folder_name, filename, data)
+                        if progress is not None:
+                            progress.advance(size = size)
+                
+                filesize = writer.close()
+            self.index = writer.index
+            file.seek(0)
+            file.write(struct.pack(HEADER_FORMAT, *info[:2], min(filesize, 0xFFFFFFFF), *info[3:]))
+        self.changes, self.removed = {}, set()
+    
+    def append_volume(self, progress: Progress = None):
+        """Write the staged entries of a volume set as a new volume and replace the master, older volumes stay as they are."""
+        if progress is not None:
+            progress.start("Saving", sum(len(file_dict) for file_dict in self.changes.values()), sum(len(data) for file_dict in self.changes.values() for data in file_dict.values()))
         with open(self.package, 'rb') as file:
-            header_data = file.read(struct.calcsize(HEADER_FORMAT))
-            info = struct.unpack(HEADER_FORMAT, header_data)
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            kdf, paths = self.read_volume_table(file, info)
+        # the new volume keeps the key, cipher, codec and dictionary of the set, whatever is configured right now
+        with open(paths[-1], 'rb') as file:
+            file.seek(HEADER_SIZE)
+            dictionary = self.get_reader(file, info).dictionary
+        number = len(self.table["volumes"])
+        path = volume_path(self.package, number + 1)
+        files = [(folder_name, filename, data) for folder_name, file_dict in self.changes.items() for filename, data in file_dict.items()]
+        index = self.write_volume(path, files, dictionary, progress, info, kdf)
+        table = {"volumes": list(self.table["volumes"]), "folders": {folder_name: dict(file_dict) for folder_name, file_dict in self.table["folders"].items()}}
+        try:
+            table["volumes"].append(self.describe_volume(path, f"{path}.tmp", index))
+            for folder_name, filename in self.removed:
+                table["folders"].get(folder_name, {}).pop(filename, None)
+            for folder_name, file_dict in self.changes.items():
+                folder = table["folders"].setdefault(folder_name, {})
+                for filename in file_dict:
+                    folder[filename] = number
+            self.write_master(table, kdf, info)
+        except BaseException:
+            remove_file(f"{path}.tmp")
+            raise
+        os.replace(f"{path}.tmp", path)
+        os.replace(f"{self.package}.tmp", self.package)
+        self.table = table
+        for folder_name, filename in self.removed:
+            self.index.get(folder_name, {}).pop(filename, None)
+        for folder_name, file_dict in self.changes.items():
+            self.index.setdefault(folder_name, {}).update((filename, index[folder_name][filename]) for filename in file_dict)
+        self.changes, self.removed = {}, set()
+    
+    def reopen(self):
+        """Map the package again after a failed append or compaction, keeping the staged changes."""
+        changes, removed = self.changes, self.removed
+        self.load(lazy = True)
+        for folder_name, file_dict in changes.items():
+            self.stage_folder(folder_name)
+            for filename, data in file_dict.items():
+                self.stage(folder_name, filename, data)
+        for folder_name, filename in removed:
+            self.remove(folder_name, filename)
+    
+    def dead_space(self) -> int:
+        """Bytes of the package no longer referenced by its index."""
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            if info[8] != VPK_VERSION:
+                # the volumes of a set are never rewritten
+                return 0
+            return self.get_reader(file, info).dead_space()
+    
+    def compact(self, progress: Progress = None) -> int:
+        """Rewrite the package without dead space, returns the number of bytes reclaimed."""
+        mapped = self.mapped is not None
+        self.close()
+        temp = f"{self.package}.tmp"
+        try:
+            with open(self.package, 'rb') as source, open(temp, 'wb') as target:
+                info = struct.unpack(HEADER_FORMAT, source.read(HEADER_SIZE))
+                if info[8] != VPK_VERSION:
+                    raise PackageError("Compact Package Error", "Only version 2 packages can be compacted!")
+                reader = self.get_reader(source, info)
+                entries = sorted(reader.entries(), key = lambda item: item[2]["offset"])
+                if progress is not None:
+                    progress.start("Compacting", len(entries), sum(entry["size"] for _, _, entry in entries))
+                
+                target.write(b'\0' * HEADER_SIZE)
+                # frames are copied as they are, nothing is decrypted or recompressed
+                with ContainerWriter(target, reader.key, reader.mode, reader.compression, reader.chunk_size, kdf = reader.kdf, dictionary = reader.dictionary, metrics = self.metrics) as writer:
+                    for folder_name in reader.index:
+                        writer.add_folder(folder_name)
+                    for folder_name, filename, entry in entries:
+                        writer.copy_entry(folder_name, filename, entry, source)
+                        if progress is not None:
+                            progress.advance(size = entry["size"])
+                    
+                    filesize = writer.close()
+                target.seek(0)
+                target.write(struct.pack(HEADER_FORMAT, *info[:2], min(filesize, 0xFFFFFFFF), *info[3:]))
+        except BaseException:
+            remove_file(temp)
+            if mapped:
+                self.reopen()
+            raise
+        
+        reclaimed = os.path.getsize(self.package) - os.path.getsize(temp)
+        os.replace(temp, self.package)
+        # rebuild the index order of folders and files after the copy
+        self.index = {folder_name: {filename: writer.index[folder_name][filename] for filename in file_dict} for folder_name, file_dict in reader.index.items()}
+        self.loaded = self.package
+        if mapped:
+            # the handles of the closed map are dead, they are rebuilt from the new index with the staged changes
+            self.reopen()
+        return reclaimed
+    
+    def save_v1(self, progress: Progress = None):
+        if progress is not None:
+            progress.start("Saving")
+        with self.metrics.time("serialize"):
+            pickled_data = pickle.dumps({folder_name: {filename: bytes(data) for filename, data in file_dict.items()} for folder_name, file_dict in self.byte_dict.items()})
+        self.close()
+        # version 1 packages do not record their Argon2 parameters, they always use the defaults
+        with self.metrics.time("kdf"):
+            key = self.get_key(ac.ARGON_DEFAULTS)
+        with self.metrics.time("encrypt", len(pickled_data)):
+            encrypted_data = ac.encrypt_data(key, pickled_data, mode = self.get_mode())
+        with self.metrics.time("serialize"):
+            encrypted_data_bytes = pickle.dumps(encrypted_data)
+        
+        header_data = self.get_header(len(encrypted_data_bytes))
+        
+        # compressed in one piece: streamed zstd frames carry no content size, which the one-shot
+        # decompression of existing version 1 readers needs
+        with self.metrics.time("compress", len(encrypted_data_bytes)):
+            compressed = Compressor.deflate(encrypted_data_bytes, self.config['Compressor']['mode'], level = self.level, threads = self.threads)
+        del encrypted_data_bytes
+        with self.metrics.time("write", len(compressed)):
+            with open(self.package, 'wb') as file:
+                file.write(header_data)
+                file.write(compressed)
+    
+    def load(self, lazy: bool = False, progress: Progress = None):
+        """Load the package, lazily only the index: files are then decoded from a memory map on access.
+        
+        Raises PackageError if the package cannot be decoded.
+        """
+        with self.measure():
+            self.close()
+            self.index = None
+            self.table = None
+            self.loaded = None
+            with open(self.package, 'rb') as file:
+                info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+                # reject what cannot be decoded before any of the payload is read
+                problem = check_package(file, info)
+                if problem:
+                    raise PackageError("VPK Package | Error", problem)
+                if info[8] < 2:
+                    return self.load_v1(file, info, progress)
+                if info[8] == VOLUMES_VERSION:
+                    return self.load_volumes(file, info, lazy, progress)
+            
+                try:
+                    if lazy:
+                        if progress is not None:
+                            progress.start("Loading")
+                        reader = MappedReader(self.package, HEADER_SIZE, self.get_key, *self.get_codecs(info), metrics = self.metrics, cache = self.cache)
+                        self.mapped = reader
+                        self.byte_dict = reader.lazy_dict()
+                    else:
+                        reader = self.get_reader(file, info)
+                        advance = None
+                        if progress is not None:
+                            progress.start("Loading", sum(1 for _ in reader.entries()), sum(entry["size"] for _, _, entry in reader.entries()))
+                            advance = lambda size: progress.advance(size = size)
+                        self.byte_dict = reader.read_all(advance)
+                    self.index = reader.index
+                    self.loaded = self.package
+                    self.changes, self.removed = {}, set()
+                except EntryError as exc:
+                    self.close()
+                    raise damaged(f"{exc.folder}/{exc.filename}")
+                except ValueError:
+                    self.close()
+                    raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+                except RuntimeError:
+                    self.close()
+                    raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+    
+    def load_volumes(self, file, info, lazy: bool = False, progress: Progress = None):
+        """Load a volume set: lazily its volumes are mapped, eagerly they are decoded side by side in worker processes."""
+        kdf, paths = self.read_volume_table(file, info)
+        mode, compression = self.get_codecs(info)
+        try:
+            if lazy:
+                if progress is not None:
+                    progress.start("Loading", len(paths))
+                for path in paths:
+                    self.volumes.append(MappedReader(path, HEADER_SIZE, self.get_key, mode, compression, metrics = self.metrics, cache = self.cache))
+                    if progress is not None:
+                        progress.advance()
+                layouts = [(reader.lazy_dict(), reader.index) for reader in self.volumes]
+            else:
+                volumes = self.table["volumes"]
+                done = None
+                if progress is not None:
+                    progress.start("Loading", sum(volume["files"] for volume in volumes), sum(volume["bytes"] for volume in volumes))
+                    done = lambda number: progress.advance(volumes[number]["files"], volumes[number]["bytes"])
+                with self.metrics.time("kdf"):
+                    key = self.get_key(kdf)
+                # the volumes are decoded by other processes, their stages are only seen as the wait for them
+                with self.metrics.time("wait", sum(volume["bytes"] for volume in volumes)):
+                    layouts = load_volumes(paths, HEADER_SIZE, key, mode, compression, self.volume_workers, done)
+            self.byte_dict = self.merge_volumes([layout for layout, _ in layouts])
+            self.index = self.merge_volumes([index for _, index in layouts])
+            self.loaded = self.package
+            self.changes, self.removed = {}, set()
+        except EntryError as exc:
+            self.close()
+            raise damaged(f"{exc.folder}/{exc.filename}")
+        except ValueError:
+            self.close()
+            raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+        except RuntimeError:
+            self.close()
+            raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+        except BaseException:
+            self.close()
+            raise
+    
+    def read_volume_table(self, file, info) -> tuple:
+        """Read the volume table of the master of a set into 'table', returns its Argon2 parameters and the paths of its volumes."""
+        try:
+            kdf, self.table = read_table(file, self.get_key, *self.get_codecs(info))
+        except ValueError:
+            raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+        except RuntimeError:
+            raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+        directory = os.path.dirname(self.package)
+        paths = [os.path.join(directory, volume["name"]) for volume in self.table["volumes"]]
+        for path in paths:
+            if not os.path.exists(path):
+                raise PackageError("VPK Package | Error", f"The volume {os.path.basename(path)} of this package is missing!")
+        return kdf, paths
+    
+    def merge_volumes(self, layouts: list) -> dict:
+        """The {folder: {file: value}} layout of the set from those of its volumes, see volumes.merge_volumes."""
+        try:
+            return merge_volumes(self.table["folders"], layouts)
+        except (KeyError, IndexError):
+            raise PackageError("VPK Package | Error", "The volumes do not match the volume table, the package is damaged!")
+    
+    def extract(self, directory: str, progress: Progress = None, verify: bool = False, workers: int = None) -> int:
+        """Write every file of the package below the directory with its folder path, returns the number of files.
+        
+        The files of a loaded package are written as they are, staged changes included; without one the package
+        on disk is mapped and extracted directly. Raises PackageError if the package cannot be decoded, and with
+        'verify' if files do not match the content hash in the index, see extract_files.
+        """
+        if self.byte_dict:
+            return self.extract_files(self.byte_dict, directory, progress, verify, workers)
+        
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            problem = check_package(file, info)
+            if problem:
+                raise PackageError("VPK Package | Error", problem)
+            if info[8] < 2:
+                self.load_v1(file, info)
+                return self.extract_files(self.byte_dict, directory, progress, verify, workers)
+            paths = self.read_volume_table(file, info)[1] if info[8] == VOLUMES_VERSION else [self.package]
+        with ExitStack() as stack:
+            readers = [stack.enter_context(self.map_package(info, path)) for path in paths]
+            if info[8] == VOLUMES_VERSION:
+                return self.extract_files(self.merge_volumes([reader.lazy_dict() for reader in readers]), directory, progress, verify, workers)
+            return self.extract_files(readers[0].lazy_dict(), directory, progress, verify, workers)
+    
+    def extract_files(self, byte_dict: dict, directory: str, progress: Progress = None, verify: bool = False, workers: int = None) -> int:
+        """Write the files of a {folder: {file: data}} layout below the directory.
+        
+        Frames are read in file order and decoded and written on a thread pool, with at most 'extract_budget'
+        bytes of frames and chunks in flight. Files sharing their content are decoded once. With 'verify' the
+        content of every file decoded from the package is checked against its hash in the index, files that
+        do not match are removed again and reported once all others are written.
+        """
+        # duplicates share one handle, or one decoded copy if the package was loaded eagerly
+        groups = {}
+        for folder, file_dict in byte_dict.items():
+            os.makedirs(extract_path(directory, folder), exist_ok = True)
+            for filename, data in file_dict.items():
+                key = data.reader.place(data.entry) if isinstance(data, LazyEntry) else id(data)
+                groups.setdefault(key, [data, []])[1].append(extract_path(directory, folder, filename))
+        # volume by volume, each in file order
+        ordered = sorted(groups.values(), key = lambda group: (id(group[0].reader), group[0].entry["offset"]) if isinstance(group[0], LazyEntry) else (0, -1))
+        if progress is not None:
+            progress.start("Extracting", sum(len(paths) for _, paths in ordered), sum(len(data) * len(paths) for data, paths in ordered))
+        
+        failed = []
+        pending = deque()
+        in_flight = 0
+        frames = None
+        
+        def name(paths: list) -> str:
+            return os.path.relpath(paths[0], directory).replace(os.sep, "/")
+        
+        def collect() -> int:
+            cost, data, paths, future = pending.popleft()
             try:
-                encrypted_data = Compressor.inflate(file.read(info[2]), self.config['Compressor']['mode'])
-            except ValueError:
-                error = True
-            except gzip.BadGzipFile:
-                error = True
-            except OSError:
-                error = True
-            except _lzma.LZMAError:
-                error = True
-            except RuntimeError:
-                error = True
-            except zstd.ZstdError:
-                error = True
-        
-        if not error:
+                reason = future.result()
+            except (ValueError, RuntimeError):
+                # the index was read with the same key, only the frames of this file can be at fault
+                raise damaged(name(paths))
+            if reason:
+                failed.extend(f"{path}: {reason}" for path in paths)
+            if progress is not None:
+                progress.advance(len(paths), len(data) * len(paths))
+            return cost
+        
+        executor = ThreadPoolExecutor(max_workers = workers or self.extract_workers)
+        try:
+            for data, paths in ordered:
+                if isinstance(data, LazyEntry):
+                    # the frames of the file and the chunk being decoded
+                    cost = data.entry["length"] + min(data.entry["size"], data.entry.get("chunk", self.chunk_size))
+                    try:
+                        frames = data.reader.read_frames(data.entry)
+                    except RuntimeError:
+                        raise damaged(name(paths))
+                else:
+                    cost, frames = 0, None
+                # a file larger than the budget is extracted on its own
+                while pending and in_flight + cost > self.extract_budget:
+                    in_flight -= collect()
+                pending.append((cost, data, paths, executor.submit(write_extracted, data, frames, paths, verify)))
+                in_flight += cost
+            while pending:
+                in_flight -= collect()
+        finally:
+            executor.shutdown(cancel_futures = True)
+            if isinstance(frames, memoryview):
+                frames.release()
+        
+        if failed:
+            raise PackageError("Extract Package Error", f"{len(failed)} files do not match their hash and were not extracted:\n" + "\n".join(failed[:10]))
+        return sum(len(paths) for _, paths in ordered)
+    
+    def verify(self, workers: int = None, progress: Progress = None) -> dict:
+        """Check the authentication tags of all frames of the package in parallel, see ContainerReader.verify."""
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            problem = check_package(file, info)
+            if problem:
+                raise PackageError("VPK Package | Error", problem)
+            if info[8] < 2:
+                raise PackageError("Verify Package Error", "Only version 2 packages can be verified!")
+            if info[8] == VOLUMES_VERSION:
+                return self.verify_volumes(file, info, workers, progress)
+            reader = self.get_reader(file, info)
+            advance = None
+            if progress is not None:
+                unique = reader.unique_entries()
+                progress.start("Verifying", len(unique), sum(entry["length"] for _, _, entry in unique.values()))
+                advance = lambda size: progress.advance(size = size)
+            return reader.verify(workers, advance)
+    
+    def verify_volumes(self, file, info, workers: int = None, progress: Progress = None) -> dict:
+        """Verify every volume of a set, a volume that differs from the table is reported as a whole without checking its frames."""
+        _, paths = self.read_volume_table(file, info)
+        result = {"entries": 0, "frames": 0, "bytes": 0, "failed": []}
+        advance = None
+        if progress is not None:
+            progress.start("Verifying", 0, sum(volume["size"] for volume in self.table["volumes"]))
+            advance = lambda size: progress.advance(size = size)
+        for volume, path in zip(self.table["volumes"], paths):
             try:
-                decrypted_data_bytes = pickle.loads(encrypted_data)
-                decrypted_data = ac.decrypt_data(self.argonize, decrypted_data_bytes, mode = ac.MODES[self.config['ArgonCrypto']['mode'].upper()])
-                self.byte_dict = pickle.loads(decrypted_data)
-                
-            except ValueError:
-                messagebox.showerror("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
-        else:
-            messagebox.showerror("Compressor | Error", "The compression method does not match for this package!")
+                digest = volume_digest(path, HEADER_SIZE)
+            except struct.error:
+                digest = None
+            if digest != volume["digest"]:
+                result["failed"].append((volume["name"], None, None, "volume differs from the volume table"))
+                if advance is not None:
+                    advance(volume["size"])
+                continue
+            with open(path, 'rb') as file:
+                file.seek(HEADER_SIZE)
+                checked = self.get_reader(file, info).verify(workers, advance)
+            for field in ("entries", "frames", "bytes"):
+                result[field] += checked[field]
+            result["failed"].extend(checked["failed"])
+        return result
+    
+    def close(self):
+        """Release the memory map of a lazily loaded package, its file handles stop working."""
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        for reader in self.volumes:
+            reader.close()
+        self.volumes = []
     
-    def create_vpk(self):
+    def prefetch(self, handles):
+        """Decode files of the lazily loaded package into the cache in the background, e.g. the files of an opened folder."""
+        readers = self.volumes or ([self.mapped] if self.mapped is not None else [])
+        if readers and self.cache is not None:
+            self.cache.prefetch([(handle.reader, handle.entry) for handle in handles if isinstance(handle, LazyEntry) and handle.reader in readers])
+    
+    def cache_stats(self) -> dict:
+        """Hits, misses, evictions and size of the cache of decoded files, None without a cache."""
+        return self.cache.stats() if self.cache is not None else None
+    
+    def volume_indexes(self) -> list:
+        """The index of a volume set split by the volume holding each entry, duplicates are only shared within a volume."""
+        indexes = [{} for _ in self.table["volumes"]]
+        for folder, file_dict in self.table["folders"].items():
+            for filename, number in file_dict.items():
+                indexes[number].setdefault(folder, {})[filename] = self.index[folder][filename]
+        return indexes
+    
+    def get_codecs(self, info) -> tuple:
+        encryption = info[6].decode().upper()
+        compression = info[9].decode().replace("\00", "")
+        return ac.MODES[encryption], compression
+    
+    def map_package(self, info, path: str = None) -> MappedReader:
+        """Map the version 2 package on disk, or the volume at 'path', and read its index."""
+        try:
+            return MappedReader(path or self.package, HEADER_SIZE, self.get_key, *self.get_codecs(info), metrics = self.metrics)
+        except ValueError:
+            raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+        except RuntimeError:
+            raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+    
+    def get_reader(self, file, info, index: dict = None) -> ContainerReader:
+        """Read the preamble and, unless it is given, the index of the version 2 package at the position of the file."""
+        try:
+            return ContainerReader(file, self.get_key, *self.get_codecs(info), index, metrics = self.metrics)
+        except ValueError:
+            raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+        except RuntimeError:
+            raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+    
+    def open_index(self) -> dict:
+        """Read only the header and the entry index of the package, raises PackageError if it cannot be read."""
+        self.table = None
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            problem = check_package(file, info)
+            if problem:
+                raise PackageError("VPK Package | Error", problem)
+            if info[8] < 2:
+                # version 1 packages have no index, they can only be read as a whole
+                self.load_v1(file, info)
+                compression = info[9].decode().replace("\00", "")
+                self.index = {folder: {filename: {"size": len(data), "codec": compression} for filename, data in file_dict.items()} for folder, file_dict in (self.byte_dict or {}).items()}
+            elif info[8] == VOLUMES_VERSION:
+                # the indexes of all volumes are read, but none of their frames
+                _, paths = self.read_volume_table(file, info)
+                indexes = []
+                for path in paths:
+                    with open(path, 'rb') as volume:
+                        volume.seek(HEADER_SIZE)
+                        indexes.append(self.get_reader(volume, info).index)
+                self.index = self.merge_volumes(indexes)
+                self.loaded = self.package
+            else:
+                self.index = self.get_reader(file, info).index
+                self.loaded = self.package
+        return self.index
+    
+    def list_entries(self) -> list:
+        """List (folder, filename, size, codec) of every entry without decoding any file."""
+        index = self.index if self.index is not None else self.open_index()
+        return [(folder, filename, entry["size"], entry["codec"]) for folder, file_dict in index.items() for filename, entry in file_dict.items()]
+    
+    def read_entry(self, folder: str, filename: str) -> bytes:
+        """Decode a single entry of the package, raises PackageError if it cannot be decoded."""
+        index = self.index if self.index is not None else self.open_index()
+        if "offset" not in index[folder][filename]:
+            return self.byte_dict[folder][filename]
+        try:
+            if self.mapped is not None:
+                return self.mapped.read(folder, filename)
+            
+            path = self.package
+            if self.table is not None:
+                # only the volume holding the entry is read
+                number = self.table["folders"][folder][filename]
+                if self.volumes:
+                    return self.volumes[number].read_entry(index[folder][filename])
+                path = os.path.join(os.path.dirname(self.package), self.table["volumes"][number]["name"])
+            with open(path, 'rb') as file:
+                info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+                return self.get_reader(file, info, index).read(folder, filename)
+        except (ValueError, RuntimeError):
+            # the index was read with the same key, only the frames of this file can be at fault
+            raise damaged(f"{folder}/{filename}")
+    
+    def open_entry(self, folder: str, filename: str) -> io.RawIOBase:
+        """Open a single entry as a seekable, read-only file object, e.g. to stream a video out of the package.
+
+        Entries of a lazily loaded package are decoded chunk by chunk from its memory map, which has to stay
+        open while the file object is used. Without a loaded package the package is mapped for the file object
+        alone and unmapped when it is closed. Entries held in memory, staged ones and those of eagerly loaded
+        or version 1 packages, are wrapped as they are.
+        """
+        if self.byte_dict:
+            data = self.byte_dict[folder][filename]
+            if isinstance(data, LazyEntry):
+                return data.open()
+            return io.BytesIO(data)
+
+        with open(self.package, 'rb') as file:
+            info = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            problem = check_package(file, info)
+            if problem:
+                raise PackageError("VPK Package | Error", problem)
+            if info[8] < 2:
+                # version 1 packages can only be decoded as a whole
+                self.load_v1(file, info)
+                return io.BytesIO(self.byte_dict[folder][filename])
+            path = None
+            if info[8] == VOLUMES_VERSION:
+                paths = self.read_volume_table(file, info)[1]
+                path = paths[self.table["folders"][folder][filename]]
+        reader = self.map_package(info, path)
+        try:
+            return EntryReader(reader, reader.index[folder][filename], owned = True)
+        except KeyError:
+            reader.close()
+            raise
+
+    def load_v1(self, file, info, progress: Progress = None):
+        # codec and cipher come from the header, whatever is configured right now
+        mode, compression = self.get_codecs(info)
+        if progress is not None:
+            # version 1 packages are decoded in one piece, there is nothing to count
+            progress.start("Loading")
+        try:
+            # the payload runs to the end of the file, the header records its uncompressed size
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            Compressor.inflate_stream(file, buffer, compression)
+            self.metrics.add("inflate", time.perf_counter() - start, buffer.tell())
+            with self.metrics.time("deserialize"):
+                encrypted_data = load_pickle(buffer.getvalue())
+        except (ValueError, EOFError, pickle.UnpicklingError):
+            raise PackageError("Compressor | Error", "The package data cannot be inflated, the package is damaged!")
+        
+        try:
+            with self.metrics.time("kdf"):
+                key = self.get_key(ac.ARGON_DEFAULTS)
+            with self.metrics.time("decrypt"):
+                decrypted_data = ac.decrypt_data(key, encrypted_data, mode = mode)
+            with self.metrics.time("deserialize", len(decrypted_data)):
+                # older packages are unpickled without resolving any class, they only hold builtin data
+                self.byte_dict = load_pickle(decrypted_data)
+        except ValueError:
+            raise PackageError("Argon Crypto | Error", "The crypto Key and IV do not match for this package!")
+        except (EOFError, pickle.UnpicklingError):
+            raise PackageError("VPK Package | Error", "The package data cannot be read, the package is damaged!")
+    
+    def create_vpk(self, progress: Progress = None) -> dict:
         if self.directory != str and self.directory != '' and self.directory is not None:
             self.timestamp = time.time()
             
             self.byte_dict: dict = {}
             self.package = f"{self.directory}.vpk"
             
-            i = self.read_files()
+            with self.measure():
+                if self.version < 2:
+                    if progress is not None:
+                        progress.start("Reading", sum(1 for _ in self.walk_files()))
+                    i = self.read_files(progress)
+                    self.save(progress)
+                elif self.volume_size:
+                    i = self.pack_volumes(progress)
+                else:
+                    i = self.pack_files(progress)
             file_amount = ('{: >8}'.format(str(i)))
             
             package = self.directory.split('\\')[-1]
             package_name = ('{: >20}'.format(str(package)))
-
-            self.save()
             
             elapsed = round(time.time()-self.timestamp, 2)
             elapsed_time = ('{: >10}'.format(str(elapsed)))
-            logging.info(f"Finished | {package_name}.vpk | {file_amount} Files | {elapsed_time} sec")
+            
+            if self.version < 2:
+                size = sum(len(data) for file_dict in self.byte_dict.values() for data in file_dict.values())
+                ratio = 1.0
+            else:
+                size = sum(entry["size"] for file_dict in self.index.values() for entry in file_dict.values())
+                ratio = dedup_ratio(*self.volume_indexes()) if self.table is not None else dedup_ratio(self.index)
+            dedup = ('{: >8.2f}'.format(ratio))
+            logging.info(f"Finished | {package_name}.vpk | {file_amount} Files | {elapsed_time} sec | {dedup}x Dedup")
+            logging.info(f"Stages   | {package_name}.vpk | {self.metrics.summary()}")
+            
+            self.stats = {"package": self.package, "files": i, "bytes": size, "dedup": ratio, "elapsed": time.time() - self.timestamp, "metrics": self.metrics.to_dict()}
+            return self.stats
         else:
-            raise Exception("Error in directory path!")
+            raise PackageError("Create Package Error", "Error in directory path!")
+
+
+def extract_path(directory: str, *parts: str) -> str:
+    """Path of a folder or file of a package below the directory, folders of packages written on any system."""
+    names = [name for part in parts for name in re.split(r"[\\/]", part) if name not in ("", ".")]
+    # a drive ('C:') would make the path absolute on Windows, whichever system the package is extracted on
+    if ".." in names or any(ntpath.splitdrive(name)[0] or os.path.isabs(name) for name in names):
+        raise PackageError("Extract Package Error", f"The path {'/'.join(parts)} of the package leads out of the folder!")
+    path = os.path.join(directory, *names)
+    root = os.path.realpath(directory)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise PackageError("Extract Package Error", f"The path {'/'.join(parts)} of the package leads out of the folder!")
+    return path
+
+
+def write_extracted(data, frames, paths: list, verify: bool) -> str:
+    """Decode a file and write it to all of its paths, returns why it failed verification or None."""
+    digest = None
+    try:
+        with open(paths[0], 'wb') as file:
+            if isinstance(data, LazyEntry):
+                if verify and "hash" in data.entry:
+                    digest = blake2b(digest_size = 32)
+                with closing(data.reader.decode_frames(data.entry, frames)) as chunks:
+                    for chunk in chunks:
+                        if digest is not None:
+                            digest.update(chunk)
+                        file.write(chunk)
+            else:
+                file.write(data)
+    finally:
+        if isinstance(frames, memoryview):
+            # views on the memory map keep it from being closed
+            frames.release()
+    if digest is not None and digest.digest() != data.entry["hash"]:
+        for path in paths:
+            remove_file(path)
+        return "content differs from its hash"
+    for path in paths[1:]:
+        shutil.copyfile(paths[0], path)
+    return None
+
+
+def package_name(path: str) -> bytes:
+    """Name of a package in its header, the file name without '.vpk' whichever system wrote the path."""
+    return re.split(r"[\\/]", path)[-1].replace(".vpk", "").encode('utf-8')
+
+
+def remove_file(path: str):
+    """Remove a partly written file, if it was created at all."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,10 +1,23 @@
 import base64
 import io
 import tkinter as tk
+from functools import lru_cache
 from tkinter import simpledialog, messagebox, ttk
 from PIL import Image, ImageTk
 
-from icon import EMBEDDED_ICON
+
+@lru_cache(maxsize = 4)
+def get_icon_image(size: int = 32) -> Image.Image:
+    """The embedded icon, decoded and resized once per size."""
+    # the encoded icon is large, it is only imported when a window is shown
+    from icon import EMBEDDED_ICON
+    icon_data = base64.b64decode(EMBEDDED_ICON)
+    return Image.open(io.BytesIO(icon_data)).resize((size, size))
+
+
+def get_icon(window, size: int = 32) -> ImageTk.PhotoImage:
+    """The icon as a photo image of the Tk instance of the window."""
+    return ImageTk.PhotoImage(get_icon_image(size), master = window)
 
 
 class PESetup:
@@ -64,10 +77,7 @@ class PESetup:
         # Create a new tkinter window
         window = tk.Tk() if not child else tk.Toplevel()
         window.title("VPK Setup | Compressor")
-        icon_data = base64.b64decode(EMBEDDED_ICON)
-        icon_image = Image.open(io.BytesIO(icon_data))
-        icon_image = icon_image.resize((32, 32))
-        ico = ImageTk.PhotoImage(icon_image)
+        ico = get_icon(window)
         window.iconphoto(True, ico)
         window.eval('tk::PlaceWindow %s center' % window.winfo_toplevel())
         
@@ -77,7 +87,7 @@ class PESetup:
         
         compression_var = tk.StringVar()
         compression_combobox = ttk.Combobox(window, textvariable = compression_var)
-        compression_combobox['values'] = ['Gzip (Balanced)', 'ZSTD (Balanced)', 'Bzip2 (Slow)', 'LZMA (Slow)', 'LZ4 (Fast)']
+        compression_combobox['values'] = ['Gzip (Balanced)', 'ZSTD (Balanced)', 'Bzip2 (Slow)', 'LZMA (Slow)', 'LZ4 (Fast)', 'LZ4HC (Balanced)']
         compression_combobox.current(0)
         compression_combobox.grid(row=1, column=1, columnspan=2, padx=10, pady=10)
         
@@ -116,10 +126,7 @@ class PESetup:
         # Create a new tkinter window
         window = tk.Tk() if not child else tk.Toplevel()
         window.title("VPK Setup | Encryption")
-        icon_data = base64.b64decode(EMBEDDED_ICON)
-        icon_image = Image.open(io.BytesIO(icon_data))
-        icon_image = icon_image.resize((32, 32))
-        ico = ImageTk.PhotoImage(icon_image)
+        ico = get_icon(window)
         window.iconphoto(True, ico)
         window.eval('tk::PlaceWindow %s center' % window.winfo_toplevel())
         
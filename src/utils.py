@@ -1,14 +1,36 @@
 import json
+import logging
+import os
 import pickle
 import subprocess
 import sys
-import winreg
-import magic
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
 import argoncrypto as ac
-from setup import PESetup
+
+try:
+    import winreg
+except ImportError:
+    # not on Windows, the identity comes from a StaticIdentity there
+    winreg = None
 
 
 CREATE_NO_WINDOW = 0x08000000
+# libmagic only looks at the first bytes of a file, larger prefixes only cost time
+DETECT_SIZE = 65536
+TYPE_CACHE_SIZE = 4096
+
+_type_cache = OrderedDict()
+_type_lock = threading.Lock()
+# started on the first background detection, importing utils does not start a thread
+_type_worker = None
+
+# path of the optional on-disk cache of the hardware identity
+IDENTITY_CACHE_ENV = "VPK_IDENTITY_CACHE"
+_identity = None
 
 
 def get_file_data(path):
@@ -16,10 +38,55 @@ def get_file_data(path):
         return file.read()
 
 
+def detect_file_type(item_data) -> tuple:
+    """Get the MIME type and the description of file data, both detected once per content and cached."""
+    prefix = bytes(item_data[:DETECT_SIZE])
+    key = blake2b(prefix, digest_size = 16).digest()
+    with _type_lock:
+        if key in _type_cache:
+            _type_cache.move_to_end(key)
+            return _type_cache[key]
+    
+    # loads libmagic on first use, listing and scanning packages never need it
+    import magic
+    result = magic.from_buffer(prefix, mime = True), magic.from_buffer(prefix, mime = False)
+    with _type_lock:
+        _type_cache[key] = result
+        if len(_type_cache) > TYPE_CACHE_SIZE:
+            _type_cache.popitem(last = False)
+    return result
+
+
+def get_type_worker() -> ThreadPoolExecutor:
+    global _type_worker
+    with _type_lock:
+        if _type_worker is None:
+            _type_worker = ThreadPoolExecutor(max_workers = 1)
+        return _type_worker
+
+
+def detect_file_types(items, callback):
+    """Detect the types of many files off the calling thread.
+    
+    items is a list of (key, data) pairs, where data may also be a callable returning the file data, so
+    decoding happens in the background as well. callback is called on the worker thread with a dict of
+    key -> (MIME type, description); files that cannot be read are left out.
+    """
+    def detect():
+        results = {}
+        for key, data in items:
+            try:
+                results[key] = detect_file_type(data() if callable(data) else data)
+            except Exception as exc:
+                logging.error(f"Cannot detect file type of {key}: {exc}")
+        callback(results)
+    
+    return get_type_worker().submit(detect)
+
+
 def get_file_type(item_data, no_meme = False):
     """Get info about file data."""
-    kind = magic.from_buffer(item_data, mime = False)
-    kind_meme = magic.from_buffer(item_data, mime = True)
+    kind_meme, kind = detect_file_type(item_data)
     return kind_meme if not no_meme else kind
 
 
@@ -40,7 +107,7 @@ def read_config(file_path):
     if not data:
         raise Exception("Cannot read config!")
     
-    crypto_key = str(get_uniqueid())[2:].encode('utf-8')
+    crypto_key = get_config_key()
     encrypted_data = json.loads(data)
     decrypted_data = ac.decrypt_data(crypto_key, encrypted_data)
     config = pickle.loads(decrypted_data)
@@ -50,12 +117,15 @@ def read_config(file_path):
 def save_config(file_path, data):
     """Save the data in an encrypted configuration file."""
     pickled_data = pickle.dumps(data)
-    crypto_key = str(get_uniqueid())[2:].encode('utf-8')
+    crypto_key = get_config_key()
     encrypted_data = ac.encrypt_data(crypto_key, pickled_data)
     with open(file_path, "w") as file:
         file.write(json.dumps(encrypted_data))
     
 def create_config(path):
+    # the setup dialogs pull in tkinter and PIL, only the first start needs them
+    from setup import PESetup
+    
     author = False
     while author is False:
         author = PESetup.setup_author()
@@ -92,7 +162,8 @@ def create_config(path):
         "Compressor": {"mode": compressor}
     }
     save_config(path, data)
-    return read_config(r".\settings.argon")
+    # the saved config is what was just entered, there is nothing to decrypt
+    return data
 
 def get_osid():
     key = winreg.OpenKey(
@@ -124,12 +195,94 @@ def get_hddid() -> int:
             hexid = serial.split('DRIVE0')[-1].strip()
             return int(f"0x{hexid}", 0)
 
+class HardwareIdentity:
+    """Source of the machine identifier the settings are encrypted with.
+    
+    The identifier is probed once per process and kept, subclasses only implement probe().
+    """
+    
+    def __init__(self):
+        self.identifier: str = None
+        self.lock = threading.Lock()
+    
+    def probe(self) -> int:
+        raise NotImplementedError
+    
+    def load(self) -> str:
+        return hex(self.probe())
+    
+    def get_uniqueid(self) -> str:
+        with self.lock:
+            if self.identifier is None:
+                self.identifier = self.load()
+            return self.identifier
+
+
+class WindowsIdentity(HardwareIdentity):
+    """Identity of a Windows machine from its product UUID, first disk, CPU and installation.
+    
+    Probing spawns three wmic processes. With a cache path the identifier is also kept on disk,
+    encrypted and authenticated with a key derived from the MachineGuid of the installation, which
+    is a single registry read. A cache that does not decrypt, e.g. one copied from another machine
+    or tampered with, is ignored and replaced after probing again.
+    """
+    
+    def __init__(self, cache_path: str = None):
+        super().__init__()
+        self.cache_path = cache_path
+    
+    def probe(self) -> int:
+        return get_uuid() + get_hddid() + get_cpuid() + get_osid()
+    
+    def load(self) -> str:
+        if self.cache_path is None:
+            return super().load()
+        
+        cache_key = blake2b(hex(get_osid()).encode('utf-8'), digest_size = 32, person = b'vpk-identity').digest()
+        try:
+            with open(self.cache_path) as file:
+                # the identifier is plain hex, decrypt_data hands it back as text
+                return ac.decrypt_data(cache_key, json.loads(file.read()))
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as exc:
+            logging.warning(f"Identity cache {self.cache_path} is invalid, probing the hardware again: {exc}")
+        
+        identifier = super().load()
+        with open(self.cache_path, "w") as file:
+            file.write(json.dumps(ac.encrypt_data(cache_key, identifier.encode('utf-8'))))
+        return identifier
+
+
+class StaticIdentity(HardwareIdentity):
+    """Fixed identity for hosts without the Windows probes and for tests, by default from the MAC address."""
+    
+    def __init__(self, value = None):
+        super().__init__()
+        self.value = value if value is not None else uuid.getnode()
+    
+    def probe(self) -> int:
+        digest = blake2b(str(self.value).encode('utf-8'), digest_size = 16).digest()
+        # the top bit keeps 32 hex digits, a valid AES key once the identifier is encoded
+        return int.from_bytes(digest, 'big') | 1 << 127
+
+
+def set_identity(provider: HardwareIdentity):
+    """Replace the source of the machine identifier, e.g. by a StaticIdentity in tests."""
+    global _identity
+    _identity = provider
+
+
+def get_identity() -> HardwareIdentity:
+    global _identity
+    if _identity is None:
+        _identity = WindowsIdentity(os.environ.get(IDENTITY_CACHE_ENV)) if winreg is not None else StaticIdentity()
+    return _identity
+
+
 def get_uniqueid() -> hex:
-    uuid = get_uuid()
-    hddid = get_hddid()
-    cpuid = get_cpuid()
-    osid = get_osid()
+    return get_identity().get_uniqueid()
 
-    identifier = uuid + hddid + cpuid + osid
 
-    return hex(identifier)
+def get_config_key() -> bytes:
+    return str(get_uniqueid())[2:].encode('utf-8')
@@ -0,0 +1,145 @@
+import json
+import os
+import struct
+from concurrent.futures import as_completed
+from hashlib import blake2b
+
+import argoncrypto as ac
+from compressor import Compressor
+from container import ContainerReader, KDF_FORMAT, KDF_SIZE, FRAME_FORMAT, FRAME_SIZE, V2_FORMAT, V2_SIZE, INFLATE_ERRORS, encode_frame
+from manifest import editable
+
+# A package too large for a single file is written as a volume set: numbered volumes
+# '<name>.001.vpk', '<name>.002.vpk', ... next to the master '<name>.vpk'. Every volume is a
+# complete version 2 package of its own, with the cipher, codec, key and dictionary of the set,
+# so a volume can be read, verified or extracted like any other package. Files are never split,
+# a file larger than the volume size gets a volume of its own.
+#
+# Layout of the master, directly following the classic VPK header with version VOLUMES_VERSION:
+#
+#   preamble  VOLUMES_FORMAT, followed by KDF_FORMAT, the Argon2 parameters of the key of the set
+#   table     a single frame holding the compressed JSON volume table:
+#               "volumes"  per volume its file name, file size, number of files, plain bytes and
+#                          the BLAKE2b digest of its preamble and index frame, which holds the
+#                          tags of all of its frames
+#               "folders"  {folder: {file: volume number}}, the volume holding each file
+#
+# Staged changes are saved as a new volume and a new table, the volumes already written are
+# never touched; files replaced or removed stay in their old volume, unreferenced.
+VOLUMES_VERSION = 3
+VOLUMES_MAGIC = b'VPKS'
+VOLUMES_FORMAT = '<4sHI'  # magic, preamble size, volume count
+VOLUMES_SIZE = struct.calcsize(VOLUMES_FORMAT)
+
+
+def volume_path(package: str, number: int) -> str:
+    """Path of the volume with the given number, counted from 1, of the set with the master 'package'."""
+    base = package[:-len(".vpk")] if package.endswith(".vpk") else package
+    return f"{base}.{number:03d}.vpk"
+
+
+def split_volumes(sizes: list, volume_size: int) -> list:
+    """Group files of the given sizes in order into volumes of at most 'volume_size' bytes, as lists of their numbers."""
+    volumes, current, filled = [], [], 0
+    for number, size in enumerate(sizes):
+        if current and filled + size > volume_size:
+            volumes.append(current)
+            current, filled = [], 0
+        current.append(number)
+        filled += size
+    if current or not volumes:
+        volumes.append(current)
+    return volumes
+
+
+def volume_digest(path: str, offset: int) -> str:
+    """Digest of the preamble and the index frame of a volume, the package at 'offset' of the file."""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        preamble = file.read(V2_SIZE)
+        _, _, _, index_offset, index_length = struct.unpack(V2_FORMAT, preamble)
+        file.seek(index_offset)
+        return blake2b(preamble + file.read(index_length), digest_size = 32).hexdigest()
+
+
+def merge_volumes(folders: dict, layouts: list) -> dict:
+    """The {folder: {file: value}} layout of a set, each file taken from the layout of the volume the table maps it to."""
+    return {folder: {filename: layouts[number][folder][filename] for filename, number in file_dict.items()} for folder, file_dict in folders.items()}
+
+
+def write_table(file, key: bytes, mode: int, compression: str, kdf: tuple, table: dict):
+    """Write the preamble and the volume table of a master at the position of the file."""
+    data = json.dumps(table, separators = (",", ":")).encode('utf-8')
+    frame, _, _ = encode_frame(key, mode, compression, data)
+    file.write(struct.pack(VOLUMES_FORMAT, VOLUMES_MAGIC, VOLUMES_SIZE + KDF_SIZE, len(table["volumes"])))
+    file.write(struct.pack(KDF_FORMAT, *kdf))
+    file.write(struct.pack(FRAME_FORMAT, len(frame)))
+    file.write(frame)
+
+
+def read_table(file, key, mode: int, compression: str) -> tuple:
+    """The Argon2 parameters and the volume table of a master, read from the position of the file.
+
+    Like for ContainerReader, the key may be a callable taking the Argon2 parameters. Raises
+    ValueError if the key does not match and RuntimeError if the master is damaged.
+    """
+    try:
+        magic, size, count = struct.unpack(VOLUMES_FORMAT, file.read(VOLUMES_SIZE))
+        kdf = struct.unpack(KDF_FORMAT, file.read(KDF_SIZE))
+        file.seek(size - VOLUMES_SIZE - KDF_SIZE, os.SEEK_CUR)
+        length, = struct.unpack(FRAME_FORMAT, file.read(FRAME_SIZE))
+    except struct.error:
+        raise RuntimeError("The volume table is truncated")
+    if magic != VOLUMES_MAGIC:
+        raise RuntimeError("Not a volume set")
+    frame = file.read(length)
+    if len(frame) != length:
+        raise RuntimeError("The volume table is truncated")
+    plain = ac.decrypt_bytes(key(kdf) if callable(key) else key, frame, mode)
+    try:
+        table = json.loads(Compressor.inflate(plain, compression))
+    except INFLATE_ERRORS as exc:
+        raise RuntimeError(f"The volume table cannot be read: {exc}") from exc
+    if len(table["volumes"]) != count:
+        raise RuntimeError("The volume table is damaged")
+    return kdf, table
+
+
+def load_volume(path: str, offset: int, key: bytes, mode: int, compression: str) -> tuple:
+    """Decode a whole volume into its {folder: {file: bytes}} layout and index, runs in the worker processes of a set load."""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        reader = ContainerReader(file, key, mode, compression)
+        return reader.read_all(), editable(reader.index)
+
+
+def load_volumes(paths: list, offset: int, key: bytes, mode: int, compression: str, workers: int = None, done = None) -> list:
+    """Decode the volumes of a set concurrently in worker processes, returns their layouts and indexes in order.
+
+    Decoding is bound by the ciphers and codecs, separate processes decode the volumes side by side
+    whatever the GIL holds. done(number) is called once a volume is decoded; volumes not started yet
+    are dropped if it raises, e.g. on a cancellation.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        results = []
+        for number, path in enumerate(paths):
+            results.append(load_volume(path, offset, key, mode, compression))
+            if done is not None:
+                done(number)
+        return results
+
+    # multiprocessing is slow to import, it is only loaded for sets of several volumes
+    from concurrent.futures import ProcessPoolExecutor
+    results = [None] * len(paths)
+    executor = ProcessPoolExecutor(max_workers = workers)
+    try:
+        futures = {executor.submit(load_volume, path, offset, key, mode, compression): number for number, path in enumerate(paths)}
+        for future in as_completed(futures):
+            number = futures[future]
+            results[number] = future.result()
+            if done is not None:
+                done(number)
+    finally:
+        executor.shutdown(cancel_futures = True)
+    return results
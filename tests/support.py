@@ -0,0 +1,32 @@
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+ARGONIZE = ("k" * 64, "i" * 24)
+KEY = bytes(range(32))
+# small chunks, so a few KB of test data already spans several of them; no libmagic needed
+CONFIG = {
+    "Settings": {"author": "test"},
+    "ArgonCrypto": {"mode": "aes-gcm"},
+    "Compressor": {"mode": "zstd"},
+    "Packager": {"chunk_size": 65536, "detect_types": False},
+}
+
+
+def make_config(**sections) -> dict:
+    """The test config with the settings of some sections replaced, e.g. make_config(Packager = {"volume_size": 1024})."""
+    config = copy.deepcopy(CONFIG)
+    for section, settings in sections.items():
+        config.setdefault(section, {}).update(settings)
+    return config
+
+
+def write_tree(directory: str, files: dict):
+    """Write {relative path: bytes} below the directory."""
+    for name, data in files.items():
+        path = os.path.join(directory, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "wb") as file:
+            file.write(data)
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import wait
+
+from support import ARGONIZE, make_config, write_tree
+from container import EntryCache
+from packager import Packager
+
+
+class EntryCacheTest(unittest.TestCase):
+    """Decoded entries are kept within the budget, the least recently used evicted first."""
+
+    def test_get(self):
+        cache = EntryCache(400)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", b"a" * 100)
+        self.assertEqual(cache.get("a"), b"a" * 100)
+        self.assertEqual(cache.stats(), {"entries": 1, "bytes": 100, "budget": 400, "hits": 1, "misses": 1, "evictions": 0, "prefetched": 0})
+
+    def test_eviction(self):
+        cache = EntryCache(400)
+        for key in "abcd":
+            cache.put(key, key.encode() * 100)
+        # 'a' was used last, 'b' is the least recently used one
+        cache.get("a")
+        cache.put("e", b"e" * 100)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual([key for key in "acde" if cache.get(key) is not None], list("acde"))
+        self.assertEqual(cache.stats()["bytes"], 400)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_large_entries(self):
+        cache = EntryCache(400)
+        self.assertTrue(cache.wants(100))
+        self.assertFalse(cache.wants(101))
+        cache.put("a", b"a" * 101)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_put_twice(self):
+        cache = EntryCache(400)
+        cache.put("a", b"a" * 100)
+        cache.put("a", b"a" * 100)
+        self.assertEqual(cache.stats()["bytes"], 100)
+
+    def test_clear(self):
+        cache = EntryCache(400)
+        cache.put("a", b"a" * 100)
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+
+class PackageCacheTest(unittest.TestCase):
+    """Files of a lazily loaded package are decoded once while they stay in the cache."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, "pkg")
+        self.files = {f"{number}": os.urandom(1000) for number in range(8)}
+        self.files["large"] = os.urandom(200000)
+        write_tree(source, self.files)
+        packager = Packager(ARGONIZE, make_config())
+        packager.directory = source
+        packager.create_vpk()
+        self.package = packager.package
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, budget: int) -> Packager:
+        packager = Packager(ARGONIZE, make_config(Packager = {"cache_budget": budget}))
+        packager.package = self.package
+        packager.load(lazy = True)
+        self.addCleanup(packager.close)
+        return packager
+
+    def test_hits(self):
+        packager = self.load(4 * 200000)
+        for _ in range(3):
+            self.assertEqual(bytes(packager.byte_dict["pkg"]["0"]), self.files["0"])
+        stats = packager.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+
+    def test_large_file(self):
+        # a file larger than a quarter of the budget is decoded on every access
+        packager = self.load(4 * 200000 - 4)
+        for _ in range(2):
+            self.assertEqual(bytes(packager.byte_dict["pkg"]["large"]), self.files["large"])
+        stats = packager.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (0, 2, 0))
+
+    def test_prefetch(self):
+        packager = self.load(4 * 200000)
+        handles = [packager.byte_dict["pkg"][name] for name in sorted(self.files)]
+        packager.prefetch(handles)
+        with packager.cache.lock:
+            futures = list(packager.cache.futures)
+        wait(futures)
+        self.assertEqual(packager.cache_stats()["prefetched"], len(self.files))
+        for name, handle in zip(sorted(self.files), handles):
+            self.assertEqual(bytes(handle), self.files[name])
+        self.assertEqual(packager.cache_stats()["misses"], 0)
+
+    def test_disabled(self):
+        packager = self.load(0)
+        self.assertIsNone(packager.cache_stats())
+        self.assertEqual(bytes(packager.byte_dict["pkg"]["0"]), self.files["0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from support import KEY  # noqa: F401, puts src on the path
+from compressor import CODECS, Compressor, NoneCodec, get_codec, register_codec
+
+
+class RegisterTest(unittest.TestCase):
+    """Codec names have to fit the compression mode field of the package header."""
+
+    def tearDown(self):
+        CODECS.pop("none2", None)
+
+    def test_register(self):
+        register_codec("none2", NoneCodec)
+        self.assertIsInstance(get_codec("none2"), NoneCodec)
+        self.assertEqual(Compressor.inflate(Compressor.deflate(b"data", "none2"), "none2"), b"data")
+
+    def test_too_long(self):
+        for name in ("brotli", "zstd-x", "", "äöü"):
+            with self.assertRaises(ValueError):
+                register_codec(name, NoneCodec)
+            self.assertNotIn(name, CODECS)
+
+    def test_builtin(self):
+        for name in CODECS:
+            self.assertLessEqual(len(name.encode("utf-8")), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
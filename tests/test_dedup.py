@@ -0,0 +1,101 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ARGONIZE, CONFIG, KEY, write_tree
+from container import ContainerReader, ContainerWriter
+from packager import Packager
+
+
+class EmptyEntryTest(unittest.TestCase):
+    """An empty file starts where the next file starts, it must not be taken for a duplicate of it."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, "pkg")
+        os.makedirs(source)
+        # packed in name order: the empty file comes first, the next file shares its offset
+        self.files = {"a_empty": b"", "b_data": b"data" * 1000, "c_copy": b"data" * 1000}
+        write_tree(source, self.files)
+        self.packager = Packager(ARGONIZE, CONFIG)
+        self.packager.directory = source
+        self.packager.create_vpk()
+
+    def tearDown(self):
+        self.packager.close()
+        shutil.rmtree(self.directory)
+
+    def test_load(self):
+        self.packager.load()
+        for name, data in self.files.items():
+            self.assertEqual(self.packager.byte_dict["pkg"][name], data)
+
+    def test_lazy_load(self):
+        self.packager.load(lazy = True)
+        for name, data in self.files.items():
+            self.assertEqual(bytes(self.packager.byte_dict["pkg"][name]), data)
+
+    def test_read_entry(self):
+        reader = Packager(ARGONIZE, CONFIG)
+        reader.package = self.packager.package
+        for name, data in self.files.items():
+            self.assertEqual(reader.read_entry("pkg", name), data)
+
+    def test_verify(self):
+        result = self.packager.verify()
+        self.assertEqual(result["failed"], [])
+        # the empty file and the two copies of the same content
+        self.assertEqual(result["entries"], 2)
+
+
+class CountingStream(io.BytesIO):
+    """A stream counting the bytes read from it."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.count = 0
+
+    def read(self, size = -1) -> bytes:
+        data = super().read(size)
+        self.count += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        read = super().readinto(buffer)
+        self.count += read
+        return read
+
+
+class LargeDuplicateTest(unittest.TestCase):
+    """Files larger than a chunk are read once, the frames of a duplicate are cut off again."""
+
+    chunk_size = 65536
+
+    def check(self, workers: int):
+        data, other = os.urandom(3 * self.chunk_size + 100), os.urandom(2 * self.chunk_size)
+        streams = {"a": CountingStream(data), "b": CountingStream(data), "c": CountingStream(other)}
+        with tempfile.TemporaryFile() as file:
+            with ContainerWriter(file, KEY, 0, "zstd", self.chunk_size, workers) as writer:
+                for name, stream in streams.items():
+                    writer.add_stream("pkg", name, stream)
+                writer.close()
+            file.seek(0)
+            reader = ContainerReader(file, KEY, 0, "zstd")
+            self.assertEqual(reader.dead_space(), 0)
+            self.assertEqual(reader.index["pkg"]["b"]["offset"], reader.index["pkg"]["a"]["offset"])
+            self.assertEqual(reader.read("pkg", "b"), data)
+            self.assertEqual(reader.read("pkg", "c"), other)
+        for stream in streams.values():
+            self.assertEqual(stream.count, len(stream.getvalue()))
+
+    def test_serial(self):
+        self.check(1)
+
+    def test_parallel(self):
+        self.check(4)
+
+
+if __name__ == "__main__":
+    unittest.main()
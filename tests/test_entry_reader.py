@@ -0,0 +1,133 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from support import ARGONIZE, CONFIG, write_tree
+from container import EntryReader
+from packager import Packager
+
+CHUNK = CONFIG["Packager"]["chunk_size"]
+
+
+class EntryReaderTest(unittest.TestCase):
+    """Entries opened as files decode only the chunks that are read."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, "pkg")
+        # several chunks and a short last one
+        self.data = os.urandom(3 * CHUNK + 1000)
+        write_tree(source, {"large": self.data, "empty": b""})
+        packager = Packager(ARGONIZE, CONFIG)
+        packager.directory = source
+        packager.create_vpk()
+        self.packager = Packager(ARGONIZE, CONFIG)
+        self.packager.package = packager.package
+
+    def tearDown(self):
+        self.packager.close()
+        shutil.rmtree(self.directory)
+
+    def open(self) -> EntryReader:
+        file = self.packager.open_entry("pkg", "large")
+        self.addCleanup(file.close)
+        return file
+
+    def count_chunks(self, file: EntryReader) -> list:
+        decoded = []
+        read_chunk = file.reader.read_chunk
+
+        def counting(entry, offset):
+            decoded.append(offset)
+            return read_chunk(entry, offset)
+
+        file.reader.read_chunk = counting
+        return decoded
+
+    def test_read(self):
+        file = self.open()
+        self.assertTrue(file.seekable())
+        self.assertEqual(file.read(10), self.data[:10])
+        self.assertEqual(file.tell(), 10)
+        self.assertEqual(file.read(), self.data[10:])
+        self.assertEqual(file.read(), b"")
+
+    def test_seek(self):
+        file = self.open()
+        self.assertEqual(file.seek(CHUNK - 5), CHUNK - 5)
+        # a read across the end of a chunk
+        self.assertEqual(file.read(10), self.data[CHUNK - 5:CHUNK + 5])
+        self.assertEqual(file.seek(-20, os.SEEK_CUR), CHUNK - 15)
+        self.assertEqual(file.read(5), self.data[CHUNK - 15:CHUNK - 10])
+        self.assertEqual(file.seek(-100, os.SEEK_END), len(self.data) - 100)
+        self.assertEqual(file.read(), self.data[-100:])
+        # past the end there is nothing to read
+        file.seek(len(self.data) + 10)
+        self.assertEqual(file.read(10), b"")
+        with self.assertRaises(ValueError):
+            file.seek(-1)
+
+    def test_random_reads(self):
+        file = self.open()
+        rand = random.Random(7)
+        for _ in range(50):
+            start = rand.randrange(len(self.data))
+            length = rand.randrange(2 * CHUNK)
+            file.seek(start)
+            self.assertEqual(file.read(length), self.data[start:start + length])
+
+    def test_decodes_only_read_chunks(self):
+        file = self.open()
+        decoded = self.count_chunks(file)
+        file.seek(2 * CHUNK + 10)
+        file.read(100)
+        file.read(100)
+        self.assertEqual(len(decoded), 1)
+        file.seek(10)
+        file.read(100)
+        self.assertEqual(len(decoded), 2)
+
+    def test_unknown_chunk_size(self):
+        # indexes that do not record the chunk size have the chunks located on first use
+        reader = self.open().reader
+        entry = dict(reader.index["pkg"]["large"], chunk = None)
+        # the chunk size of the package is not the one the entry was written with
+        reader.chunk_size = CHUNK // 2
+        file = EntryReader(reader, entry)
+        self.assertFalse(file.located)
+        file.seek(CHUNK + 10)
+        self.assertEqual(file.read(100), self.data[CHUNK + 10:CHUNK + 110])
+        self.assertTrue(file.located)
+        self.assertEqual(file.starts, [number * CHUNK for number in range(4)])
+
+    def test_buffered(self):
+        with io.BufferedReader(self.packager.open_entry("pkg", "large")) as file:
+            file.seek(CHUNK // 2)
+            self.assertEqual(file.read(CHUNK), self.data[CHUNK // 2:CHUNK // 2 + CHUNK])
+
+    def test_empty(self):
+        with self.packager.open_entry("pkg", "empty") as file:
+            self.assertEqual(file.read(), b"")
+
+    def test_lazy_load(self):
+        self.packager.load(lazy = True)
+        with self.packager.open_entry("pkg", "large") as file:
+            file.seek(-10, os.SEEK_END)
+            self.assertEqual(file.read(), self.data[-10:])
+        # the handle of a loaded package leaves its map open
+        self.assertEqual(bytes(self.packager.byte_dict["pkg"]["large"]), self.data)
+
+    def test_closed(self):
+        file = self.packager.open_entry("pkg", "large")
+        file.close()
+        with self.assertRaises(ValueError):
+            file.read(1)
+        with self.assertRaises(ValueError):
+            file.seek(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
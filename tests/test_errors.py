@@ -0,0 +1,137 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from support import ARGONIZE, CONFIG, make_config, write_tree
+from container import V2_SIZE
+from jobs import Cancelled, Job
+from packager import HEADER_FORMAT, HEADER_SIZE, PackageError, Packager
+
+WRONG = ("w" * 64, "i" * 24)
+
+
+class ErrorTest(unittest.TestCase):
+    """Every public entry point reports a package it cannot read as a PackageError."""
+
+    config = CONFIG
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "pkg")
+        self.files = {"a": b"a" * 100000, "b": b"b" * 1000}
+        write_tree(self.source, self.files)
+        packager = Packager(ARGONIZE, self.config)
+        packager.directory = self.source
+        packager.create_vpk()
+        self.package = packager.package
+        self.wrong = Packager(WRONG, self.config)
+        self.wrong.package = self.package
+
+    def tearDown(self):
+        self.wrong.close()
+        shutil.rmtree(self.directory)
+
+    def assertWrongKey(self, call, *args, **kwargs):
+        with self.assertRaises(PackageError) as context:
+            call(*args, **kwargs)
+        self.assertEqual(context.exception.title, "Argon Crypto | Error")
+
+    def test_load(self):
+        self.assertWrongKey(self.wrong.load)
+        self.assertWrongKey(self.wrong.load, lazy = True)
+
+    def test_index(self):
+        self.assertWrongKey(self.wrong.open_index)
+        self.assertWrongKey(self.wrong.list_entries)
+        self.assertWrongKey(self.wrong.read_entry, "pkg", "a")
+
+    def test_verify(self):
+        self.assertWrongKey(self.wrong.verify)
+
+    def test_extract(self):
+        self.assertWrongKey(self.wrong.extract, os.path.join(self.directory, "out"))
+        self.assertWrongKey(self.wrong.open_entry, "pkg", "a")
+
+    def test_unsupported_version(self):
+        with open(self.package, "r+b") as file:
+            header = list(struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE)))
+            header[8] = 9
+            file.seek(0)
+            file.write(struct.pack(HEADER_FORMAT, *header))
+        packager = Packager(ARGONIZE, self.config)
+        packager.package = self.package
+        for call in (packager.load, packager.open_index, packager.verify):
+            with self.assertRaises(PackageError) as context:
+                call()
+            self.assertIn("version 9", str(context.exception))
+
+    def test_truncated_preamble(self):
+        with open(self.package, "r+b") as file:
+            file.seek(HEADER_SIZE + 4)
+            file.write(struct.pack("<H", V2_SIZE))
+        packager = Packager(ARGONIZE, self.config)
+        packager.package = self.package
+        for call in (packager.load, packager.open_index, packager.verify):
+            with self.assertRaises(PackageError):
+                call()
+
+
+class VolumeErrorTest(ErrorTest):
+    """The same for a package split into a volume set."""
+
+    config = make_config(Packager = {"volume_size": 50000})
+
+    def test_split(self):
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "pkg.001.vpk")))
+
+
+class JobTest(unittest.TestCase):
+    """Jobs hand the errors of the packager back to whoever collects their result."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "pkg")
+        write_tree(self.source, {f"file{number}": os.urandom(20000) for number in range(10)})
+        self.packager = Packager(ARGONIZE, CONFIG)
+        self.packager.directory = self.source
+
+    def tearDown(self):
+        self.packager.close()
+        shutil.rmtree(self.directory)
+
+    def test_result(self):
+        snapshots = []
+        stats = self.packager.submit("create_vpk", callback = snapshots.append).result(timeout = 60)
+        self.assertEqual(stats["files"], 10)
+        self.assertEqual(snapshots[-1]["files_done"], 10)
+
+    def test_error(self):
+        self.packager.create_vpk()
+        wrong = Packager(WRONG, CONFIG)
+        wrong.package = self.packager.package
+        with self.assertRaises(PackageError):
+            wrong.submit("load").result(timeout = 60)
+
+    def test_cancel_keeps_package(self):
+        self.packager.create_vpk()
+        with open(self.packager.package, "rb") as file:
+            before = file.read()
+        write_tree(self.source, {"new": b"new" * 1000})
+
+        def cancel(snapshot: dict):
+            if snapshot["files_done"] >= 3:
+                job.cancel()
+
+        job = Job(self.packager.create_vpk, callback = cancel)
+        job.start()
+        with self.assertRaises(Cancelled):
+            job.result(timeout = 60)
+        with open(self.packager.package, "rb") as file:
+            self.assertEqual(file.read(), before)
+        self.assertFalse(os.path.exists(f"{self.packager.package}.tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
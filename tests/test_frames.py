@@ -0,0 +1,58 @@
+import os
+import unittest
+
+from support import KEY
+import argoncrypto as ac
+from Cryptodome.Cipher import AES
+
+
+class FrameTest(unittest.TestCase):
+    """Binary frames of nonce, tag and ciphertext, for every AES mode."""
+
+    def test_round_trip(self):
+        for mode in (0, 1, 2):
+            for size in (0, 1, 15, 16, 17, 4096):
+                data = os.urandom(size)
+                frame = ac.encrypt_bytes(KEY, data, mode)
+                self.assertEqual(len(frame), ac.frame_size(size, mode))
+                self.assertTrue(ac.verify_frame(KEY, frame, mode))
+                self.assertEqual(ac.decrypt_bytes(KEY, frame, mode), data)
+
+    def test_tampered(self):
+        for mode in (0, 1, 2):
+            frame = ac.encrypt_bytes(KEY, b"data" * 100, mode)
+            for position in (0, ac.NONCE_SIZE, ac.FRAME_OVERHEAD, len(frame) - 1):
+                tampered = bytearray(frame)
+                tampered[position] ^= 1
+                self.assertFalse(ac.verify_frame(KEY, tampered, mode))
+                out = bytearray(len(frame))
+                with self.assertRaises(ValueError):
+                    ac.decrypt_into(KEY, tampered, out, mode)
+                # nothing of the plaintext is left behind
+                self.assertEqual(out, bytearray(len(frame)))
+
+    def test_wrong_key(self):
+        for mode in (0, 1, 2):
+            frame = ac.encrypt_bytes(KEY, b"data", mode)
+            with self.assertRaises(ValueError):
+                ac.decrypt_bytes(bytes(32), frame, mode)
+
+    def test_subkeys(self):
+        # the cipher of AES-CTR frames is not keyed with the key itself
+        data = b"data" * 8
+        frame = ac.encrypt_bytes(KEY, data, 1)
+        cipher = AES.new(KEY, AES.MODE_CTR, nonce = b'', initial_value = bytes(frame[:ac.NONCE_SIZE]))
+        self.assertNotEqual(cipher.decrypt(bytes(frame[ac.FRAME_OVERHEAD:])), data)
+        cipher_key, mac_key = ac._subkeys(KEY)
+        self.assertNotEqual(cipher_key, mac_key)
+        self.assertNotIn(KEY, (cipher_key, mac_key))
+
+    def test_short_buffers(self):
+        with self.assertRaises(ValueError):
+            ac.encrypt_into(KEY, b"data", bytearray(4), 0)
+        with self.assertRaises(ValueError):
+            ac.decrypt_bytes(KEY, b"short", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import ARGONIZE
+import argoncrypto as ac
+
+
+class KeyCacheTest(unittest.TestCase):
+    """Keys are derived once per process and parameters, also when many threads ask at once."""
+
+    def setUp(self):
+        ac.clear_key_cache()
+        self.calls = 0
+        derive = ac.argon2.low_level.hash_secret_raw
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            # long enough for every thread to ask before the first derivation is done
+            time.sleep(0.1)
+            return derive(*args, **kwargs)
+
+        patcher = mock.patch.object(ac.argon2.low_level, "hash_secret_raw", counted)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ac.clear_key_cache)
+
+    def derive(self, memory_cost: int = 8) -> bytes:
+        return ac.generate_argon_key(*ARGONIZE, 32, 1, memory_cost, 1)
+
+    def test_cached(self):
+        key = self.derive()
+        self.assertEqual(self.derive(), key)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(ac.generate_argon_key(*ARGONIZE, 32, 1, 8, 1, cache = False), key)
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent(self):
+        keys = []
+        threads = [threading.Thread(target = lambda: keys.append(self.derive())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(ac._key_locks, {})
+
+    def test_evicted(self):
+        for memory_cost in range(8, 8 + ac.KEY_CACHE_SIZE + 1):
+            self.derive(memory_cost)
+        self.derive(8 + ac.KEY_CACHE_SIZE)
+        self.assertEqual(self.calls, ac.KEY_CACHE_SIZE + 1)
+        # the least recently used key was dropped
+        self.derive(8)
+        self.assertEqual(self.calls, ac.KEY_CACHE_SIZE + 2)
+
+    def test_clear(self):
+        self.derive()
+        ac.clear_key_cache()
+        self.derive()
+        self.assertEqual(self.calls, 2)
+
+
+class CalibrationTest(unittest.TestCase):
+
+    def test_calibrate(self):
+        result = ac.calibrate_argon(target = 0.01, parallelism = 1, max_memory_cost = 200)
+        self.assertGreaterEqual(result["time_cost"], 1)
+        self.assertLessEqual(result["memory_cost"], 200)
+
+    def test_cancel(self):
+        def check():
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            ac.calibrate_argon(check = check)
+
+
+if __name__ == "__main__":
+    unittest.main()
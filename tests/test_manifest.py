@@ -0,0 +1,84 @@
+import os
+import pickle
+import unittest
+from unittest import mock
+
+import support  # noqa: F401
+import manifest
+from manifest import Manifest, editable, load_index, pack_manifest
+
+
+def make_entry(offset: int, size: int, **fields) -> dict:
+    entry = {"offset": offset, "length": size + 36, "size": size, "codec": "zstd", "frames": [size + 36], "tags": os.urandom(16)}
+    entry.update(fields)
+    return entry
+
+
+class ManifestTest(unittest.TestCase):
+    """The binary index round-trips, looks files up by path and rejects anything else."""
+
+    def setUp(self):
+        shared = make_entry(100, 10, hash = os.urandom(32))
+        self.index = {
+            "pkg": {"a": make_entry(0, 0), "b": shared, "c": shared},
+            "pkg/sub": {"d": make_entry(200, 70000, frames = [65572, 4500], tags = os.urandom(32), chunk = 65536, dictionary = True, mime = "text/plain")},
+            "pkg/empty": {},
+        }
+
+    def test_round_trip(self):
+        index = load_index(pack_manifest(self.index))
+        self.assertEqual(list(index), ["pkg", "pkg/sub", "pkg/empty"])
+        self.assertEqual(editable(index), self.index)
+        self.assertEqual(list(index["pkg"]), ["a", "b", "c"])
+        self.assertEqual(len(index["pkg/empty"]), 0)
+
+    def test_shared_record(self):
+        index = load_index(pack_manifest(self.index))
+        self.assertIs(index["pkg"]["b"], index["pkg"]["c"])
+        self.assertEqual(index.record_count, 3)
+
+    def test_missing(self):
+        index = load_index(pack_manifest(self.index))
+        with self.assertRaises(KeyError):
+            index["pkg"]["d"]
+        with self.assertRaises(KeyError):
+            index["pkg/empty"]["a"]
+        with self.assertRaises(KeyError):
+            index["other"]
+        self.assertNotIn("other", index)
+
+    def test_collisions(self):
+        # every path in the same slot, lookups probe past the other entries
+        with mock.patch.object(manifest, "path_hash", lambda folder, name: 0):
+            index = load_index(pack_manifest(self.index))
+            for folder, file_dict in self.index.items():
+                for filename, entry in file_dict.items():
+                    self.assertEqual(index[folder][filename], entry)
+            with self.assertRaises(KeyError):
+                index["pkg"]["missing"]
+
+    def test_many(self):
+        index = {f"folder{folder}": {f"file{number}": make_entry(number, number) for number in range(100)} for folder in range(20)}
+        loaded = load_index(pack_manifest(index))
+        self.assertEqual(loaded.slot_count, 4096)
+        self.assertEqual(loaded["folder7"]["file42"], index["folder7"]["file42"])
+
+    def test_editable(self):
+        copy = editable(load_index(pack_manifest(self.index)))
+        copy["pkg"].pop("a")
+        self.assertEqual(list(copy["pkg"]), ["b", "c"])
+
+    def test_rejected(self):
+        for data in (pickle.dumps(self.index), b"", b"VIDX", pack_manifest(self.index)[:-1]):
+            with self.assertRaises(RuntimeError):
+                load_index(data)
+
+    def test_layout(self):
+        data = bytearray(pack_manifest(self.index))
+        data[4] = 2
+        with self.assertRaises(RuntimeError):
+            Manifest(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ARGONIZE, CONFIG, write_tree
+from container import LazyEntry, MappedReader
+from packager import HEADER_SIZE, PackageError, Packager
+
+
+class MappedTest(unittest.TestCase):
+    """Packages loaded lazily are decoded from a memory map, a file at a time."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, "pkg")
+        # 'large' spans several chunks of 64 KB
+        self.files = {"large": os.urandom(200000), "small": b"small" * 100, "sub/text": b"text" * 1000}
+        write_tree(source, self.files)
+        self.packager = Packager(ARGONIZE, CONFIG)
+        self.packager.directory = source
+        self.packager.create_vpk()
+
+    def tearDown(self):
+        self.packager.close()
+        shutil.rmtree(self.directory)
+
+    def corrupt(self, name: str):
+        """Flip a byte of the ciphertext of the first frame of a file."""
+        folder, _, filename = f"pkg/{name}".rpartition("/")
+        entry = self.packager.index[folder][filename]
+        with open(self.packager.package, "r+b") as file:
+            file.seek(entry["offset"] + 64)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(bytes([byte[0] ^ 1]))
+
+    def test_lazy_load(self):
+        self.packager.load(lazy = True)
+        large = self.packager.byte_dict["pkg"]["large"]
+        self.assertIsInstance(large, LazyEntry)
+        self.assertEqual(len(large), len(self.files["large"]))
+        self.assertEqual(large.head(), self.files["large"][:65536])
+        self.assertEqual(bytes(large), self.files["large"])
+        self.assertEqual(bytes(self.packager.byte_dict["pkg/sub"]["text"]), self.files["sub/text"])
+
+    def test_close_with_live_view(self):
+        reader = MappedReader(self.packager.package, HEADER_SIZE, self.packager.get_key, 0, "zstd")
+        frames = reader.read_frames(reader.index["pkg"]["small"])
+        reader.close()
+        self.assertIsNone(reader.map)
+        self.assertTrue(reader.handle.closed)
+        frames.release()
+
+    def test_corrupted_lazy_read(self):
+        self.corrupt("large")
+        self.packager.load(lazy = True)
+        with self.assertRaises(ValueError):
+            bytes(self.packager.byte_dict["pkg"]["large"])
+        self.assertEqual(bytes(self.packager.byte_dict["pkg"]["small"]), self.files["small"])
+        self.packager.close()
+
+    def test_corrupted_extract(self):
+        self.corrupt("large")
+        reader = Packager(ARGONIZE, CONFIG)
+        reader.package = self.packager.package
+        with self.assertRaises(PackageError):
+            reader.extract(os.path.join(self.directory, "out"))
+
+    def test_corrupted_open_entry(self):
+        self.corrupt("large")
+        reader = Packager(ARGONIZE, CONFIG)
+        reader.package = self.packager.package
+        with self.assertRaises(ValueError):
+            with reader.open_entry("pkg", "large") as file:
+                file.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
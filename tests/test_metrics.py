@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from support import ARGONIZE, make_config, write_tree
+from metrics import Metrics, capture
+from packager import Packager
+
+
+class MetricsTest(unittest.TestCase):
+    """Every stage sample is one measured call, with the bytes it handled."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "pkg")
+        self.files = {"a": b"a" * 100000, "b/c": b"c" * 1000, "d": b""}
+        write_tree(self.source, self.files)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_version_1(self):
+        config = make_config(Packager = {"version": 1})
+        packager = Packager(ARGONIZE, config)
+        packager.directory = self.source
+        packager.create_vpk()
+        read = packager.metrics.to_dict()["stages"]["read"]
+        self.assertEqual(read["calls"], len(self.files))
+        self.assertEqual(read["bytes"], sum(map(len, self.files.values())))
+
+        loader = Packager(ARGONIZE, config)
+        loader.package = packager.package
+        loader.load()
+        inflate = loader.metrics.to_dict()["stages"]["inflate"]
+        self.assertEqual(inflate["calls"], 1)
+        self.assertGreater(inflate["bytes"], 0)
+        self.assertEqual(loader.byte_dict["pkg"]["a"], self.files["a"])
+
+
+class CaptureTest(unittest.TestCase):
+    """Memory captures that overlap share the tracing of the process."""
+
+    def test_overlap(self):
+        first, second = Metrics(), Metrics()
+        with capture(first, memory = True):
+            with capture(second, memory = True):
+                data = bytearray(1024 * 1024)
+            # the inner capture ends while the outer one still traces
+            self.assertTrue(tracemalloc.is_tracing())
+            del data
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(second.profile["peak_bytes"], 1024 * 1024)
+        self.assertGreaterEqual(first.profile["peak_bytes"], second.profile["peak_bytes"])
+
+    def test_traced_already(self):
+        tracemalloc.start()
+        try:
+            with capture(Metrics(), memory = True):
+                pass
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import support
+import utils
+
+
+class TypeWorkerTest(unittest.TestCase):
+    """The background worker of the type detection is only started when it is needed."""
+
+    def test_import(self):
+        source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(support.__file__))), "src")
+        code = f"import sys, threading; sys.path.insert(0, {source!r}); import utils; print(utils._type_worker, threading.active_count())"
+        output = subprocess.check_output([sys.executable, "-c", code], text = True)
+        self.assertEqual(output.split(), ["None", "1"])
+
+    def test_detect(self):
+        results = []
+
+        def unreadable():
+            raise OSError("gone")
+
+        # files that cannot be read are left out, libmagic is never loaded for them
+        utils.detect_file_types([("a", unreadable)], results.append).result(timeout = 10)
+        self.assertEqual(results, [{}])
+        self.assertIsNotNone(utils._type_worker)
+        self.assertIs(utils.get_type_worker(), utils._type_worker)
+
+
+if __name__ == "__main__":
+    unittest.main()
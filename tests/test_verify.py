@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ARGONIZE, CONFIG, make_config, write_tree
+from container import EntryError
+from packager import PackageError, Packager
+
+
+class VerifyTest(unittest.TestCase):
+    """Tags are checked without decoding, a damaged frame is reported with the file it belongs to."""
+
+    config = CONFIG
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, "pkg")
+        self.files = {"large": os.urandom(200000), "small": b"small" * 100, "copy": b"small" * 100}
+        write_tree(source, self.files)
+        self.packager = Packager(ARGONIZE, self.config)
+        self.packager.directory = source
+        self.packager.create_vpk()
+        self.reader = Packager(ARGONIZE, self.config)
+        self.reader.package = self.packager.package
+
+    def tearDown(self):
+        self.packager.close()
+        self.reader.close()
+        shutil.rmtree(self.directory)
+
+    def corrupt(self, filename: str):
+        """Flip a byte of the ciphertext of the first frame of a file, in the package or the volume holding it."""
+        path = self.packager.package
+        if self.packager.table is not None:
+            volume = self.packager.table["volumes"][self.packager.table["folders"]["pkg"][filename]]
+            path = os.path.join(self.directory, volume["name"])
+        with open(path, "r+b") as file:
+            file.seek(self.packager.index["pkg"][filename]["offset"] + 64)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(bytes([byte[0] ^ 1]))
+
+    def assertDamaged(self, call, *args, **kwargs):
+        with self.assertRaises(PackageError) as context:
+            call(*args, **kwargs)
+        self.assertEqual(context.exception.title, "VPK Package | Error")
+        self.assertIn("pkg/large", str(context.exception))
+
+    def test_intact(self):
+        result = self.reader.verify(workers = 2)
+        self.assertEqual(result["failed"], [])
+        # four chunks of 'large' and one of 'small', the copy shares its frames
+        self.assertEqual(result["entries"], 2)
+        self.assertEqual(result["frames"], 5)
+
+    def test_damaged_frame(self):
+        self.corrupt("large")
+        result = self.reader.verify(workers = 2)
+        self.assertEqual(result["failed"], [("pkg", "large", 0, "authentication failed")])
+
+    def test_damaged_load(self):
+        self.corrupt("large")
+        self.assertDamaged(self.reader.load)
+
+    def test_damaged_extract(self):
+        self.corrupt("large")
+        self.assertDamaged(self.reader.extract, os.path.join(self.directory, "out"))
+
+    def test_damaged_read(self):
+        self.corrupt("large")
+        self.assertDamaged(self.reader.read_entry, "pkg", "large")
+        self.assertEqual(self.reader.read_entry("pkg", "small"), self.files["small"])
+
+
+class VolumeVerifyTest(VerifyTest):
+    """The same for a volume set, decoded by worker processes on a full load."""
+
+    config = make_config(Packager = {"volume_size": 100000, "volume_workers": 2})
+
+    def test_intact(self):
+        result = self.reader.verify(workers = 2)
+        self.assertEqual(result["failed"], [])
+        # every file has a volume of its own, duplicates are only shared within a volume
+        self.assertEqual(result["entries"], 3)
+        self.assertEqual(result["frames"], 6)
+
+
+class EntryErrorTest(unittest.TestCase):
+
+    def test_pickle(self):
+        import pickle
+        error = pickle.loads(pickle.dumps(EntryError("pkg", "large", "MAC check failed")))
+        self.assertEqual((error.folder, error.filename, str(error)), ("pkg", "large", "pkg/large: MAC check failed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ARGONIZE, make_config, write_tree
+from packager import PackageError, Packager
+from volumes import split_volumes, volume_path
+
+CONFIG = make_config(Packager = {"volume_size": 50000})
+
+
+class SplitTest(unittest.TestCase):
+    """Files are grouped into volumes in order, and never split."""
+
+    def test_split(self):
+        self.assertEqual(split_volumes([10, 10, 10], 25), [[0, 1], [2]])
+        self.assertEqual(split_volumes([10, 15, 10], 25), [[0, 1], [2]])
+
+    def test_large_file(self):
+        # a file larger than the volume size gets a volume of its own
+        self.assertEqual(split_volumes([5, 100, 5], 50), [[0], [1], [2]])
+
+    def test_empty(self):
+        self.assertEqual(split_volumes([], 50), [[]])
+        self.assertEqual(split_volumes([0, 0], 50), [[0, 1]])
+
+    def test_path(self):
+        self.assertEqual(volume_path("dir/pkg.vpk", 1), "dir/pkg.001.vpk")
+        self.assertEqual(volume_path("dir/pkg", 12), "dir/pkg.012.vpk")
+
+
+class VolumeSetTest(unittest.TestCase):
+    """A package split into volumes reads back like a single one."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "pkg")
+        self.files = {f"sub/{number}": os.urandom(30000) for number in range(5)}
+        self.files["large"] = os.urandom(120000)
+        self.files["empty"] = b""
+        write_tree(self.source, self.files)
+        packager = Packager(ARGONIZE, CONFIG)
+        packager.directory = self.source
+        packager.create_vpk()
+        self.package = packager.package
+        self.packager = Packager(ARGONIZE, CONFIG)
+        self.packager.package = self.package
+
+    def tearDown(self):
+        self.packager.close()
+        shutil.rmtree(self.directory)
+
+    def expected(self) -> dict:
+        result = {}
+        for name, data in self.files.items():
+            folder, _, filename = f"pkg/{name}".rpartition("/")
+            result.setdefault(folder, {})[filename] = data
+        return result
+
+    def loaded(self) -> dict:
+        return {folder: {filename: bytes(data) for filename, data in file_dict.items()} for folder, file_dict in self.packager.byte_dict.items()}
+
+    def test_volumes(self):
+        self.packager.open_index()
+        volumes = self.packager.table["volumes"]
+        self.assertGreater(len(volumes), 3)
+        for number, volume in enumerate(volumes):
+            self.assertEqual(volume["name"], os.path.basename(volume_path(self.package, number + 1)))
+            self.assertTrue(os.path.exists(os.path.join(self.directory, volume["name"])))
+        # the large file is never split, nor shares its volume
+        large = self.packager.table["folders"]["pkg"]["large"]
+        self.assertEqual(volumes[large]["files"], 1)
+
+    def test_load(self):
+        self.packager.load()
+        self.assertEqual(self.loaded(), self.expected())
+
+    def test_lazy_load(self):
+        self.packager.load(lazy = True)
+        self.assertEqual(self.loaded(), self.expected())
+
+    def test_index(self):
+        index = self.packager.open_index()
+        self.assertEqual({folder: set(file_dict) for folder, file_dict in index.items()}, {folder: set(file_dict) for folder, file_dict in self.expected().items()})
+        self.assertEqual(self.packager.read_entry("pkg", "large"), self.files["large"])
+        self.assertEqual(self.packager.read_entry("pkg/sub", "4"), self.files["sub/4"])
+
+    def test_extract(self):
+        target = os.path.join(self.directory, "out")
+        self.assertEqual(self.packager.extract(target, verify = True), len(self.files))
+        for name, data in self.files.items():
+            with open(os.path.join(target, "pkg", *name.split("/")), "rb") as file:
+                self.assertEqual(file.read(), data)
+
+    def test_append(self):
+        self.packager.load(lazy = True)
+        count = len(self.packager.table["volumes"])
+        self.packager.stage("pkg", "new", b"new" * 1000)
+        self.packager.remove("pkg/sub", "0")
+        self.packager.save()
+        self.assertEqual(len(self.packager.table["volumes"]), count + 1)
+        self.assertTrue(os.path.exists(volume_path(self.package, count + 1)))
+        self.packager.load()
+        self.assertEqual(self.packager.byte_dict["pkg"]["new"], b"new" * 1000)
+        self.assertNotIn("0", self.packager.byte_dict["pkg/sub"])
+        self.assertEqual(self.packager.byte_dict["pkg"]["large"], self.files["large"])
+
+    def test_missing_volume(self):
+        os.remove(volume_path(self.package, 2))
+        for call in (self.packager.load, self.packager.open_index, self.packager.verify):
+            with self.assertRaises(PackageError) as context:
+                call()
+            self.assertIn("pkg.002.vpk", str(context.exception))
+
+    def test_replaced_volume(self):
+        # a volume of another set with the same key does not match the table
+        shutil.copy(volume_path(self.package, 1), volume_path(self.package, 2))
+        result = self.packager.verify()
+        self.assertEqual([failure[0] for failure in result["failed"]], ["pkg.002.vpk"])
+
+
+if __name__ == "__main__":
+    unittest.main()